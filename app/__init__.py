@@ -6,11 +6,10 @@ import os
 
 from flask import Flask
 from flask_login import LoginManager
-from sqlalchemy.sql import select
-from sqlalchemy.sql.expression import bindparam
 
-from app.models.db import connect_as, Role
-from app.models.db import user_table
+from app.models.db import init_app as init_db_app
+from app.utils.sessions import init_app as init_sessions_app
+from app.models.query import select_user
 from app.utils.utils import shorten_text
 
 
@@ -46,6 +45,14 @@ def create_app(test_config=None):
     app.jinja_env.globals.update(shorten_text=shorten_text)     # funzione per troncare testo troppo lungo
 
 
+    # connessioni al database condivise per richiesta, rilasciate nel teardown
+    init_db_app(app)
+
+
+    # sessioni lato server (il cookie contiene solo l'id della sessione)
+    init_sessions_app(app)
+
+
     # configurazione Flask-Login
     login_manager = LoginManager()
     login_manager.login_view = 'auth.login'                 # imposta pagina di login
@@ -59,6 +66,9 @@ def create_app(test_config=None):
     def load_user(username):                                # user_loader callback per Flask-Login
         """Funzione usata come callback da Flask-Login per la fase di autenticazione
 
+        Le informazioni sull'utente sono lette da una cache con TTL,
+        per evitare una query sul database ad ogni richiesta autenticata.
+
         Args:
             username (str): l'username dell'utente
 
@@ -68,25 +78,13 @@ def create_app(test_config=None):
                 altrimenti None
         """
 
-        with connect_as(Role.CLIENT) as conn:                       # connessione al database come client
-            # seleziona le informazioni sull'utente con username dato, dal database
-            sel_stmt = select([
-                user_table.c.username,
-                user_table.c.email,
-                user_table.c.name,
-                user_table.c.surname,
-                user_table.c.isOperator
-            ]).where(
-                user_table.c.username == bindparam('username')      # campo username uguale all'username dato
-            )
-            result_set = conn.execute(sel_stmt, username=username)  # esegue statement
-            user = result_set.first()                               # al più un utente (username è PK)
-
-        return User(user.username,                                  # crea e restituisce Flask-Login User
-                    user.email,
-                    user.name,
-                    user.surname,
-                    user.isOperator) if user else None              # se non è presente restituisce None
+        user = select_user(username)                                # identità dell'utente (cache o database)
+
+        return User(user['username'],                               # crea e restituisce Flask-Login User
+                    user['email'],
+                    user['name'],
+                    user['surname'],
+                    user['isOperator']) if user else None           # se non è presente restituisce None
 
 
     # importa i moduli contenenti le views
@@ -102,5 +100,11 @@ def create_app(test_config=None):
     from .views import reserved_area
     app.register_blueprint(reserved_area.bp)                # registra reserved_area blueprint
 
+    from .views import posters
+    app.register_blueprint(posters.bp)                      # registra posters blueprint
+    app.jinja_env.globals.update(poster_url=posters.poster_url)         # url delle varianti dei poster
+    app.jinja_env.globals.update(poster_srcset=posters.poster_srcset)
+    app.jinja_env.globals.update(posters_enabled=posters.posters_enabled)
+
 
     return app                                              # Flask app
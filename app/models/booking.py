@@ -0,0 +1,348 @@
+"""
+Modulo contenente le modalità di acquisto, la politica di retry degli acquisti, le metriche
+di contesa per proiezione e la coda (opzionale) che serializza gli acquisti di una stessa proiezione.
+Solo i fallimenti di serializzazione e i deadlock (SQLSTATE 40001/40P01) vengono ritentati,
+con backoff esponenziale limitato e jitter, entro una scadenza complessiva.
+"""
+
+import os
+import random
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from sqlalchemy.sql import select
+from sqlalchemy.sql.expression import bindparam, func
+from sqlalchemy.exc import DBAPIError
+
+from app.models.db import connect_as, Role
+
+
+# configurazione dei tentativi di acquisto
+PURCHASE_RETRY_BASE = float(os.getenv("PURCHASE_RETRY_BASE", 0.02))         # attesa base in secondi
+PURCHASE_RETRY_CAP = float(os.getenv("PURCHASE_RETRY_CAP", 0.5))            # attesa massima tra due tentativi
+PURCHASE_RETRY_DEADLINE = float(os.getenv("PURCHASE_RETRY_DEADLINE", 3))    # tempo massimo per l'acquisto
+CONTENTION_STATS_SIZE = int(os.getenv("CONTENTION_STATS_SIZE", 1024))       # proiezioni monitorate
+BOOKING_QUEUE_SIZE = int(os.getenv("BOOKING_QUEUE_SIZE", 100))              # acquisti in attesa per proiezione
+
+# modalità di acquisto (configurazione PURCHASE_MODE)
+PURCHASE_MODES = (
+    'read_committed',       # READ COMMITTED, doppia vendita impedita dal vincolo ticket_seat_unique
+    'serializable',         # SERIALIZABLE, i conflitti sono ritentati con backoff
+    'advisory_lock'         # READ COMMITTED con advisory lock (di transazione) sulla proiezione
+)
+
+RETRYABLE_SQLSTATES = {
+    '40001',        # serialization_failure
+    '40P01'         # deadlock_detected
+}
+
+
+def is_retryable(error):
+    """Verifica se un'eccezione del database indica un conflitto tra transazioni da ritentare
+
+    Args:
+        error (Exception): eccezione sollevata durante la transazione
+
+    Returns:
+        bool: True per fallimenti di serializzazione e deadlock
+    """
+
+    if not isinstance(error, DBAPIError):
+        return False
+    return getattr(error.orig, 'pgcode', None) in RETRYABLE_SQLSTATES     # SQLSTATE di psycopg2
+
+
+def backoff_delay(attempt, base=PURCHASE_RETRY_BASE, cap=PURCHASE_RETRY_CAP, rand=random.random):
+    """Restituisce l'attesa prima del tentativo successivo (backoff esponenziale con full jitter)
+
+    Args:
+        attempt (int): numero del tentativo fallito (a partire da 0)
+        base (float): attesa base in secondi
+        cap (float): attesa massima in secondi
+        rand: funzione che restituisce un numero casuale in [0, 1) (default: random.random)
+
+    Returns:
+        float: secondi da attendere, in [0, min(cap, base * 2^attempt))
+    """
+
+    return rand() * min(cap, base * 2 ** attempt)
+
+
+def connect_for_purchase(mode):
+    """Restituisce la connessione (come client) con cui eseguire un acquisto nella modalità data
+
+    In modalità 'serializable' la connessione è dedicata (non condivisa con la richiesta),
+    così che il livello di isolamento non influenzi le altre query della richiesta.
+
+    Args:
+        mode (str): modalità di acquisto, una di PURCHASE_MODES
+
+    Returns:
+        conn: connessione al database
+
+    Raises:
+        ValueError: se la modalità non è valida
+    """
+
+    if mode not in PURCHASE_MODES:
+        raise ValueError(f'Invalid purchase mode: {mode}')
+
+    if mode == 'serializable':
+        return connect_as(Role.CLIENT, request_scoped=False).execution_options(isolation_level='SERIALIZABLE')
+    return connect_as(Role.CLIENT)
+
+
+def lock_projection(conn, proj_id):
+    """Acquisisce l'advisory lock della proiezione, rilasciato al termine della transazione
+
+    Gli acquisti di una stessa proiezione sono così eseguiti uno alla volta, mentre
+    quelli di proiezioni diverse non si bloccano a vicenda.
+
+    Args:
+        conn: connessione al database, con una transazione in corso
+        proj_id (int): id della proiezione
+    """
+
+    conn.execute(select([func.pg_advisory_xact_lock(bindparam('proj_id'))]), proj_id=proj_id)
+
+
+class ContentionStats:
+    """Metriche di contesa degli acquisti, per proiezione
+
+    Per ogni proiezione conta i tentativi di transazione, gli abort (ritentabili e
+    definitivi), gli acquisti completati, il tempo speso ad attendere tra un
+    tentativo e l'altro e il tempo totale degli acquisti. Sono mantenute al più
+    'maxsize' proiezioni (LRU); gli stessi contatori sono aggregati anche per
+    modalità di acquisto, per confrontarle.
+    """
+
+    FIELDS = ('attempts', 'retryable_aborts', 'aborts', 'purchases', 'retry_time', 'purchase_time')
+
+    def __init__(self, maxsize=CONTENTION_STATS_SIZE):
+        """
+        Args:
+            maxsize (int): numero massimo di proiezioni monitorate
+        """
+
+        self.maxsize = maxsize
+        self._stats = OrderedDict()         # proj_id -> dict con i contatori
+        self._modes = {}                    # modalità di acquisto -> dict con i contatori
+        self._lock = threading.Lock()
+
+    def _entry(self, proj_id):
+        """Restituisce i contatori della proiezione (da chiamare con il lock acquisito)"""
+
+        entry = self._stats.get(proj_id)
+        if entry is None:
+            entry = self._stats[proj_id] = dict.fromkeys(self.FIELDS, 0)
+            while len(self._stats) > self.maxsize:      # elimina le proiezioni meno recenti
+                self._stats.popitem(last=False)
+        else:
+            self._stats.move_to_end(proj_id)
+        return entry
+
+    def record(self, proj_id, mode=None, **counters):
+        """Incrementa i contatori della proiezione (e della modalità di acquisto)
+
+        Args:
+            proj_id (int): id della proiezione
+            mode (str): modalità di acquisto (default: None, non aggregata)
+            **counters: incrementi, esempio: attempts=1, retry_time=0.05
+        """
+
+        with self._lock:
+            entries = [ self._entry(proj_id) ]
+            if mode is not None:
+                entries.append(self._modes.setdefault(mode, dict.fromkeys(self.FIELDS, 0)))
+            for entry in entries:
+                for name, value in counters.items():
+                    entry[name] += value
+
+    def get(self, proj_id):
+        """Restituisce una copia dei contatori della proiezione (tutti a 0 se mai vista)"""
+
+        with self._lock:
+            entry = self._stats.get(proj_id)
+            return dict(entry) if entry is not None else dict.fromkeys(self.FIELDS, 0)
+
+    def stats(self, top=10):
+        """Restituisce i totali e le proiezioni più contese
+
+        Args:
+            top (int): numero di proiezioni da riportare, ordinate per abort ritentabili
+
+        Returns:
+            dict: totali e dettaglio delle proiezioni più contese
+        """
+
+        with self._lock:
+            totals = dict.fromkeys(self.FIELDS, 0)
+            for entry in self._stats.values():
+                for name in self.FIELDS:
+                    totals[name] += entry[name]
+            hottest = sorted(
+                self._stats.items(),
+                key=lambda item: (item[1]['retryable_aborts'], item[1]['retry_time']),
+                reverse=True
+            )[:top]
+
+            return {
+                'totals': totals,
+                'modes': { mode: dict(entry) for mode, entry in self._modes.items() },
+                'projections': { proj_id: dict(entry) for proj_id, entry in hottest }
+            }
+
+    def clear(self):
+        """Azzera le metriche"""
+
+        with self._lock:
+            self._stats.clear()
+            self._modes.clear()
+
+
+contention = ContentionStats()      # metriche di contesa condivise dal processo
+
+
+class BookingRejected(Exception):
+    """Acquisto rifiutato dalla coda (coda piena oppure attesa scaduta prima dell'esecuzione)"""
+
+
+class BookingExecutor:
+    """Esecutore che serializza i task con la stessa chiave (id della proiezione)
+
+    Ogni chiave ha una coda FIFO servita da un solo worker thread, avviato al primo
+    task e terminato quando la coda si svuota: i task di una stessa proiezione sono
+    eseguiti uno alla volta, quelli di proiezioni diverse in parallelo. I risultati
+    sono restituiti tramite concurrent.futures.Future.
+    """
+
+    def __init__(self, maxsize=BOOKING_QUEUE_SIZE):
+        """
+        Args:
+            maxsize (int): numero massimo di task in attesa per chiave
+        """
+
+        self.maxsize = maxsize
+        self._queues = {}           # chiave -> deque di (future, fn, args, kwargs) in attesa
+        self._lock = threading.Lock()
+        self.completed = 0          # task eseguiti
+        self.rejected = 0           # task rifiutati per coda piena
+        self.timeouts = 0           # task annullati perché l'attesa è scaduta
+
+    def submit(self, key, fn, *args, **kwargs):
+        """Accoda l'esecuzione di fn(*args, **kwargs) nella coda di 'key'
+
+        Args:
+            key: chiave della coda (esempio: id della proiezione)
+            fn: funzione da eseguire
+
+        Returns:
+            Future: risultato (o eccezione) di fn
+
+        Raises:
+            BookingRejected: se la coda di 'key' è piena
+        """
+
+        future = Future()
+        with self._lock:
+            queue = self._queues.get(key)
+            if len(queue or ()) >= self.maxsize:
+                self.rejected += 1
+                raise BookingRejected(f'queue full ({self.maxsize} pending)')
+
+            start_worker = queue is None                # nessun worker attivo per la chiave
+            if start_worker:
+                queue = self._queues[key] = deque()
+            queue.append((future, fn, args, kwargs))
+
+        if start_worker:
+            threading.Thread(target=self._work, args=(key,), name=f'booking-{key}', daemon=True).start()
+        return future
+
+    def execute(self, key, fn, *args, timeout=None, **kwargs):
+        """Esegue fn nella coda di 'key' e ne attende il risultato
+
+        Se l'attesa scade prima che il task sia partito, il task viene annullato; se
+        invece è già in esecuzione se ne attende comunque l'esito (un acquisto avviato
+        non può essere abbandonato).
+
+        Args:
+            key: chiave della coda
+            fn: funzione da eseguire
+            timeout (float): secondi di attesa massima (default: None, nessun limite)
+
+        Returns:
+            il valore restituito da fn
+
+        Raises:
+            BookingRejected: se la coda è piena oppure l'attesa è scaduta
+        """
+
+        future = self.submit(key, fn, *args, **kwargs)
+        try:
+            return future.result(timeout)
+        except FutureTimeout:
+            if not future.cancel():                     # già in esecuzione: attende l'esito
+                return future.result()
+            with self._lock:
+                self.timeouts += 1
+            raise BookingRejected(f'timed out after {timeout} s')
+
+    def _work(self, key):
+        """Ciclo del worker di 'key': esegue i task finché la coda non è vuota"""
+
+        while True:
+            with self._lock:
+                queue = self._queues[key]
+                if not queue:                           # coda vuota: il worker termina
+                    del self._queues[key]
+                    return
+                future, fn, args, kwargs = queue.popleft()
+
+            if not future.set_running_or_notify_cancel():   # task annullato mentre era in coda
+                continue
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+            with self._lock:
+                self.completed += 1
+
+    def depth(self, key):
+        """Restituisce il numero di task in attesa nella coda di 'key'"""
+
+        with self._lock:
+            return len(self._queues.get(key, ()))
+
+    def stats(self, top=10):
+        """Restituisce le statistiche delle code
+
+        Args:
+            top (int): numero di code da riportare, ordinate per profondità
+
+        Returns:
+            dict: code attive, task in attesa, contatori e profondità delle code più lunghe
+        """
+
+        with self._lock:
+            depths = sorted(
+                ((key, len(queue)) for key, queue in self._queues.items()),
+                key=lambda item: item[1],
+                reverse=True
+            )
+            return {
+                'active': len(depths),
+                'pending': sum(depth for _, depth in depths),
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'timeouts': self.timeouts,
+                'maxsize': self.maxsize,
+                'depths': dict(depths[:top])
+            }
+
+
+booking_executor = BookingExecutor()    # code degli acquisti per proiezione condivise dal processo
@@ -0,0 +1,445 @@
+"""
+Modulo contenente la cache del catalogo dei film in programmazione ("now showing").
+Il catalogo cambia solo quando inizia una proiezione (che esce dalle faccette date e sale,
+e con l'ultima il suo film esce dalla programmazione) oppure quando un operatore modifica
+i dati dalla dashboard: viene quindi riletto dal database solo allo scadere del primo di
+questi eventi (o del TTL), e i filtri (faccette) della pagina /movies sono applicati in memoria.
+Contiene inoltre la cache dei dettagli dei film (dati, regista e attori) della pagina /movies/<id>.
+"""
+
+import os
+import hashlib
+import threading
+from datetime import datetime
+
+from sqlalchemy.sql import select
+from sqlalchemy.sql.expression import bindparam, literal_column
+
+from app.models.db import connect_as, Role
+from app.models.db import (
+    movie_table, projection_table,
+    cast_member_table, actor_movie_table
+)
+from app.utils.search import TrigramIndex
+from app.utils.cache import TTLCache
+
+
+CATALOG_CACHE_TTL = float(os.getenv("CATALOG_CACHE_TTL", 300))     # secondi massimi di validità del catalogo
+MOVIE_CACHE_SIZE = int(os.getenv("MOVIE_CACHE_SIZE", 1024))         # numero massimo di film in cache
+MOVIE_CACHE_TTL = float(os.getenv("MOVIE_CACHE_TTL", 600))          # secondi di validità dei dettagli di un film
+
+
+# faccette del catalogo: nome -> chiave del film con il valore (o la lista di valori) della faccetta
+FACETS = {
+    'genre': 'genre',               # genere
+    'nation': 'nation',             # nazione
+    'director': 'director',         # regista (nome e cognome)
+    'actor': 'actors',              # attori (nome e cognome)
+    'year': 'year',                 # anno di uscita
+    'date': 'dates',                # giorni con proiezioni future (YYYY-MM-DD)
+    'room': 'rooms'                 # sale con proiezioni future
+}
+
+
+def popcount(mask):
+    """Restituisce il numero di bit a 1 di un intero"""
+
+    return bin(mask).count('1')
+
+
+class Catalog:
+    """Istantanea dei film in programmazione, con indice di ricerca per titolo e indici per faccetta
+
+    Per ogni valore di ogni faccetta è precalcolata una bitmap dei film (il bit i
+    corrisponde all'i-esimo film), per cui filtri e conteggi sono operazioni bit a bit
+    e aggiungere una faccetta non richiede query aggiuntive.
+    """
+
+    def __init__(self, movies, expires_at=None, loaded_at=None):
+        """
+        Args:
+            movies (list): film in programmazione, dizionari con id, title, plot, genre,
+                poster e i valori delle faccette (vedi FACETS)
+            expires_at (datetime): inizio della prossima proiezione, quando cambiano le
+                faccette (date, sale) e i loro conteggi, oppure un film esce dalla
+                programmazione (default: None, nessuna proiezione futura)
+            loaded_at (datetime): data e ora (UTC) della lettura dal database
+                (default: None, adesso)
+        """
+
+        self.movies = movies
+        self.expires_at = expires_at
+        self.loaded_at = loaded_at or datetime.utcnow()
+        # digest del contenuto: uguale tra processi e tra riletture che non trovano modifiche (usato come ETag)
+        self.version = hashlib.sha1(repr(movies).encode()).hexdigest()[:20]
+        self.index = TrigramIndex((movie['id'], movie['title']) for movie in movies)
+        self._positions = { movie['id']: i for i, movie in enumerate(movies) }
+        self._all = (1 << len(movies)) - 1
+
+        # bitmap per faccetta: faccetta -> { valore: bitmap dei film }
+        self.bitmaps = { facet: {} for facet in FACETS }
+        for i, movie in enumerate(movies):
+            for facet, key in FACETS.items():
+                values = movie.get(key)
+                if values is None:
+                    continue
+                if not isinstance(values, (list, tuple, set)):
+                    values = (values,)
+                bitmap = self.bitmaps[facet]
+                for value in values:
+                    bitmap[value] = bitmap.get(value, 0) | (1 << i)
+
+    def filter(self, filters=None, search=None, years=None):
+        """Restituisce i film in programmazione filtrati e i conteggi delle faccette
+
+        Valori diversi della stessa faccetta sono in OR, faccette diverse in AND. Il
+        conteggio di un valore è il numero di film che si otterrebbero selezionandolo
+        in aggiunta ai filtri delle altre faccette (conteggio disgiuntivo).
+
+        Args:
+            filters (dict): valori selezionati per faccetta, esempio: {'genre': ['Drama']}
+                (default: None, nessun filtro)
+            search (str): testo da cercare nel titolo; i risultati sono ordinati
+                per somiglianza (default: None, nessuna ricerca)
+            years (tuple): intervallo (primo, ultimo) di anni di uscita, estremi
+                inclusi ed eventualmente None (default: None, nessun filtro)
+
+        Returns:
+            movies (list): film selezionati
+            counts (dict): per ogni faccetta, { valore: numero di film }
+        """
+
+        # film che corrispondono alla ricerca per titolo (tutti se non c'è ricerca)
+        ranked = None
+        base = self._all
+        if search:
+            ranked = [ self._positions[movie_id] for movie_id in self.index.search(search) ]
+            base = 0
+            for i in ranked:
+                base |= 1 << i
+
+        # bitmap dei film selezionati per ogni faccetta filtrata
+        masks = {}
+        for facet, values in (filters or {}).items():
+            if values:
+                bitmap = self.bitmaps[facet]
+                masks[facet] = 0
+                for value in values:
+                    masks[facet] |= bitmap.get(value, 0)
+        if years and (years[0] is not None or years[1] is not None):
+            first = years[0] if years[0] is not None else float('-inf')
+            last = years[1] if years[1] is not None else float('inf')
+            masks['year'] = 0
+            for year, bitmap in self.bitmaps['year'].items():
+                if first <= year <= last:
+                    masks['year'] |= bitmap
+
+        # conteggi disgiuntivi: per ogni faccetta si applicano solo i filtri delle altre
+        counts = {}
+        selected = base
+        for facet in FACETS:
+            others = base
+            for other, mask in masks.items():
+                if other != facet:
+                    others &= mask
+            counts[facet] = { value: popcount(bitmap & others) for value, bitmap in self.bitmaps[facet].items() }
+            if facet in masks:
+                selected &= masks[facet]
+
+        positions = ranked if ranked is not None else range(len(self.movies))
+        movies = [ self.movies[i] for i in positions if (selected >> i) & 1 ]
+        return movies, counts
+
+
+def load_catalog():
+    """Legge dal database i film in programmazione, con i valori delle faccette
+
+    Le query sono eseguite solo quando il catalogo in cache scade.
+
+    Returns:
+        Catalog: catalogo corrente
+    """
+
+    now = datetime.now()
+    with connect_as(Role.CLIENT) as conn:                               # connessione al database come client
+        # proiezioni future (giorni e sale dei film in programmazione)
+        sel_stmt = select([
+            projection_table.c.movie,
+            projection_table.c.datetime,
+            projection_table.c.room
+        ]).where(
+            projection_table.c.datetime >= now                          # solo proiezioni future
+        )
+        projections = {}                                                # movie id -> proiezioni
+        for row in conn.execute(sel_stmt):
+            projections.setdefault(row['movie'], []).append(row)
+
+        # film in programmazione, con il regista
+        sel_stmt = select([
+            movie_table.c.id,
+            movie_table.c.title,
+            movie_table.c.plot,
+            movie_table.c.genre,
+            movie_table.c.nation,
+            movie_table.c.releaseDate,
+            movie_table.c.poster,
+            cast_member_table.c.name.label('directorName'),
+            cast_member_table.c.surname.label('directorSurname')
+        ]).where(
+            (movie_table.c.director == cast_member_table.c.id)          # condizione di join
+            & movie_table.c.id.in_(bindparam('ids', expanding=True))    # solo film in programmazione
+        ).order_by(
+            movie_table.c.id
+        )
+        ids = list(projections)
+        movies = [ dict(row) for row in conn.execute(sel_stmt, ids=ids) ] if ids else []
+
+        # attori dei film in programmazione
+        sel_stmt = select([
+            actor_movie_table.c.movie,
+            cast_member_table.c.name,
+            cast_member_table.c.surname
+        ]).where(
+            (actor_movie_table.c.actor == cast_member_table.c.id)       # condizione di join
+            & actor_movie_table.c.movie.in_(bindparam('ids', expanding=True))
+        )
+        actors = {}                                                     # movie id -> attori
+        for row in (conn.execute(sel_stmt, ids=ids) if ids else ()):
+            actors.setdefault(row['movie'], []).append(f"{row['name']} {row['surname']}")
+
+    for movie in movies:
+        movie_projections = projections[movie['id']]
+        movie['director'] = f"{movie['directorName']} {movie['directorSurname']}"
+        movie['actors'] = sorted(actors.get(movie['id'], []))
+        movie['year'] = movie['releaseDate'].year
+        movie['dates'] = sorted({ p['datetime'].date().isoformat() for p in movie_projections })
+        movie['rooms'] = sorted({ p['room'] for p in movie_projections })
+
+    # il catalogo cambia all'inizio della prossima proiezione: esce dalle faccette date e sale
+    # (e dai conteggi) del suo film, che esce dalla programmazione se era la sua ultima
+    expires_at = min(
+        (p['datetime'] for movie in movies for p in projections[movie['id']]),
+        default=None
+    )
+    return Catalog(movies, expires_at)
+
+
+class CatalogCache:
+    """Cache (per processo) del catalogo dei film in programmazione
+
+    Il catalogo viene riletto alla scadenza del TTL oppure all'inizio della prossima
+    proiezione (quando cambiano le faccette o un film esce dalla programmazione),
+    oppure dopo un'invalidazione esplicita (modifiche dalla dashboard). Una sola
+    richiesta alla volta rilegge il catalogo: le richieste concorrenti attendono
+    e usano il catalogo appena letto.
+    """
+
+    def __init__(self, ttl=CATALOG_CACHE_TTL, loader=load_catalog, now=datetime.now):
+        """
+        Args:
+            ttl (float): secondi massimi di validità del catalogo
+            loader: funzione che legge il catalogo dal database
+            now: funzione che restituisce la data e ora corrente (default: datetime.now)
+        """
+
+        self.ttl = ttl
+        self._loader = loader
+        self._now = now
+        self._entry = None              # (generazione, scadenza, Catalog)
+        self._generation = 0            # incrementata ad ogni invalidazione
+        self._lock = threading.Lock()
+        self._loading = threading.Lock()    # una sola lettura dal database alla volta
+        self.hits = 0
+        self.misses = 0
+
+    def _cached(self, now):
+        """Restituisce il catalogo in cache se valido, altrimenti None (da chiamare con self._lock)"""
+
+        entry = self._entry
+        if entry is not None and entry[0] == self._generation and now < entry[1]:
+            self.hits += 1
+            return entry[2]
+        return None
+
+    def get(self):
+        """Restituisce il catalogo, rileggendolo dal database se scaduto o invalidato
+
+        Returns:
+            Catalog: catalogo dei film in programmazione
+        """
+
+        with self._lock:
+            catalog = self._cached(self._now())
+        if catalog is not None:
+            return catalog
+
+        with self._loading:
+            now = self._now()
+            with self._lock:
+                catalog = self._cached(now)                 # riletto da un'altra richiesta durante l'attesa
+                if catalog is not None:
+                    return catalog
+                self.misses += 1
+                generation = self._generation               # generazione letta prima di accedere al db
+
+            catalog = self._loader()
+            expires_at = datetime.fromtimestamp(now.timestamp() + self.ttl)
+            if catalog.expires_at is not None:
+                expires_at = min(expires_at, catalog.expires_at)
+
+            with self._lock:
+                if generation == self._generation:          # nessuna invalidazione durante la lettura
+                    self._entry = (generation, expires_at, catalog)
+        return catalog
+
+    def invalidate(self):
+        """Invalida il catalogo (da chiamare dopo le modifiche a film, proiezioni e generi)"""
+
+        with self._lock:
+            self._generation += 1
+            self._entry = None
+
+    def stats(self):
+        """Restituisce le statistiche della cache"""
+
+        with self._lock:
+            entry, hits, misses = self._entry, self.hits, self.misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'movies': len(entry[2].movies) if entry else 0,
+            'expires_at': entry[1].isoformat() if entry else None,
+            'ttl': self.ttl
+        }
+
+
+catalog_cache = CatalogCache()      # cache del catalogo condivisa dal processo
+
+
+def select_movie_projections():
+    """Restituisce la query delle proiezioni future di un film, con la versione del film
+
+    Il film è in LEFT JOIN con le proiezioni, per cui la query restituisce almeno una
+    riga se il film esiste (con le colonne della proiezione a NULL se non ce ne sono)
+    e nessuna riga altrimenti. La versione è la colonna di sistema xmin della riga del
+    film, che cambia ad ogni UPDATE: la validità dei dettagli in cache viene così
+    verificata nella stessa query che legge le proiezioni.
+
+    Parametri della query: movie_id (id del film) e now (data e ora corrente).
+    """
+
+    join = movie_table.outerjoin(projection_table, (
+        (projection_table.c.movie == movie_table.c.id)                  # condizione di join
+        & (projection_table.c.datetime >= bindparam('now'))             # solo proiezioni future
+    ))
+    return select([
+        literal_column(f'"{movie_table.name}".xmin::text').label('version'),
+        projection_table.c.id,
+        projection_table.c.room,
+        projection_table.c.datetime,
+        projection_table.c.price
+    ]).select_from(
+        join
+    ).where(
+        movie_table.c.id == bindparam('movie_id')                       # film richiesto
+    ).order_by(
+        projection_table.c.datetime                                     # ordinate per data
+    )
+
+
+def load_movie_details(conn, movie_id):
+    """Legge dal database i dettagli del film (dati del film, regista e attori)
+
+    Args:
+        conn: connessione al database
+        movie_id (int): id del film
+
+    Returns:
+        dict: { 'movie': dati del film e del regista, 'actors': attori }, None se il film non esiste
+    """
+
+    # seleziona film (+ info sul regista) con id uguale a movie_id
+    sel_stmt = select([
+        movie_table,
+        cast_member_table.c.name.label('directorName'),
+        cast_member_table.c.surname.label('directorSurname')
+    ]).where(
+        (movie_table.c.director == cast_member_table.c.id)              # condizione di join
+        & (movie_table.c.id == bindparam('movie_id'))                   # stesso id
+    )
+    movie = conn.execute(sel_stmt, movie_id=movie_id).first()           # al più uno (movie_id è PK)
+    if movie is None:
+        return None
+
+    # seleziona attori del film
+    sel_stmt = select([
+        cast_member_table
+    ]).where(
+        (cast_member_table.c.id == actor_movie_table.c.actor)           # condizione di join
+        & (actor_movie_table.c.movie == bindparam('movie_id'))          # stesso id
+    )
+    actors = [ dict(row) for row in conn.execute(sel_stmt, movie_id=movie_id) ]
+
+    return { 'movie': dict(movie), 'actors': actors }
+
+
+class MovieDetailsCache:
+    """Cache dei dettagli dei film (dati, regista e attori), uno per film
+
+    I dettagli di un film vengono riletti dal database quando scade il TTL, quando
+    cambia la versione della riga del film (xmin, letta insieme alle proiezioni)
+    oppure dopo un'invalidazione esplicita (modifiche a film, attori e membri del
+    cast dalla dashboard, che non cambiano la riga del film).
+    """
+
+    def __init__(self, maxsize=MOVIE_CACHE_SIZE, ttl=MOVIE_CACHE_TTL, loader=load_movie_details):
+        """
+        Args:
+            maxsize (int): numero massimo di film in cache
+            ttl (float): secondi dopo i quali i dettagli di un film vengono riletti
+            loader: funzione (conn, movie_id) -> dettagli (o None) che legge dal database
+        """
+
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)     # movie_id -> ((generazione, versione), dettagli)
+        self._loader = loader
+        self._generation = 0                                # incrementata ad ogni invalidazione
+        self._lock = threading.Lock()
+
+    def get(self, conn, movie_id, version):
+        """Restituisce i dettagli del film, rileggendoli se scaduti o di un'altra versione
+
+        Args:
+            conn: connessione al database (usata solo in caso di miss)
+            movie_id (int): id del film
+            version (str): versione corrente della riga del film (vedi select_movie_projections)
+
+        Returns:
+            dict: { 'movie': ..., 'actors': [...] }, None se il film non esiste
+        """
+
+        entry = self._cache.get(movie_id)
+        if entry is not None and entry[0] == (self._generation, version):
+            return entry[1]
+
+        generation = self._generation                       # generazione letta prima di accedere al db
+        details = self._loader(conn, movie_id)
+        if details is not None:
+            self._cache.set(movie_id, ((generation, version), details))
+        return details
+
+    def invalidate(self, movie_id=None):
+        """Invalida i dettagli di un film, oppure di tutti se movie_id è None"""
+
+        with self._lock:
+            if movie_id is None:
+                self._generation += 1
+            else:
+                self._cache.invalidate(movie_id)
+
+    def stats(self):
+        """Restituisce le statistiche della cache"""
+
+        return self._cache.stats()
+
+
+movie_details = MovieDetailsCache()     # cache dei dettagli dei film condivisa dal processo
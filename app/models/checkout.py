@@ -0,0 +1,96 @@
+"""
+Modulo contenente il token di checkout: una fotografia firmata (HMAC, tramite itsdangerous) e con
+scadenza della proiezione scelta, del prezzo, dei posti, dei circuiti di pagamento e del metodo di
+pagamento scelto. Il token è creato in /checkout e accompagna i passi successivi dell'acquisto, che
+lo verificano invece di rileggere dal database i dati di riferimento; il database viene consultato
+solo dove serve alla correttezza, nella transazione di acquisto.
+"""
+
+import os
+from datetime import datetime
+
+from flask import current_app
+from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
+
+
+CHECKOUT_TOKEN_MAX_AGE = int(os.getenv("CHECKOUT_TOKEN_MAX_AGE", 900))     # secondi di validità del token
+CHECKOUT_TOKEN_SALT = 'checkout'                                            # separa i token da altri dati firmati
+
+
+class CheckoutExpired(Exception):
+    """Token di checkout scaduto (la firma è valida: proj_id indica la proiezione)"""
+
+    def __init__(self, proj_id):
+        super().__init__('Checkout expired')
+        self.proj_id = proj_id
+
+
+class InvalidCheckout(Exception):
+    """Token di checkout mancante, alterato, o di un altro utente"""
+
+
+def _serializer():
+    return URLSafeTimedSerializer(current_app.secret_key, salt=CHECKOUT_TOKEN_SALT)
+
+
+def make_checkout_token(checkout):
+    """Crea il token di checkout firmato
+
+    Args:
+        checkout (dict): dati del checkout; proj_id (int), user (str), title (str),
+            datetime (datetime), price (float), seats (list), payment_circuits (list)
+            e payment_method_id (int, None se non ancora scelto; 0 per un nuovo metodo)
+
+    Returns:
+        str: token firmato, da inserire nei form dei passi successivi
+    """
+
+    return _serializer().dumps({
+        'proj': checkout['proj_id'],
+        'user': checkout['user'],
+        'title': checkout['title'],
+        'datetime': checkout['datetime'].isoformat(),
+        'price': checkout['price'],
+        'seats': [ [ seat['row'], seat['column'] ] for seat in checkout['seats'] ],
+        'circuits': checkout['payment_circuits'],
+        'pm': checkout.get('payment_method_id')
+    })
+
+
+def load_checkout_token(token, user, max_age=CHECKOUT_TOKEN_MAX_AGE):
+    """Verifica il token di checkout e ne restituisce i dati
+
+    Args:
+        token (str): token creato da make_checkout_token
+        user (str): username dell'utente corrente (il token è valido solo per chi l'ha creato)
+        max_age (int): secondi di validità del token
+
+    Returns:
+        dict: dati del checkout (vedi make_checkout_token)
+
+    Raises:
+        CheckoutExpired: se il token è scaduto
+        InvalidCheckout: se il token è mancante, alterato o di un altro utente
+    """
+
+    serializer = _serializer()
+    try:
+        data = serializer.loads(token or '', max_age=max_age)
+    except SignatureExpired as e:                    # firma valida: il contenuto è affidabile
+        raise CheckoutExpired(serializer.load_payload(e.payload)['proj']) from e
+    except BadSignature as e:
+        raise InvalidCheckout('Invalid checkout') from e
+
+    if data.get('user') != user:
+        raise InvalidCheckout('Invalid checkout')
+
+    return {
+        'proj_id': data['proj'],
+        'user': data['user'],
+        'title': data['title'],
+        'datetime': datetime.fromisoformat(data['datetime']),
+        'price': data['price'],
+        'seats': [ { 'row': row, 'column': column } for row, column in data['seats'] ],
+        'payment_circuits': data['circuits'],
+        'payment_method_id': data['pm']
+    }
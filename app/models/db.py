@@ -5,10 +5,13 @@ Inoltre contiene alcune funzioni di utlità prettamente riguardanti il database.
 
 import os
 import urllib
+import threading
 from enum import Enum
 
+from flask import g, has_app_context
 from flask_login import UserMixin
-from sqlalchemy import create_engine, MetaData, Table, Column, ForeignKey
+from sqlalchemy import create_engine, event, MetaData, Table, Column, ForeignKey
+from sqlalchemy import ForeignKeyConstraint, UniqueConstraint
 from sqlalchemy.types import Integer, Float, String, Date, DateTime, Boolean, Text
 
 
@@ -23,6 +26,12 @@ DB_NAME = os.getenv("DB_NAME")
 # url database
 DB_STRING = f"{DIALECT}://{DB_APP_USER}:{DB_APP_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
+# dimensionamento dei pool di connessioni (uno per ruolo, sovrascrivibile per singolo ruolo,
+# esempio: DB_POOL_SIZE_CLIENT=20)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))                # connessioni mantenute aperte per pool
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))         # connessioni extra oltre pool_size
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", 30))         # secondi di attesa per una connessione libera
+
 
 db = create_engine(DB_STRING, pool_pre_ping=True, echo=False)   # istanza dell'engine sqlachemy
 
@@ -99,7 +108,8 @@ purchase_table = Table('Purchase', metadata,
     Column('projection', Integer, ForeignKey('Projection.id'), nullable=False),
     Column('total', Float, nullable=False),
     Column('purchaseDatetime', DateTime, nullable=False),
-    Column('paymentMethod', Integer, ForeignKey('PaymentMethod.id'), nullable=False)
+    Column('paymentMethod', Integer, ForeignKey('PaymentMethod.id'), nullable=False),
+    UniqueConstraint('id', 'projection')
 )
 
 # tabella Ticket
@@ -107,7 +117,10 @@ ticket_table = Table('Ticket', metadata,
     Column('id', Integer, primary_key=True, autoincrement=True),
     Column('row', Integer, nullable=False),
     Column('column', Integer, nullable=False),
-    Column('purchase', Integer, ForeignKey('Purchase.id'), nullable=False)
+    Column('purchase', Integer, ForeignKey('Purchase.id'), nullable=False),
+    Column('projection', Integer, nullable=False),
+    ForeignKeyConstraint(['purchase', 'projection'], ['Purchase.id', 'Purchase.projection']),
+    UniqueConstraint('projection', 'row', 'column', name='ticket_seat_unique')    # posto venduto una sola volta
 )
 
 # tabella Room
@@ -135,9 +148,11 @@ def get_db():
 
 
 def close_db():
-    """Chiude il database engine, rilasciando le risorse"""
+    """Chiude il database engine e i pool dei ruoli, rilasciando le risorse"""
 
     db.dispose()                                # chiude l'engine rilasciando le risorse
+    for engine in role_engines.values():        # chiude i pool dei ruoli
+        engine.dispose()
 
 
 class Role(Enum):
@@ -147,23 +162,189 @@ class Role(Enum):
     OPERATOR = 'operator'
 
 
-def connect_as(role):
-    """Restituisce una connessione al database, impostando il ruolo opportunamente
+def _pool_setting(role, name, default):
+    """Legge un parametro del pool per il ruolo dato, con fallback sul valore globale
+
+    Args:
+        role (Role): ruolo a cui si riferisce il pool
+        name (str): nome della variabile d'ambiente (senza suffisso del ruolo)
+        default (int): valore globale da usare in assenza di override
+
+    Returns:
+        int: valore del parametro per il pool del ruolo
+    """
+
+    return int(os.getenv(f'{name}_{role.name}', default))
+
+
+def _create_role_engine(role):
+    """Crea un engine il cui pool contiene solo connessioni con il ruolo dato
+
+    Il ruolo viene impostato una sola volta, quando il pool apre una nuova
+    connessione fisica, per cui le connessioni prese dal pool hanno già il
+    ruolo corretto e non serve più un SET ROLE per ogni checkout.
+
+    Args:
+        role (Role): ruolo delle connessioni del pool
+
+    Returns:
+        Engine: engine sqlalchemy con pool dedicato al ruolo
+    """
+
+    engine = create_engine(
+        DB_STRING,
+        pool_pre_ping=True,
+        pool_size=_pool_setting(role, 'DB_POOL_SIZE', DB_POOL_SIZE),
+        max_overflow=_pool_setting(role, 'DB_MAX_OVERFLOW', DB_MAX_OVERFLOW),
+        pool_timeout=_pool_setting(role, 'DB_POOL_TIMEOUT', DB_POOL_TIMEOUT),
+        echo=False
+    )
+
+    @event.listens_for(engine, 'connect')
+    def set_role(dbapi_connection, connection_record):     # eseguita solo all'apertura della connessione
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f'SET ROLE {role.name}')             # impostazione del ruolo
+        cursor.close()
+        dbapi_connection.commit()                           # il rollback al rilascio non deve annullare il ruolo
+
+    @event.listens_for(engine, 'checkout')
+    def count_checkout(dbapi_connection, connection_record, connection_proxy):
+        if has_app_context():                               # conta i checkout della richiesta corrente
+            g._db_checkouts = g.get('_db_checkouts', 0) + 1
+
+    return engine
+
+
+# un engine (e quindi un pool di connessioni) per ogni ruolo
+role_engines = { role: _create_role_engine(role) for role in Role }
+
+
+class RequestConnection:
+    """Connessione condivisa dalla richiesta corrente (vedi connect_as)
+
+    Delega tutti i metodi alla connessione, tranne close() e l'uscita dal blocco
+    with, che non la rilasciano: la connessione torna al pool solo nel teardown.
+    """
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def close(self):
+        """Non fa nulla: la connessione è rilasciata da release_request_connections"""
+
+
+def connect_as(role, request_scoped=True):
+    """Restituisce una connessione al database, presa dal pool del ruolo richiesto
+
+    Durante una richiesta (o comunque in un application context) tutte le chiamate
+    con lo stesso ruolo condividono la stessa connessione, salvata in flask.g:
+    viene restituita una RequestConnection, la cui close() non la rilascia.
+    La connessione torna al pool solo nel teardown (release_request_connections).
 
     Args:
         role (Role): ruolo con cui connettersi
+        request_scoped (bool): se False effettua sempre un nuovo checkout,
+            utile quando la connessione deve cambiare stato (esempio:
+            livello di isolamento) senza influenzare il resto della richiesta
+            (default: True)
 
     Returns:
         conn: oggetto che modella la connessione al database
     """
 
     # valida ruolo
-    if role not in [ Role.WEBAPP, Role.CLIENT, Role.OPERATOR ]:
+    if role not in role_engines:
         raise ValueError(f'Invalid role: {role}')
 
-    conn = db.connect()                                             # connessione al database
-    conn.execute(f'SET ROLE {role.name}; COMMIT;')                  # impostazione del ruolo
-    return conn
+    if not request_scoped or not has_app_context():
+        return role_engines[role].connect()                         # checkout dal pool del ruolo
+
+    connections = g.setdefault('_db_connections', {})               # connessioni della richiesta corrente
+    if role not in connections:                                     # primo utilizzo del ruolo nella richiesta
+        connections[role] = role_engines[role].connect()            # checkout dal pool del ruolo
+    return RequestConnection(connections[role])                     # close() non rilascia la connessione
+
+
+# contatori aggregati dei checkout per richiesta
+_request_stats = { 'requests': 0, 'checkouts': 0 }
+_request_stats_lock = threading.Lock()
+
+
+def request_checkout_count():
+    """Restituisce il numero di checkout dai pool effettuati nella richiesta corrente
+
+    Returns:
+        int: numero di checkout (0 fuori da un application context)
+    """
+
+    return g.get('_db_checkouts', 0) if has_app_context() else 0
+
+
+def release_request_connections(exception=None):
+    """Rilascia ai rispettivi pool le connessioni condivise dalla richiesta corrente
+
+    Registrata come teardown dell'application context da init_app.
+
+    Args:
+        exception: eventuale eccezione che ha terminato la richiesta
+            (default: None)
+    """
+
+    connections = g.pop('_db_connections', {})
+    for conn in connections.values():
+        conn.close()                                # ritorno al pool (con rollback)
+
+    with _request_stats_lock:                       # aggiorna contatori aggregati
+        _request_stats['requests'] += 1
+        _request_stats['checkouts'] += g.pop('_db_checkouts', 0)
+
+
+def get_request_stats():
+    """Restituisce i contatori aggregati dei checkout per richiesta
+
+    Returns:
+        dict: numero di richieste, checkout totali e media per richiesta
+    """
+
+    with _request_stats_lock:
+        requests = _request_stats['requests']
+        checkouts = _request_stats['checkouts']
+
+    return {
+        'requests': requests,
+        'checkouts': checkouts,
+        'checkouts_per_request': checkouts / requests if requests else 0
+    }
+
+
+def get_pool_stats():
+    """Restituisce le statistiche dei pool di connessioni, una voce per ruolo
+
+    Returns:
+        dict: dizionario (key:nome_ruolo, value:statistiche del pool)
+    """
+
+    stats = {}
+    for role, engine in role_engines.items():
+        pool = engine.pool
+        stats[role.name] = {
+            'size': pool.size(),                    # dimensione configurata del pool
+            'checked_in': pool.checkedin(),         # connessioni libere nel pool
+            'checked_out': pool.checkedout(),       # connessioni attualmente in uso
+            'overflow': pool.overflow(),            # connessioni aperte oltre la dimensione del pool
+            'max_overflow': pool._max_overflow      # limite di connessioni extra
+        }
+
+    return stats
 
 
 def init_db():
@@ -196,7 +377,7 @@ def get_table_dictionary():
 def init_app(app):
     """Inizializza l'applicazione Flask"""
 
-    app.teardown_appcontext(close_db)           # chiude il database alla chiusura dell'app
+    app.teardown_appcontext(release_request_connections)    # rilascia le connessioni a fine richiesta
 
 
 class User(UserMixin):
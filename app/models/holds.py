@@ -0,0 +1,164 @@
+"""
+Modulo contenente le prenotazioni temporanee dei posti (hold).
+Un hold riserva un posto ad un utente tra la scelta dei posti (checkout) e il pagamento;
+scade automaticamente dopo SEAT_HOLD_TTL secondi.
+"""
+
+import os
+import time
+import heapq
+import threading
+
+
+SEAT_HOLD_TTL = float(os.getenv("SEAT_HOLD_TTL", 300))     # durata di un hold in secondi
+
+
+class SeatHolds:
+    """Registro in memoria degli hold sui posti
+
+    Gli hold sono indicizzati per proiezione e posto, per cui la verifica di un
+    posto costa O(1); le scadenze sono mantenute in uno heap, così la rimozione
+    degli hold scaduti (sweep) costa O(log n) per hold rimosso.
+    """
+
+    def __init__(self, ttl=SEAT_HOLD_TTL, clock=time.monotonic):
+        """
+        Args:
+            ttl (float): durata di un hold in secondi
+            clock: funzione che restituisce il tempo corrente in secondi
+                (default: time.monotonic)
+        """
+
+        self.ttl = ttl
+        self._clock = clock
+        self._holds = {}            # proj_id -> { (row, column): (holder, scadenza) }
+        self._by_holder = {}        # (proj_id, holder) -> { (row, column) }
+        self._expirations = []      # heap di (scadenza, proj_id, (row, column))
+        self._lock = threading.Lock()
+
+    def _owner(self, proj_id, seat, now):
+        """Restituisce chi detiene l'hold sul posto, None se libero o scaduto"""
+
+        hold = self._holds.get(proj_id, {}).get(seat)
+        if hold is None or hold[1] <= now:
+            return None
+        return hold[0]
+
+    def _remove(self, proj_id, seat):
+        """Rimuove l'hold sul posto dagli indici"""
+
+        seats = self._holds.get(proj_id)
+        if seats is None or seat not in seats:
+            return
+        holder, _ = seats.pop(seat)
+        if not seats:
+            del self._holds[proj_id]
+
+        held = self._by_holder.get((proj_id, holder))
+        if held is not None:
+            held.discard(seat)
+            if not held:
+                del self._by_holder[(proj_id, holder)]
+
+    def _sweep(self, now):
+        """Rimuove gli hold scaduti (da chiamare con il lock acquisito)"""
+
+        while self._expirations and self._expirations[0][0] <= now:
+            expires_at, proj_id, seat = heapq.heappop(self._expirations)
+            hold = self._holds.get(proj_id, {}).get(seat)
+            if hold is not None and hold[1] == expires_at:      # l'hold non è stato rinnovato nel frattempo
+                self._remove(proj_id, seat)
+
+    def sweep(self):
+        """Rimuove gli hold scaduti"""
+
+        with self._lock:
+            self._sweep(self._clock())
+
+    def acquire(self, proj_id, seats, holder):
+        """Riserva i posti dati all'utente 'holder' (tutti o nessuno)
+
+        Gli hold già detenuti dallo stesso utente vengono rinnovati, mentre quelli
+        che l'utente deteneva su altri posti della stessa proiezione vengono rilasciati.
+
+        Args:
+            proj_id (int): id della proiezione
+            seats (list): posti da riservare; esempio di seat: {'row': 1, 'column': 5}
+            holder (str): username dell'utente
+
+        Returns:
+            list: posti riservati da altri utenti (lista vuota se gli hold sono stati concessi)
+        """
+
+        keys = [ (seat['row'], seat['column']) for seat in seats ]
+
+        with self._lock:
+            now = self._clock()
+            self._sweep(now)
+
+            conflicts = [
+                { 'row': key[0], 'column': key[1] }
+                for key in keys if self._owner(proj_id, key, now) not in (None, holder)
+            ]
+            if conflicts:
+                return conflicts
+
+            # rilascia gli hold dell'utente su posti non più selezionati
+            for key in self._by_holder.get((proj_id, holder), set()) - set(keys):
+                self._remove(proj_id, key)
+
+            expires_at = now + self.ttl
+            proj_holds = self._holds.setdefault(proj_id, {})
+            held = self._by_holder.setdefault((proj_id, holder), set())
+            for key in keys:
+                proj_holds[key] = (holder, expires_at)
+                held.add(key)
+                heapq.heappush(self._expirations, (expires_at, proj_id, key))
+
+        return []
+
+    def release(self, proj_id, holder):
+        """Rilascia tutti gli hold dell'utente sulla proiezione (esempio: acquisto completato)
+
+        Args:
+            proj_id (int): id della proiezione
+            holder (str): username dell'utente
+        """
+
+        with self._lock:
+            for key in list(self._by_holder.get((proj_id, holder), ())):
+                self._remove(proj_id, key)
+
+    def held_bits(self, proj_id, columns, exclude_holder=None):
+        """Restituisce il bitset (stesso formato di SeatMap) dei posti riservati
+
+        Args:
+            proj_id (int): id della proiezione
+            columns (int): numero di colonne della sala
+            exclude_holder (str): utente i cui hold non vanno considerati
+                (default: None)
+
+        Returns:
+            int: bitset con un bit a 1 per ogni posto riservato
+        """
+
+        bits = 0
+        with self._lock:
+            now = self._clock()
+            for (row, column), (holder, expires_at) in self._holds.get(proj_id, {}).items():
+                if expires_at > now and holder != exclude_holder:
+                    bits |= 1 << ((row - 1) * columns + (column - 1))
+        return bits
+
+    def stats(self):
+        """Restituisce il numero di proiezioni e di posti con hold attivi"""
+
+        with self._lock:
+            return {
+                'projections': len(self._holds),
+                'seats': sum(len(seats) for seats in self._holds.values()),
+                'ttl': self.ttl
+            }
+
+
+seat_holds = SeatHolds()            # hold sui posti condivisi dal processo
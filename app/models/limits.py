@@ -0,0 +1,46 @@
+"""
+Modulo contenente i rate limiter dei tentativi di login, per indirizzo IP e per email.
+I tentativi oltre il limite sono rifiutati prima di qualunque query al database e di qualunque
+verifica della password. Con RATE_LIMIT_BACKEND=sqlite i limiti sono condivisi tra i processi.
+"""
+
+import os
+
+from app.utils.ratelimit import TokenBucketLimiter, SQLiteTokenBucketLimiter
+
+
+# configurazione dei limiti (tentativi al minuto e tentativi consecutivi massimi)
+LOGIN_IP_RATE = float(os.getenv("LOGIN_IP_RATE", 30))                   # tentativi al minuto per IP
+LOGIN_IP_BURST = float(os.getenv("LOGIN_IP_BURST", 10))                 # tentativi consecutivi per IP
+LOGIN_EMAIL_RATE = float(os.getenv("LOGIN_EMAIL_RATE", 5))              # tentativi al minuto per email
+LOGIN_EMAIL_BURST = float(os.getenv("LOGIN_EMAIL_BURST", 5))            # tentativi consecutivi per email
+RATE_LIMIT_SIZE = int(os.getenv("RATE_LIMIT_SIZE", 10000))              # chiavi in memoria per limiter
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")          # memory oppure sqlite
+RATE_LIMIT_DB = os.getenv("RATE_LIMIT_DB", os.path.join('instance', 'ratelimit.sqlite3'))  # file del backend sqlite
+
+
+def create_limiter(name, per_minute, burst, backend=RATE_LIMIT_BACKEND):
+    """Crea un rate limiter con il backend configurato
+
+    Args:
+        name (str): nome del limiter
+        per_minute (float): tentativi permessi al minuto (a regime)
+        burst (float): tentativi consecutivi permessi
+        backend (str): 'memory' (per processo) oppure 'sqlite' (condiviso tra processi)
+
+    Returns:
+        limiter con i metodi allow(key), reset(key) e stats()
+
+    Raises:
+        ValueError: se il backend non è valido
+    """
+
+    if backend == 'memory':
+        return TokenBucketLimiter(per_minute / 60, burst, maxsize=RATE_LIMIT_SIZE)
+    if backend == 'sqlite':
+        return SQLiteTokenBucketLimiter(RATE_LIMIT_DB, name, per_minute / 60, burst)
+    raise ValueError(f'Invalid rate limit backend: {backend}')
+
+
+login_ip_limiter = create_limiter('login_ip', LOGIN_IP_RATE, LOGIN_IP_BURST)             # tentativi per IP
+login_email_limiter = create_limiter('login_email', LOGIN_EMAIL_RATE, LOGIN_EMAIL_BURST)  # tentativi per email
@@ -0,0 +1,147 @@
+"""
+Modulo contenente il servizio di hashing delle password.
+Gli hash (KDF volutamente lente) sono calcolati in un pool di processi limitato, così da non
+occupare i thread che servono le richieste; quando troppe operazioni sono in attesa le nuove
+richieste vengono rifiutate subito invece di accodarsi.
+"""
+
+import os
+import threading
+import multiprocessing
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+# configurazione dell'hashing delle password
+PASSWORD_HASH_METHOD = os.getenv("PASSWORD_HASH_METHOD", "pbkdf2:sha256:150000")  # metodo (e costo) werkzeug
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 2))          # processi (0: nel thread della richiesta)
+PASSWORD_HASH_QUEUE = int(os.getenv("PASSWORD_HASH_QUEUE", 32))             # operazioni in corso o in attesa
+PASSWORD_HASH_TIMEOUT = float(os.getenv("PASSWORD_HASH_TIMEOUT", 10))       # attesa massima di un'operazione
+
+
+class HashingBusy(Exception):
+    """Operazione rifiutata: troppe operazioni di hashing in attesa (oppure attesa scaduta)"""
+
+
+@lru_cache(maxsize=8)
+def method_prefix(method):
+    """Restituisce il prefisso degli hash generati con il metodo dato (esempio: 'pbkdf2:sha256:150000')
+
+    Il prefisso è ricavato da un hash di prova, per cui tiene conto dei valori di
+    default di werkzeug (esempio: numero di iterazioni non specificato).
+    """
+
+    return generate_password_hash('', method).split('$', 1)[0]
+
+
+class PasswordHasher:
+    """Servizio di hashing e verifica delle password
+
+    Le operazioni sono eseguite in un ProcessPoolExecutor con 'workers' processi,
+    creato al primo utilizzo; al più 'max_pending' operazioni possono essere in
+    corso o in attesa, le successive sollevano subito HashingBusy. Con 'workers'
+    uguale a 0 le operazioni sono eseguite nel thread chiamante.
+    """
+
+    def __init__(self, workers=PASSWORD_HASH_WORKERS, max_pending=PASSWORD_HASH_QUEUE,
+                 method=PASSWORD_HASH_METHOD, timeout=PASSWORD_HASH_TIMEOUT):
+        """
+        Args:
+            workers (int): numero di processi del pool (0: nessun pool)
+            max_pending (int): numero massimo di operazioni in corso o in attesa
+            method (str): metodo di hashing werkzeug per i nuovi hash
+            timeout (float): secondi di attesa massima di un'operazione
+        """
+
+        self.workers = workers
+        self.max_pending = max_pending
+        self.method = method
+        self.timeout = timeout
+        self._executor = None
+        self._pending = 0               # operazioni in corso o in attesa
+        self._lock = threading.Lock()
+        self.completed = 0              # operazioni eseguite
+        self.rejected = 0               # operazioni rifiutate (pool saturo o attesa scaduta)
+
+    def _run(self, fn, *args):
+        """Esegue fn(*args) nel pool, rispettando il limite di operazioni in attesa"""
+
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                raise HashingBusy(f'{self._pending} password hashing operations pending')
+            self._pending += 1
+            if self._executor is None and self.workers > 0:
+                # processi avviati con 'spawn': il processo web è multithread, per cui fork non è sicuro
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+            executor = self._executor
+
+        if executor is None:                      # nessun pool: esecuzione nel thread chiamante
+            try:
+                return fn(*args)
+            finally:
+                self._release()
+
+        # l'operazione resta in attesa (e occupa il pool) finché non termina, anche se il chiamante rinuncia
+        future = executor.submit(fn, *args)
+        future.add_done_callback(self._release)
+        try:
+            return future.result(self.timeout)
+        except FutureTimeout:
+            with self._lock:
+                self.rejected += 1
+            raise HashingBusy(f'password hashing timed out after {self.timeout} s')
+
+    def _release(self, _=None):
+        with self._lock:
+            self._pending -= 1
+            self.completed += 1
+
+    def hash(self, password):
+        """Restituisce l'hash della password, calcolato con il metodo corrente
+
+        Raises:
+            HashingBusy: se il pool è saturo
+        """
+
+        return self._run(generate_password_hash, password, self.method)
+
+    def check(self, pwhash, password):
+        """Verifica la password rispetto all'hash memorizzato
+
+        Raises:
+            HashingBusy: se il pool è saturo
+        """
+
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        """Verifica se l'hash è stato calcolato con un metodo (o costo) diverso da quello corrente"""
+
+        return pwhash.split('$', 1)[0] != method_prefix(self.method)
+
+    def stats(self):
+        """Restituisce le statistiche del servizio"""
+
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'pending': self._pending,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'max_pending': self.max_pending,
+                'method': self.method
+            }
+
+    def shutdown(self):
+        """Termina i processi del pool (ricreati al prossimo utilizzo)"""
+
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+
+
+password_hasher = PasswordHasher()      # servizio di hashing condiviso dal processo
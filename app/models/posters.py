@@ -0,0 +1,313 @@
+"""
+Modulo contenente la pipeline dei poster dei film: il poster originale (Movie.poster) viene
+scaricato e salvato su disco, insieme alle sue varianti ridimensionate (JPEG e WebP) servite
+dalla pagina /movies. Le varianti mancanti sono generate in un pool di thread; originale e
+varianti sono riscaricati e rigenerati ogni POSTER_REFRESH secondi, per seguire le modifiche
+dell'immagine allo stesso url.
+Pillow è una dipendenza opzionale: senza, i poster sono serviti dall'url originale.
+"""
+
+import io
+import os
+import re
+import time
+import hashlib
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, Future
+
+try:
+    from PIL import Image
+except ImportError:                 # Pillow non installato: pipeline disabilitata
+    Image = None
+
+
+# configurazione dei poster
+POSTER_WIDTHS = tuple(int(w) for w in os.getenv("POSTER_WIDTHS", "180,360").split(','))  # larghezze servite
+POSTER_QUALITY = int(os.getenv("POSTER_QUALITY", 80))                   # qualità di compressione (1-100)
+POSTER_WORKERS = int(os.getenv("POSTER_WORKERS", 4))                    # thread che generano le varianti
+POSTER_FETCH_TIMEOUT = float(os.getenv("POSTER_FETCH_TIMEOUT", 5))      # secondi per scaricare un originale
+POSTER_RENDER_TIMEOUT = float(os.getenv("POSTER_RENDER_TIMEOUT", 10))  # attesa massima di una variante
+POSTER_MAX_BYTES = int(os.getenv("POSTER_MAX_BYTES", 5 * 1024 * 1024))  # dimensione massima di un originale
+POSTER_MAX_AGE = int(os.getenv("POSTER_MAX_AGE", 24 * 3600))            # secondi di cache delle varianti nel browser
+POSTER_REFRESH = float(os.getenv("POSTER_REFRESH", 7 * 24 * 3600))      # secondi dopo i quali un poster su disco è rigenerato
+POSTER_FAILURE_TTL = float(os.getenv("POSTER_FAILURE_TTL", 300))        # secondi prima di riprovare un poster non valido
+
+# formati delle varianti: estensione -> (formato Pillow, mimetype)
+POSTER_FORMATS = {
+    'webp': ('WEBP', 'image/webp'),
+    'jpg': ('JPEG', 'image/jpeg')
+}
+
+
+def posters_enabled():
+    """Restituisce True se la pipeline dei poster è disponibile (Pillow installato)"""
+
+    return Image is not None
+
+
+def poster_key(source):
+    """Restituisce la chiave (hash) del poster, usata nei nomi dei file e negli url
+
+    La chiave cambia quando cambia l'url del poster; un'immagine modificata allo
+    stesso url è invece seguita rigenerando le varianti (vedi PosterStore).
+
+    Args:
+        source (str): url del poster originale
+
+    Returns:
+        str: hash esadecimale dell'url
+    """
+
+    return hashlib.sha1(source.encode()).hexdigest()[:16]
+
+
+def valid_key(key):
+    """Verifica che la chiave abbia il formato di poster_key (è usata nei nomi dei file)"""
+
+    return re.fullmatch(r'[0-9a-f]{16}', key) is not None
+
+
+def fetch_source(source, timeout=POSTER_FETCH_TIMEOUT, max_bytes=POSTER_MAX_BYTES):
+    """Scarica il poster originale
+
+    Args:
+        source (str): url http(s) del poster
+        timeout (float): secondi di attesa massima
+        max_bytes (int): dimensione massima accettata
+
+    Returns:
+        bytes: contenuto del poster
+
+    Raises:
+        ValueError: se l'url non è http(s) oppure il poster è troppo grande
+    """
+
+    if not source.startswith(('http://', 'https://')):
+        raise ValueError(f'Unsupported poster url: {source}')
+
+    with urllib.request.urlopen(source, timeout=timeout) as response:
+        data = response.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        raise ValueError(f'Poster too large: {source}')
+    return data
+
+
+def render_variant(data, width, fmt, quality=POSTER_QUALITY):
+    """Genera una variante del poster: ridimensionata (mai ingrandita) e ricompressa
+
+    Args:
+        data (bytes): poster originale
+        width (int): larghezza massima in pixel (l'altezza mantiene le proporzioni)
+        fmt (str): estensione del formato, una chiave di POSTER_FORMATS
+        quality (int): qualità di compressione
+
+    Returns:
+        bytes: variante del poster
+    """
+
+    image = Image.open(io.BytesIO(data))
+    image = image.convert('RGB')
+    if image.width > width:
+        image.thumbnail((width, image.height * width // image.width + 1), Image.LANCZOS)
+
+    output = io.BytesIO()
+    image.save(output, POSTER_FORMATS[fmt][0], quality=quality)
+    return output.getvalue()
+
+
+def write_file(path, data):
+    """Scrive il file in modo atomico (file temporaneo e rename), così non è mai letto a metà"""
+
+    tmp_path = f'{path}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class PosterUnavailable(Exception):
+    """Poster il cui download o la cui decodifica sono falliti di recente (non viene ritentato)"""
+
+
+class PosterStore:
+    """Cache su disco dei poster originali e delle loro varianti
+
+    Struttura della directory:
+        originals/<chiave>              poster originale, scaricato una sola volta
+        <chiave>-<larghezza>.<formato>  variante
+
+    Le varianti mancanti sono generate nel pool di thread; richieste concorrenti
+    della stessa variante attendono la stessa generazione, e generazioni concorrenti
+    di varianti diverse dello stesso poster attendono lo stesso download. Un poster
+    che non può essere scaricato o decodificato non viene ritentato per
+    'failure_ttl' secondi. I file più vecchi di 'refresh' secondi (secondo la data
+    di modifica) sono considerati mancanti: l'originale viene riscaricato e le
+    varianti rigenerate.
+    """
+
+    def __init__(self, workers=POSTER_WORKERS, fetch=fetch_source, failure_ttl=POSTER_FAILURE_TTL,
+                 clock=time.monotonic, refresh=POSTER_REFRESH):
+        """
+        Args:
+            workers (int): numero di thread che generano le varianti
+            fetch: funzione url -> bytes che scarica un poster originale
+            failure_ttl (float): secondi per cui un poster non valido non viene ritentato
+            clock: funzione che restituisce il tempo corrente in secondi
+                (default: time.monotonic)
+            refresh (float): secondi dopo i quali originale e varianti su disco sono rigenerati
+        """
+
+        self._fetch = fetch
+        self.refresh = refresh
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='poster')
+        self._pending = {}          # path della variante -> Future della generazione in corso
+        self._downloads = {}        # chiave del poster -> Future del download in corso
+        self._failures = {}         # chiave del poster -> istante fino al quale non viene ritentato
+        self.failure_ttl = failure_ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.hits = 0               # varianti già su disco
+        self.misses = 0             # varianti generate
+        self.fetches = 0            # originali scaricati
+        self.failures = 0           # generazioni non riuscite
+        self.skipped = 0            # richieste di poster non validi, rifiutate senza riprovare
+
+    @staticmethod
+    def variant_path(directory, key, width, fmt):
+        """Restituisce il path della variante"""
+
+        return os.path.join(directory, f'{key}-{width}.{fmt}')
+
+    def is_fresh(self, path):
+        """Restituisce True se il file esiste e non è più vecchio di 'refresh' secondi"""
+
+        try:
+            return time.time() - os.path.getmtime(path) < self.refresh
+        except OSError:
+            return False
+
+    def get(self, directory, source, width, fmt, timeout=None):
+        """Restituisce il path della variante, generandola se non è ancora su disco
+
+        Args:
+            directory (str): directory della cache
+            source (str): url del poster originale
+            width (int): larghezza della variante
+            fmt (str): formato della variante, una chiave di POSTER_FORMATS
+            timeout (float): secondi di attesa massima della generazione (default: None)
+
+        Returns:
+            str: path della variante
+
+        Raises:
+            PosterUnavailable: se la generazione del poster è fallita di recente
+            concurrent.futures.TimeoutError: se la generazione non termina in tempo
+            Exception: errori di download o di decodifica del poster
+        """
+
+        key = poster_key(source)
+        path = self.variant_path(directory, key, width, fmt)
+        if self.is_fresh(path):
+            with self._lock:
+                self.hits += 1
+            return path
+
+        with self._lock:
+            retry_at = self._failures.get(key)
+            if retry_at is not None:
+                if self._clock() < retry_at:            # fallito di recente: niente nuovo download
+                    self.skipped += 1
+                    raise PosterUnavailable(source)
+                del self._failures[key]
+
+            future = self._pending.get(path)
+            submitted = future is None
+            if submitted:                               # nessuna generazione in corso: la avvia
+                self.misses += 1
+                future = self._executor.submit(self._render, directory, source, width, fmt, path)
+                self._pending[path] = future
+        if submitted:                                   # fuori dal lock: se già completata, la callback è eseguita subito
+            future.add_done_callback(lambda _: self._done(path))
+        return future.result(timeout)
+
+    def _done(self, path):
+        with self._lock:
+            self._pending.pop(path, None)
+
+    def _failed(self, key):
+        """Registra il fallimento del poster (con il lock acquisito), eliminando i fallimenti scaduti"""
+
+        now = self._clock()
+        for expired in [ k for k, retry_at in self._failures.items() if retry_at <= now ]:
+            del self._failures[expired]
+        self._failures[key] = now + self.failure_ttl
+        self.failures += 1
+
+    def _original(self, directory, source):
+        """Restituisce il poster originale, dal disco oppure scaricandolo una sola volta per chiave"""
+
+        key = poster_key(source)
+        originals = os.path.join(directory, 'originals')
+        original_path = os.path.join(originals, key)
+        if self.is_fresh(original_path):
+            with open(original_path, 'rb') as f:
+                return f.read()
+
+        with self._lock:
+            future = self._downloads.get(key)
+            owner = future is None
+            if owner:                                   # nessun download in corso: lo esegue questo thread
+                future = self._downloads[key] = Future()
+        if not owner:                                   # attende il download di un'altra variante
+            return future.result()
+
+        try:
+            if self.is_fresh(original_path):            # scaricato nel frattempo da un'altra variante
+                with open(original_path, 'rb') as f:
+                    data = f.read()
+            else:
+                data = self._fetch(source)
+                os.makedirs(originals, exist_ok=True)
+                write_file(original_path, data)
+                with self._lock:
+                    self.fetches += 1
+            future.set_result(data)
+            return data
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._downloads.pop(key, None)
+
+    def _render(self, directory, source, width, fmt, path):
+        """Genera la variante (nel pool di thread), scaricando l'originale se necessario"""
+
+        try:
+            write_file(path, render_variant(self._original(directory, source), width, fmt))
+        except Exception:
+            key = poster_key(source)
+            with self._lock:
+                self._failed(key)
+            try:                                        # originale non valido: riscaricato al prossimo tentativo
+                os.remove(os.path.join(directory, 'originals', key))
+            except OSError:
+                pass
+            raise
+        return path
+
+    def stats(self):
+        """Restituisce le statistiche della cache"""
+
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'fetches': self.fetches,
+                'failures': self.failures,
+                'skipped': self.skipped,
+                'pending': len(self._pending)
+            }
+
+
+poster_store = PosterStore()        # cache dei poster condivisa dal processo
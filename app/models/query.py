@@ -1,8 +1,21 @@
 """Contiene semplici query riutilizzabili."""
 
+import os
+
 from sqlalchemy.sql import select
+from sqlalchemy.sql.expression import bindparam
+from sqlalchemy.dialects.postgresql import insert
 
 from app.models.db import connect_as, Role, get_table_names, get_table_dictionary
+from app.models.db import user_table
+from app.utils.cache import TTLCache
+
+
+# cache delle identità degli utenti (chiave: username), usata dallo user_loader di Flask-Login
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 4096))       # numero massimo di utenti in cache
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", 60))         # secondi di validità di una voce
+
+user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
 
 
 def select_all(table_name):
@@ -27,3 +40,105 @@ def select_all(table_name):
         result_set = conn.execute(sel_stmt)
 
     return result_set
+
+
+def select_user(username):
+    """Seleziona le informazioni di identità dell'utente 'username', passando dalla cache
+
+    Args:
+        username (str): l'username dell'utente
+
+    Returns:
+        dict: username, email, name, surname e isOperator dell'utente,
+            None se l'utente non esiste
+    """
+
+    user = user_cache.get(username)
+    if user is not None:                                            # cache hit
+        return user
+
+    with connect_as(Role.CLIENT) as conn:                           # connessione al database come client
+        # seleziona le informazioni sull'utente con username dato, dal database
+        sel_stmt = select([
+            user_table.c.username,
+            user_table.c.email,
+            user_table.c.name,
+            user_table.c.surname,
+            user_table.c.isOperator
+        ]).where(
+            user_table.c.username == bindparam('username')          # campo username uguale all'username dato
+        )
+        result_set = conn.execute(sel_stmt, username=username)      # esegue statement
+        row = result_set.first()                                    # al più un utente (username è PK)
+
+    if not row:                                                     # utente inesistente: non viene messo in cache
+        return None
+
+    user = dict(row)
+    user_cache.set(username, user)
+    return user
+
+
+def invalidate_user(username):
+    """Elimina dalla cache l'utente 'username' (da chiamare dopo ogni modifica dell'utente)
+
+    Args:
+        username (str): l'username dell'utente modificato
+    """
+
+    user_cache.invalidate(username)
+
+
+def insert_user_stmt():
+    """Statement di inserimento di un utente che non fallisce sui conflitti
+
+    INSERT ... ON CONFLICT DO NOTHING RETURNING username: in caso di username
+    (chiave primaria) o email (UNIQUE) già registrati non viene inserito nulla e
+    non viene restituita alcuna tupla, senza errori né transazioni annullate.
+
+    Returns:
+        Insert: statement con i parametri username, email, password, name,
+            surname, birthdate, registrationDate e isOperator
+    """
+
+    return insert(user_table).values(
+        username=bindparam('username'),
+        email=bindparam('email'),
+        password=bindparam('password'),
+        name=bindparam('name'),
+        surname=bindparam('surname'),
+        birthdate=bindparam('birthdate'),
+        registrationDate=bindparam('registrationDate'),
+        isOperator=bindparam('isOperator')
+    ).on_conflict_do_nothing().returning(user_table.c.username)
+
+
+def insert_user(conn, **user):
+    """Inserisce un nuovo utente con un solo statement, rilevando i conflitti
+
+    Solo in caso di conflitto viene eseguita una seconda query, per sapere
+    quale campo è già registrato.
+
+    Args:
+        conn: connessione al database
+        **user: valori delle colonne del nuovo utente (vedi insert_user_stmt)
+
+    Returns:
+        str: None se l'utente è stato inserito, altrimenti il campo già
+            registrato ('username' o 'email'; 'username' se l'utente in
+            conflitto è stato eliminato nel frattempo)
+    """
+
+    if conn.execute(insert_user_stmt(), **user).first():               # utente inserito
+        return None
+
+    sel_stmt = select([
+        user_table.c.username
+    ]).where(
+        (user_table.c.username == bindparam('username'))                # stesso username
+        | (user_table.c.email == bindparam('email'))                    # o stessa email
+    )
+    usernames = [ row['username'] for row in conn.execute(sel_stmt, username=user['username'], email=user['email']) ]
+    if usernames and user['username'] not in usernames:                 # solo l'email è già registrata
+        return 'email'
+    return 'username'
@@ -0,0 +1,406 @@
+"""
+Modulo contenente la mappa dei posti delle proiezioni, la relativa cache in memoria
+e gli eventi (posti venduti) inviati alle pagine di scelta dei posti aperte.
+La mappa è un bitset (un bit per posto, a 1 se il posto è occupato) per sale fino a 35x20 posti.
+"""
+
+import os
+import json
+import base64
+import threading
+
+from sqlalchemy.sql import select
+from sqlalchemy.sql.expression import bindparam, tuple_
+
+from app.models.db import connect_as, Role
+from app.models.db import projection_table, room_table, ticket_table
+from app.utils.cache import TTLCache
+from app.utils.broker import Broker
+
+
+# configurazione della cache delle mappe dei posti
+SEAT_MAP_CACHE_SIZE = int(os.getenv("SEAT_MAP_CACHE_SIZE", 1024))   # numero massimo di proiezioni in cache
+SEAT_MAP_CACHE_TTL = float(os.getenv("SEAT_MAP_CACHE_TTL", 10))     # secondi dopo i quali ricostruire dal db
+
+# configurazione degli eventi sui posti (Server-Sent Events)
+SEAT_EVENTS_QUEUE_SIZE = int(os.getenv("SEAT_EVENTS_QUEUE_SIZE", 64))               # eventi in coda per sottoscrittore
+SEAT_EVENTS_HEARTBEAT = float(os.getenv("SEAT_EVENTS_HEARTBEAT", 15))               # secondi tra due heartbeat
+SEAT_EVENTS_MAX_SUBSCRIBERS = int(os.getenv("SEAT_EVENTS_MAX_SUBSCRIBERS", 100))    # stream aperti per processo
+SEAT_EVENTS_MAX_DURATION = float(os.getenv("SEAT_EVENTS_MAX_DURATION", 300))        # secondi di durata di uno stream
+SEAT_EVENTS_RETRY_AFTER = int(os.getenv("SEAT_EVENTS_RETRY_AFTER", 30))             # secondi di attesa se rifiutato
+
+# preferenza di riga per la ricerca dei posti migliori (0 = prima fila, vicino allo schermo; 1 = ultima fila)
+BEST_SEATS_ROW_RATIO = float(os.getenv("BEST_SEATS_ROW_RATIO", 0.6))
+BEST_SEATS_ROW_WEIGHT = float(os.getenv("BEST_SEATS_ROW_WEIGHT", 1))     # peso della riga rispetto al centro
+
+SEAT_CONSTRAINT = 'ticket_seat_unique'      # vincolo di unicità (projection, row, column) su Ticket
+
+
+class SeatMap:
+    """Mappa dei posti di una proiezione, memorizzata come bitset
+
+    Il posto (row, column), 1-based, corrisponde al bit (row-1)*columns + (column-1);
+    un bit a 1 indica un posto non disponibile.
+    """
+
+    def __init__(self, rows, columns, starts_at=None, bits=0):
+        """
+        Args:
+            rows (int): numero di righe della sala
+            columns (int): numero di colonne della sala
+            starts_at (datetime): data e ora della proiezione (default: None)
+            bits (int): bitset iniziale (default: 0, tutti i posti liberi)
+        """
+
+        self.rows = rows
+        self.columns = columns
+        self.starts_at = starts_at
+        self.bits = bits
+
+    def is_valid(self, row, column):
+        """Verifica se il posto (row, column) esiste nella sala"""
+
+        return 1 <= row <= self.rows and 1 <= column <= self.columns
+
+    def _index(self, row, column):
+        """Restituisce l'indice del bit del posto (row, column), validandone le coordinate"""
+
+        if not self.is_valid(row, column):
+            raise ValueError(f'Invalid seat: ({row}, {column})')
+        return (row - 1) * self.columns + (column - 1)
+
+    def is_free(self, row, column):
+        """Verifica se il posto (row, column) è disponibile"""
+
+        return not (self.bits >> self._index(row, column)) & 1
+
+    def mark_sold(self, seats):
+        """Segna come occupati i posti dati
+
+        Args:
+            seats (list): lista di posti; esempio di seat: {'row': 1, 'column': 5}
+        """
+
+        mask = 0
+        for seat in seats:
+            mask |= 1 << self._index(seat['row'], seat['column'])
+        self.bits |= mask                   # singolo assegnamento: i lettori vedono il vecchio o il nuovo bitset
+
+    def sold_count(self):
+        """Restituisce il numero di posti occupati"""
+
+        return bin(self.bits).count('1')
+
+    def to_matrix(self, unavailable=0):
+        """Restituisce la mappa come lista di liste di booleani (True se il posto è libero)
+
+        Args:
+            unavailable (int): bitset di ulteriori posti da mostrare come non
+                disponibili, esempio: posti riservati (default: 0)
+
+        Returns:
+            list: matrice rows x columns dei posti
+        """
+
+        bits = self.bits | unavailable      # legge il bitset una sola volta
+        columns = self.columns
+        return [
+            [ not (bits >> (row * columns + col)) & 1 for col in range(columns) ]
+            for row in range(self.rows)
+        ]
+
+    def free_runs(self, unavailable=0):
+        """Restituisce, per ogni riga, le sequenze di posti liberi consecutivi
+
+        Args:
+            unavailable (int): bitset di ulteriori posti da considerare non
+                disponibili, esempio: posti riservati (default: 0)
+
+        Returns:
+            list: per ogni riga, lista di coppie (colonna iniziale, lunghezza), 1-based
+        """
+
+        bits = self.bits | unavailable
+        runs = []
+        for row in range(self.rows):
+            row_bits = (bits >> (row * self.columns)) & ((1 << self.columns) - 1)
+            row_runs = []
+            start = None
+            for col in range(self.columns + 1):                 # la colonna in più chiude l'ultima sequenza
+                free = col < self.columns and not (row_bits >> col) & 1
+                if free and start is None:
+                    start = col
+                elif not free and start is not None:
+                    row_runs.append((start + 1, col - start))
+                    start = None
+            runs.append(row_runs)
+        return runs
+
+    def pack(self, unavailable=0):
+        """Restituisce la mappa compatta: il bitset in byte little-endian, codificato in base64
+
+        Il posto (row, column) corrisponde al bit i = (row-1)*columns + (column-1), ovvero
+        al bit (i % 8) del byte (i // 8); un bit a 1 indica un posto non disponibile.
+
+        Args:
+            unavailable (int): bitset di ulteriori posti da segnare come non
+                disponibili, esempio: posti riservati (default: 0)
+
+        Returns:
+            str: bitset codificato in base64 (ceil(rows*columns / 8) byte)
+        """
+
+        bits = self.bits | unavailable
+        size = (self.rows * self.columns + 7) // 8
+        return base64.b64encode(bits.to_bytes(size, 'little')).decode('ascii')
+
+
+def find_best_seats(seat_map, size, unavailable=0,
+                    row_ratio=BEST_SEATS_ROW_RATIO, row_weight=BEST_SEATS_ROW_WEIGHT):
+    """Trova il miglior blocco di 'size' posti liberi consecutivi sulla stessa riga
+
+    Per ogni sequenza di posti liberi abbastanza lunga si considera solo la posizione
+    del blocco più vicina al centro della sala, per cui la ricerca è lineare nel numero
+    di posti. Un blocco ha punteggio (più basso è meglio) pari alla distanza del suo
+    centro dal centro dello schermo, più la distanza della riga dalla riga preferita
+    moltiplicata per 'row_weight'; entrambe le distanze sono normalizzate sulle
+    dimensioni della sala.
+
+    Args:
+        seat_map (SeatMap): mappa dei posti della proiezione
+        size (int): numero di posti richiesti
+        unavailable (int): bitset di ulteriori posti non disponibili (default: 0)
+        row_ratio (float): riga preferita, come frazione della profondità della sala
+        row_weight (float): peso della distanza dalla riga preferita
+
+    Returns:
+        list: posti del blocco migliore (esempio di seat: {'row': 1, 'column': 5}),
+            lista vuota se non esiste un blocco di 'size' posti liberi
+    """
+
+    if size < 1:
+        return []
+
+    center = (seat_map.columns + 1) / 2                         # colonna centrale (può essere a metà tra due)
+    preferred_row = 1 + row_ratio * (seat_map.rows - 1)
+    best = None                                                 # (punteggio, riga, colonna iniziale)
+
+    for row, row_runs in enumerate(seat_map.free_runs(unavailable), 1):
+        row_score = row_weight * abs(row - preferred_row) / seat_map.rows
+        for start, length in row_runs:
+            if length < size:
+                continue
+            # posizione del blocco più centrata, limitata alla sequenza di posti liberi
+            first = min(max(round(center - (size - 1) / 2), start), start + length - size)
+            score = abs(first + (size - 1) / 2 - center) / seat_map.columns + row_score
+            if best is None or score < best[0]:
+                best = (score, row, first)
+
+    if best is None:
+        return []
+    _, row, first = best
+    return [ { 'row': row, 'column': column } for column in range(first, first + size) ]
+
+
+def load_seat_map(proj_id):
+    """Costruisce la mappa dei posti della proiezione 'proj_id' leggendo dal database
+
+    Args:
+        proj_id (int): id della proiezione
+
+    Returns:
+        SeatMap: mappa dei posti, None se la proiezione non esiste
+    """
+
+    with connect_as(Role.CLIENT) as conn:                           # connessione al database come client
+        # leggi quanti posti ha la sala e quando inizia la proiezione
+        sel_stmt = select([
+            room_table.c.numberOfRows,
+            room_table.c.numberOfColumns,
+            projection_table.c.datetime
+        ]).where(
+            (room_table.c.name == projection_table.c.room)          # condizione di join
+            & (projection_table.c.id == bindparam('proj_id'))       # projection id uguale a quello selezionato
+        )
+        row = conn.execute(sel_stmt, proj_id=proj_id).first()
+        if not row:
+            return None
+
+        seat_map = SeatMap(row['numberOfRows'], row['numberOfColumns'], row['datetime'])
+
+        # trova posti occupati
+        sel_stmt = select([
+            ticket_table.c.row,
+            ticket_table.c.column
+        ]).where(
+            ticket_table.c.projection == bindparam('proj_id')
+        )
+        seat_map.mark_sold(conn.execute(sel_stmt, proj_id=proj_id))
+
+    return seat_map
+
+
+def select_conflicting_seats(conn, proj_id, seats):
+    """Restituisce, tra i posti dati, quelli già venduti per la proiezione
+
+    Il controllo è fatto dal database e riguarda solo le coppie (row, column)
+    selezionate, invece di leggere tutti i biglietti venduti della proiezione.
+
+    Args:
+        conn: connessione al database (eventualmente in una transazione)
+        proj_id (int): id della proiezione
+        seats (list): posti da verificare; esempio di seat: {'row': 1, 'column': 5}
+
+    Returns:
+        list: posti non disponibili, nello stesso formato di 'seats'
+    """
+
+    if not seats:
+        return []
+
+    sel_stmt = select([
+        ticket_table.c.row,
+        ticket_table.c.column
+    ]).where(
+        (ticket_table.c.projection == bindparam('proj_id'))                 # biglietti della proiezione selezionata
+        & tuple_(ticket_table.c.row, ticket_table.c.column).in_(            # solo i posti selezionati
+            [ (seat['row'], seat['column']) for seat in seats ]
+        )
+    )
+    result_set = conn.execute(sel_stmt, proj_id=proj_id)
+
+    return [ { 'row': ticket['row'], 'column': ticket['column'] } for ticket in result_set ]
+
+
+def is_seat_conflict(error):
+    """Verifica se un IntegrityError è dovuto alla violazione dell'unicità dei posti
+
+    Args:
+        error (IntegrityError): eccezione sollevata da sqlalchemy
+
+    Returns:
+        bool: True se un posto è già stato venduto da un'altra transazione
+    """
+
+    diag = getattr(error.orig, 'diag', None)                # diagnostica psycopg2
+    return diag is not None and diag.constraint_name == SEAT_CONSTRAINT
+
+
+class SeatMapCache:
+    """Cache delle mappe dei posti, una per proiezione
+
+    Una mappa viene ricostruita dal database quando scade il TTL (necessario se
+    più processi vendono biglietti) oppure dopo un'invalidazione esplicita. Gli
+    acquisti completati da questo processo aggiornano direttamente il bitset in cache.
+    Una ricostruzione durante la quale la proiezione viene invalidata (o riceve un
+    acquisto) non viene messa in cache, perché potrebbe non vederne gli effetti:
+    lo stato delle ricostruzioni esiste solo finché sono in corso, per cui la
+    memoria resta limitata dalla dimensione della cache.
+    """
+
+    def __init__(self, maxsize=SEAT_MAP_CACHE_SIZE, ttl=SEAT_MAP_CACHE_TTL, loader=load_seat_map):
+        """
+        Args:
+            maxsize (int): numero massimo di proiezioni in cache
+            ttl (float): secondi dopo i quali una mappa viene ricostruita
+            loader: funzione proj_id -> SeatMap (o None) che legge dal database
+        """
+
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)     # proj_id -> (generazione, SeatMap)
+        self._loader = loader
+        self._loading = {}                                  # proj_id -> [ricostruzioni in corso, versione]
+        self._generation = 0                                # incrementata dall'invalidazione globale
+        self._lock = threading.Lock()
+
+    def get(self, proj_id):
+        """Restituisce la mappa dei posti della proiezione, ricostruendola se necessario
+
+        Args:
+            proj_id (int): id della proiezione
+
+        Returns:
+            SeatMap: mappa dei posti, None se la proiezione non esiste
+        """
+
+        entry = self._cache.get(proj_id)
+        if entry is not None and entry[0] == self._generation:
+            return entry[1]
+
+        with self._lock:                                    # versione letta prima di accedere al db
+            loading = self._loading.setdefault(proj_id, [0, 0])
+            loading[0] += 1
+            version, generation = loading[1], self._generation
+
+        try:
+            seat_map = self._loader(proj_id)
+        finally:
+            with self._lock:
+                loading[0] -= 1
+                if loading[0] == 0:                         # ultima ricostruzione in corso
+                    del self._loading[proj_id]
+
+        with self._lock:
+            if seat_map is not None and loading[1] == version and self._generation == generation:
+                self._cache.set(proj_id, (generation, seat_map))
+        return seat_map
+
+    def _bump(self, proj_id):
+        """Rende non valide le ricostruzioni in corso della proiezione (con il lock acquisito)"""
+
+        loading = self._loading.get(proj_id)
+        if loading is not None:
+            loading[1] += 1
+
+    def mark_sold(self, proj_id, seats):
+        """Aggiorna la mappa in cache dopo un acquisto andato a buon fine
+
+        Args:
+            proj_id (int): id della proiezione
+            seats (list): posti venduti; esempio di seat: {'row': 1, 'column': 5}
+        """
+
+        with self._lock:
+            entry = self._cache.peek(proj_id)
+            if entry is not None:
+                entry[1].mark_sold(seats)
+            self._bump(proj_id)                             # una ricostruzione in corso potrebbe non vedere l'acquisto
+
+    def invalidate(self, proj_id=None):
+        """Invalida la mappa di una proiezione, oppure tutte se proj_id è None"""
+
+        with self._lock:
+            if proj_id is None:
+                self._generation += 1
+            else:
+                self._cache.invalidate(proj_id)
+                self._bump(proj_id)
+
+    def stats(self):
+        """Restituisce le statistiche della cache"""
+
+        return self._cache.stats()
+
+
+seat_maps = SeatMapCache()          # cache delle mappe dei posti condivisa dal processo
+
+
+# eventi sui posti, un topic per proiezione
+seat_events = Broker(maxsize=SEAT_EVENTS_QUEUE_SIZE, max_subscribers=SEAT_EVENTS_MAX_SUBSCRIBERS)
+
+
+def publish_sold(proj_id, seats):
+    """Notifica ai sottoscrittori della proiezione i posti appena venduti
+
+    L'evento è serializzato una sola volta e consegnato a tutte le pagine di scelta
+    dei posti aperte sulla proiezione (nello stesso processo), senza query al database.
+
+    Args:
+        proj_id (int): id della proiezione
+        seats (list): posti venduti; esempio di seat: {'row': 1, 'column': 5}
+
+    Returns:
+        int: numero di sottoscrittori notificati
+    """
+
+    data = json.dumps({ 'sold': [ [seat['row'], seat['column']] for seat in seats ] })
+    return seat_events.publish(proj_id, data)
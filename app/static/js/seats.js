@@ -0,0 +1,202 @@
+/**
+ * Decodes the packed seat map returned by /seats/<proj_id>/map.
+ * Bit i = (row - 1) * columns + (column - 1) is bit (i % 8) of byte (i / 8) and is set when the seat is unavailable.
+ *
+ * @param {String} occupancy base64 encoded bitset
+ * @returns {Uint8Array} bytes of the bitset
+ */
+function decodeOccupancy(occupancy) {
+  const raw = atob(occupancy);
+  const bytes = new Uint8Array(raw.length);
+  for (let i = 0; i < raw.length; i++) {
+    bytes[i] = raw.charCodeAt(i);
+  }
+  return bytes;
+}
+
+/**
+ * Creates a table cell with the checkbox of the seat (row, column).
+ *
+ * @param {Number} row
+ * @param {Number} column
+ * @param {Boolean} free
+ * @returns {HTMLTableCellElement}
+ */
+function seatCell(row, column, free) {
+  const id = row + ',' + column;
+  const cell = document.createElement('td');
+  const container = document.createElement('div');
+  container.className = 'custom-control custom-checkbox';
+
+  const checkbox = document.createElement('input');
+  checkbox.type = 'checkbox';
+  checkbox.className = 'custom-control-input';
+  checkbox.id = id;
+  checkbox.name = id;
+  checkbox.disabled = !free;
+
+  const label = document.createElement('label');
+  label.className = 'custom-control-label';
+  label.htmlFor = id;
+
+  container.appendChild(checkbox);
+  container.appendChild(label);
+  cell.appendChild(container);
+  return cell;
+}
+
+/**
+ * Draws the table of seats from the seat map, keeping the seats already selected by the user.
+ *
+ * @param {HTMLTableElement} table
+ * @param {Object} seatMap {rows, columns, encoding, occupancy}
+ */
+function drawSeats(table, seatMap) {
+  const selected = new Set(
+    Array.from(table.querySelectorAll('input:checked')).map(function(checkbox) { return checkbox.name; })
+  );
+  const bytes = decodeOccupancy(seatMap.occupancy);
+
+  const head = document.createElement('tr');
+  head.appendChild(document.createElement('th')).textContent = '#';
+  for (let column = 1; column <= seatMap.columns; column++) {
+    head.appendChild(document.createElement('th')).textContent = column;
+  }
+
+  const body = document.createDocumentFragment();
+  for (let row = 1; row <= seatMap.rows; row++) {
+    const tr = document.createElement('tr');
+    const th = tr.appendChild(document.createElement('th'));
+    th.scope = 'row';
+    th.textContent = row;
+    for (let column = 1; column <= seatMap.columns; column++) {
+      const i = (row - 1) * seatMap.columns + (column - 1);
+      const free = !((bytes[i >> 3] >> (i & 7)) & 1);
+      const cell = tr.appendChild(seatCell(row, column, free));
+      cell.querySelector('input').checked = free && selected.has(row + ',' + column);
+    }
+    body.appendChild(tr);
+  }
+
+  table.tHead.replaceChildren(head);
+  table.tBodies[0].replaceChildren(body);
+}
+
+/**
+ * Seats sold since the page was opened, as [row, column] pairs.
+ * They are applied again after every draw: a map fetched before a sale would otherwise show the seat as free.
+ */
+const soldSeats = [];
+
+/**
+ * Milliseconds before opening again a stream refused by the server (a random share is added).
+ */
+const SEAT_EVENTS_RETRY_DELAY = 30000;
+
+/**
+ * Disables the checkboxes of the given seats, marking them as sold.
+ *
+ * @param {Array} seats list of [row, column] pairs
+ */
+function markSold(seats) {
+  seats.forEach(function(seat) {
+    const checkbox = document.getElementById(seat[0] + ',' + seat[1]);
+    if (checkbox) {
+      checkbox.checked = false;
+      checkbox.disabled = true;
+    }
+  });
+}
+
+/**
+ * Fetches the seat map and redraws the table.
+ *
+ * @param {HTMLFormElement} form
+ * @returns {Promise}
+ */
+function loadSeats(form) {
+  return fetch(form.dataset.mapUrl, { credentials: 'same-origin' })
+    .then(function(response) { return response.json(); })
+    .then(function(seatMap) {
+      drawSeats(document.getElementById('seats-table'), seatMap);
+      markSold(soldSeats);
+    });
+}
+
+/**
+ * Listens to the seats sold for the projection (Server-Sent Events).
+ * The server closes the stream after a while (the browser reconnects by itself) and refuses it
+ * when too many streams are open (the stream is opened again later); after a reconnection
+ * the seat map is reloaded, since the seats sold in the meantime were not received.
+ *
+ * @param {HTMLFormElement} form
+ * @param {Boolean} reconnecting true when the map must be reloaded once the stream is open
+ */
+function listenSeats(form, reconnecting) {
+  if (!window.EventSource) {
+    return;
+  }
+
+  const source = new EventSource(form.dataset.eventsUrl);
+  source.addEventListener('open', function() {
+    if (reconnecting) {
+      loadSeats(form);
+    }
+    reconnecting = true;                            // le prossime aperture sono riconnessioni
+  });
+  source.addEventListener('error', function() {
+    if (source.readyState === EventSource.CLOSED) {
+      // stream rifiutato (503, troppi stream aperti): il browser non riprova da solo
+      setTimeout(function() { listenSeats(form, true); }, SEAT_EVENTS_RETRY_DELAY * (1 + Math.random()));
+    }
+  });
+  source.addEventListener('sold', function(event) {
+    const sold = JSON.parse(event.data).sold;
+    Array.prototype.push.apply(soldSeats, sold);    // riapplicati dopo ogni disegno della mappa
+    markSold(sold);
+  });
+  source.addEventListener('reset', function() {
+    // troppi eventi persi: riapre lo stream e ricarica la mappa
+    source.close();
+    listenSeats(form);
+    loadSeats(form);
+  });
+}
+
+/**
+ * Asks the server for the best block of free seats and selects it (deselecting the other seats).
+ *
+ * @param {HTMLFormElement} form
+ * @param {Number} size number of seats
+ */
+function selectBestSeats(form, size) {
+  const message = document.getElementById('best-seats-message');
+  fetch(form.dataset.bestUrl + '?size=' + encodeURIComponent(size), { credentials: 'same-origin' })
+    .then(function(response) { return response.ok ? response.json() : { seats: [] }; })
+    .then(function(result) {
+      if (result.seats.length === 0) {
+        message.textContent = 'No block of ' + size + ' free seats';
+        return;
+      }
+      message.textContent = '';
+      form.querySelectorAll('input[type=checkbox]').forEach(function(checkbox) { checkbox.checked = false; });
+      result.seats.forEach(function(seat) {
+        document.getElementById(seat.row + ',' + seat.column).checked = true;
+      });
+    });
+}
+
+$(document).ready(function() {
+  const form = document.getElementById('seats-form');
+  if (!form) {
+    return;
+  }
+
+  $('#best-seats').click(function() {
+    selectBestSeats(form, parseInt($('#best-seats-size').val(), 10) || 1);
+  });
+
+  // apre lo stream prima di leggere la mappa: le vendite ricevute prima del disegno sono riapplicate dopo
+  listenSeats(form);
+  loadSeats(form);
+});
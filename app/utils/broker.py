@@ -0,0 +1,135 @@
+"""Broker publish/subscribe in memoria (per processo), usato per gli eventi Server-Sent Events"""
+
+import queue
+import threading
+
+
+class BrokerFull(Exception):
+    """Raggiunto il numero massimo di sottoscrittori del broker"""
+
+
+class Subscription:
+    """Sottoscrizione ad un topic del broker
+
+    Gli eventi sono accodati in una coda limitata; se il sottoscrittore è troppo
+    lento e la coda si riempie, la sottoscrizione viene marcata come 'overflowed'
+    e non riceve più eventi (il client dovrà ricaricare lo stato completo).
+    """
+
+    def __init__(self, topic, maxsize):
+        self.topic = topic
+        self.overflowed = False
+        self._queue = queue.Queue(maxsize)
+
+    def get(self, timeout=None):
+        """Restituisce il prossimo evento, None se non arriva entro 'timeout' secondi"""
+
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def _put(self, event):
+        """Accoda l'evento senza bloccare; restituisce False se la coda è piena"""
+
+        try:
+            self._queue.put_nowait(event)
+            return True
+        except queue.Full:
+            self.overflowed = True
+            return False
+
+
+class Broker:
+    """Broker di eventi organizzati per topic (esempio: id della proiezione)
+
+    La pubblicazione di un evento costa O(numero di sottoscrittori del topic) e
+    non blocca mai: lo stesso oggetto evento (già serializzato dal chiamante)
+    viene accodato ad ogni sottoscrittore.
+    """
+
+    def __init__(self, maxsize=64, max_subscribers=None):
+        """
+        Args:
+            maxsize (int): numero massimo di eventi in coda per sottoscrittore (default: 64)
+            max_subscribers (int): numero massimo di sottoscrittori, su tutti i topic
+                (default: None, illimitato)
+        """
+
+        self.maxsize = maxsize
+        self.max_subscribers = max_subscribers
+        self._topics = {}           # topic -> set di Subscription
+        self._subscribers = 0      # sottoscrittori attivi, su tutti i topic
+        self._lock = threading.Lock()
+        self.published = 0         # eventi pubblicati
+        self.dropped = 0           # sottoscrizioni chiuse per coda piena
+        self.rejected = 0          # sottoscrizioni rifiutate (troppi sottoscrittori)
+
+    def subscribe(self, topic):
+        """Crea una sottoscrizione al topic
+
+        Returns:
+            Subscription: la nuova sottoscrizione
+
+        Raises:
+            BrokerFull: se è stato raggiunto il numero massimo di sottoscrittori
+        """
+
+        subscription = Subscription(topic, self.maxsize)
+        with self._lock:
+            if self.max_subscribers is not None and self._subscribers >= self.max_subscribers:
+                self.rejected += 1
+                raise BrokerFull(topic)
+            self._topics.setdefault(topic, set()).add(subscription)
+            self._subscribers += 1
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Elimina la sottoscrizione (non riceverà altri eventi)"""
+
+        with self._lock:
+            subscribers = self._topics.get(subscription.topic)
+            if subscribers is not None and subscription in subscribers:
+                subscribers.discard(subscription)
+                self._subscribers -= 1
+                if not subscribers:
+                    del self._topics[subscription.topic]
+
+    def publish(self, topic, event):
+        """Pubblica l'evento a tutti i sottoscrittori del topic
+
+        Args:
+            topic: topic dell'evento
+            event: evento da consegnare (esempio: stringa già serializzata)
+
+        Returns:
+            int: numero di sottoscrittori che hanno ricevuto l'evento
+        """
+
+        with self._lock:
+            subscribers = list(self._topics.get(topic, ()))
+            self.published += 1
+
+        delivered = 0
+        for subscription in subscribers:
+            if subscription._put(event):
+                delivered += 1
+            else:                                   # sottoscrittore troppo lento: viene scollegato
+                self.unsubscribe(subscription)
+                with self._lock:
+                    self.dropped += 1
+        return delivered
+
+    def stats(self):
+        """Restituisce le statistiche del broker"""
+
+        with self._lock:
+            return {
+                'topics': len(self._topics),
+                'subscribers': self._subscribers,
+                'published': self.published,
+                'dropped': self.dropped,
+                'rejected': self.rejected,
+                'maxsize': self.maxsize,
+                'max_subscribers': self.max_subscribers
+            }
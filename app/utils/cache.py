@@ -0,0 +1,122 @@
+"""Cache in memoria (per processo) con scadenza temporale e dimensione limitata"""
+
+import time
+import threading
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Cache chiave-valore con time-to-live e politica di rimpiazzamento LRU
+
+    Ogni voce scade 'ttl' secondi dopo l'inserimento; quando la cache è piena
+    viene eliminata la voce usata meno di recente. Tutte le operazioni sono
+    O(1) e protette da un lock, per cui la cache può essere condivisa tra thread.
+    """
+
+    def __init__(self, maxsize=1024, ttl=60, clock=time.monotonic):
+        """
+        Args:
+            maxsize (int): numero massimo di voci (default: 1024)
+            ttl (float): durata di una voce in secondi (default: 60)
+            clock: funzione che restituisce il tempo corrente in secondi
+                (default: time.monotonic)
+        """
+
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._data = OrderedDict()          # chiave -> (scadenza, valore), ordinate dalla meno recente
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        """Restituisce il valore associato a 'key' se presente e non scaduto
+
+        Args:
+            key: chiave da cercare
+            default: valore restituito in caso di miss (default: None)
+
+        Returns:
+            il valore in cache, oppure 'default'
+        """
+
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > self._clock():
+                self._data.move_to_end(key)         # voce usata di recente
+                self.hits += 1
+                return entry[1]
+
+            if entry is not None:                   # voce scaduta
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def peek(self, key, default=None):
+        """Come get, ma non aggiorna statistiche e ordine LRU (utile per aggiornamenti interni)
+
+        Args:
+            key: chiave da cercare
+            default: valore restituito se la voce manca o è scaduta (default: None)
+
+        Returns:
+            il valore in cache, oppure 'default'
+        """
+
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > self._clock():
+                return entry[1]
+            return default
+
+    def set(self, key, value, ttl=None):
+        """Inserisce (o sostituisce) il valore associato a 'key'
+
+        Args:
+            key: chiave
+            value: valore da memorizzare
+            ttl (float): durata specifica della voce, in secondi
+                (default: None, usa il ttl della cache)
+        """
+
+        if self.maxsize <= 0:                       # cache disabilitata
+            return
+
+        expires_at = self._clock() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:   # elimina le voci meno recenti
+                self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        """Elimina la voce associata a 'key', se presente"""
+
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """Elimina tutte le voci"""
+
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """Restituisce le statistiche della cache
+
+        Returns:
+            dict: numero di hit, miss, voci presenti e configurazione
+        """
+
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl
+            }
+
+    def __len__(self):
+        return len(self._data)
@@ -0,0 +1,99 @@
+"""Funzioni di utilità per le GET condizionali (ETag / Last-Modified) delle pagine pubbliche"""
+
+import os
+import hashlib
+from datetime import datetime
+from functools import lru_cache
+
+from flask import current_app, request, session, make_response
+from flask_login import current_user
+from werkzeug.http import is_resource_modified
+
+
+PAGE_CACHE_MAX_AGE = int(os.getenv("PAGE_CACHE_MAX_AGE", 60))      # secondi di validità delle pagine per utenti anonimi
+
+
+def make_etag(*parts):
+    """Restituisce un ETag calcolato dalle parti date (che devono avere una repr deterministica)
+
+    Args:
+        *parts: valori da cui dipende il contenuto della pagina
+
+    Returns:
+        str: digest esadecimale delle parti
+    """
+
+    return hashlib.sha1(repr(parts).encode()).hexdigest()[:20]
+
+
+@lru_cache(maxsize=64)
+def templates_version(*names):
+    """Restituisce versione e data di ultima modifica di un insieme di template
+
+    Il risultato è calcolato una volta per processo; è uguale per tutti i processi
+    che servono gli stessi file.
+
+    Args:
+        *names: nomi dei template (compresi quelli estesi)
+
+    Returns:
+        version (str): digest dei sorgenti dei template
+        last_modified (datetime): data di ultima modifica più recente dei file
+    """
+
+    sources = []
+    last_modified = datetime.fromtimestamp(0)
+    for name in names:
+        source, filename, _ = current_app.jinja_loader.get_source(current_app.jinja_env, name)
+        sources.append(source)
+        if filename:
+            last_modified = max(last_modified, datetime.utcfromtimestamp(os.path.getmtime(filename)))
+    return make_etag(*sources), last_modified
+
+
+def user_version():
+    """Restituisce la parte della versione che dipende dall'utente (i dati mostrati nella navbar)"""
+
+    if not current_user.is_authenticated:
+        return None
+    return (current_user.get_id(), current_user.name, current_user.surname, current_user.is_operator)
+
+
+def conditional_page(render, *version, last_modified=None):
+    """Restituisce la pagina generata da render(), oppure 304 se il client ne ha già la versione corrente
+
+    La versione è verificata prima di generare la pagina: con un If-None-Match (o
+    If-Modified-Since) corrispondente la pagina non viene renderizzata. L'ETag dipende
+    anche dall'utente, perché la navbar cambia dopo il login; le pagine per utenti
+    anonimi possono essere memorizzate da proxy e browser per PAGE_CACHE_MAX_AGE
+    secondi, quelle degli utenti autenticati solo dal browser, con rivalidazione.
+
+    Args:
+        render: funzione senza argomenti che restituisce la pagina
+        *version: valori da cui dipende il contenuto della pagina
+        last_modified (datetime): data (UTC) di ultima modifica del contenuto (default: None)
+
+    Returns:
+        Response: pagina (200) oppure risposta vuota (304)
+    """
+
+    if session.get('_flashes'):                             # messaggi flash da mostrare: la pagina non è riusabile
+        return make_response(render())
+
+    etag = make_etag(user_version(), *version)
+    if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        response = make_response(render())
+    else:
+        response = current_app.response_class(status=304)
+
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    if current_user.is_authenticated:
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+    else:
+        response.cache_control.public = True
+        response.cache_control.max_age = PAGE_CACHE_MAX_AGE
+    response.vary.add('Cookie')                             # pagina diversa per utenti autenticati
+    return response
@@ -0,0 +1,208 @@
+"""Rate limiter a token bucket: in memoria (per processo) oppure condiviso tra processi tramite SQLite"""
+
+import time
+import random
+import sqlite3
+import threading
+from collections import OrderedDict
+
+
+def take_token(tokens, last, now, rate, burst, cost=1):
+    """Aggiorna un token bucket e prova a consumare 'cost' token
+
+    Args:
+        tokens (float): token nel bucket all'istante 'last' (None: bucket nuovo, pieno)
+        last (float): istante dell'ultimo aggiornamento, in secondi
+        now (float): istante corrente, in secondi
+        rate (float): token aggiunti al secondo
+        burst (float): capacità del bucket
+        cost (float): token da consumare (default: 1)
+
+    Returns:
+        allowed (bool): True se i token sono stati consumati
+        tokens (float): token rimasti nel bucket
+        retry_after (float): secondi dopo i quali ci saranno abbastanza token (0 se allowed)
+    """
+
+    tokens = burst if tokens is None else min(burst, tokens + (now - last) * rate)
+    if tokens >= cost:
+        return True, tokens - cost, 0
+    return False, tokens, (cost - tokens) / rate
+
+
+class TokenBucketLimiter:
+    """Rate limiter con un token bucket per chiave (esempio: indirizzo IP), in memoria
+
+    Ogni chiave può consumare al più 'burst' token di fila, ricaricati al ritmo di
+    'rate' token al secondo. Gli aggiornamenti sono O(1); sono mantenute al più
+    'maxsize' chiavi, eliminando quelle usate meno di recente (un bucket inattivo
+    da abbastanza tempo è di nuovo pieno, quindi equivale ad un bucket assente).
+    """
+
+    def __init__(self, rate, burst, maxsize=10000, clock=time.monotonic):
+        """
+        Args:
+            rate (float): token ricaricati al secondo
+            burst (float): capacità di un bucket
+            maxsize (int): numero massimo di chiavi in memoria (default: 10000)
+            clock: funzione che restituisce il tempo corrente in secondi
+                (default: time.monotonic)
+        """
+
+        self.rate = rate
+        self.burst = burst
+        self.maxsize = maxsize
+        self._clock = clock
+        self._buckets = OrderedDict()       # chiave -> (token, istante dell'ultimo aggiornamento)
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.throttled = 0
+
+    def allow(self, key, cost=1):
+        """Consuma 'cost' token dal bucket della chiave, se disponibili
+
+        Args:
+            key: chiave del bucket
+            cost (float): token da consumare (default: 1)
+
+        Returns:
+            allowed (bool): True se l'operazione è permessa
+            retry_after (float): secondi da attendere prima di riprovare (0 se permessa)
+        """
+
+        now = self._clock()
+        with self._lock:
+            tokens, last = self._buckets.get(key, (None, now))
+            allowed, tokens, retry_after = take_token(tokens, last, now, self.rate, self.burst, cost)
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.maxsize:    # elimina le chiavi meno recenti
+                self._buckets.popitem(last=False)
+
+            if allowed:
+                self.allowed += 1
+            else:
+                self.throttled += 1
+        return allowed, retry_after
+
+    def reset(self, key):
+        """Riporta il bucket della chiave alla capacità massima"""
+
+        with self._lock:
+            self._buckets.pop(key, None)
+
+    def stats(self):
+        """Restituisce le statistiche del limiter"""
+
+        with self._lock:
+            return {
+                'backend': 'memory',
+                'keys': len(self._buckets),
+                'allowed': self.allowed,
+                'throttled': self.throttled,
+                'maxsize': self.maxsize
+            }
+
+
+class SQLiteTokenBucketLimiter:
+    """Rate limiter a token bucket condiviso tra processi, memorizzato in un database SQLite
+
+    Stessa interfaccia di TokenBucketLimiter. Ogni aggiornamento è una transazione
+    (BEGIN IMMEDIATE) su una sola riga; i bucket di nuovo pieni vengono eliminati
+    periodicamente, così la tabella resta limitata alle chiavi attive. Se il database
+    non è disponibile l'operazione viene permessa (il limiter non blocca il login).
+    """
+
+    def __init__(self, path, name, rate, burst, clock=time.time, sweep_every=1000):
+        """
+        Args:
+            path (str): path del file SQLite (condiviso dai processi)
+            name (str): nome del limiter (più limiter possono condividere il file)
+            rate (float): token ricaricati al secondo
+            burst (float): capacità di un bucket
+            clock: funzione che restituisce il tempo corrente in secondi, uguale
+                per tutti i processi (default: time.time)
+            sweep_every (int): numero medio di aggiornamenti tra due pulizie (default: 1000)
+        """
+
+        self.path = path
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+        self._sweep_every = sweep_every
+        self._local = threading.local()     # una connessione per thread
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.throttled = 0
+        self.errors = 0
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=1, isolation_level=None)     # transazioni esplicite
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS token_bucket '
+                '(name TEXT, key TEXT, tokens REAL, updated REAL, PRIMARY KEY (name, key))'
+            )
+            self._local.conn = conn
+        return conn
+
+    def allow(self, key, cost=1):
+        """Consuma 'cost' token dal bucket della chiave, se disponibili (vedi TokenBucketLimiter.allow)"""
+
+        now = self._clock()
+        try:
+            conn = self._connect()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = conn.execute(
+                    'SELECT tokens, updated FROM token_bucket WHERE name = ? AND key = ?', (self.name, str(key))
+                ).fetchone()
+                tokens, last = row if row else (None, now)
+                allowed, tokens, retry_after = take_token(tokens, last, now, self.rate, self.burst, cost)
+                conn.execute(
+                    'INSERT OR REPLACE INTO token_bucket (name, key, tokens, updated) VALUES (?, ?, ?, ?)',
+                    (self.name, str(key), tokens, now)
+                )
+                if random.random() * self._sweep_every < 1:     # elimina i bucket di nuovo pieni
+                    conn.execute(
+                        'DELETE FROM token_bucket WHERE name = ? AND updated < ?',
+                        (self.name, now - self.burst / self.rate)
+                    )
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+        except sqlite3.Error:
+            with self._lock:
+                self.errors += 1
+            return True, 0
+
+        with self._lock:
+            if allowed:
+                self.allowed += 1
+            else:
+                self.throttled += 1
+        return allowed, retry_after
+
+    def reset(self, key):
+        """Riporta il bucket della chiave alla capacità massima"""
+
+        try:
+            self._connect().execute('DELETE FROM token_bucket WHERE name = ? AND key = ?', (self.name, str(key)))
+        except sqlite3.Error:
+            with self._lock:
+                self.errors += 1
+
+    def stats(self):
+        """Restituisce le statistiche del limiter (contatori di questo processo)"""
+
+        with self._lock:
+            return {
+                'backend': 'sqlite',
+                'allowed': self.allowed,
+                'throttled': self.throttled,
+                'errors': self.errors
+            }
@@ -0,0 +1,127 @@
+"""Indice di ricerca testuale in memoria basato su trigrammi (stessa idea di pg_trgm)"""
+
+import re
+import threading
+
+
+def trigrams(text):
+    """Restituisce l'insieme dei trigrammi del testo, calcolati come in pg_trgm
+
+    Il testo viene portato in minuscolo e diviso in parole alfanumeriche; ogni parola
+    viene estesa con due spazi in testa ed uno in coda prima di estrarne i trigrammi.
+
+    Args:
+        text (str): testo da analizzare
+
+    Returns:
+        set: trigrammi del testo
+    """
+
+    grams = set()
+    for word in re.findall(r'\w+', text.lower()):
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class TrigramIndex:
+    """Indice invertito trigramma -> documenti, per la ricerca approssimata di titoli
+
+    Un documento corrisponde alla query se ne contiene il testo (come ILIKE '%query%')
+    oppure se condivide con essa abbastanza trigrammi (tolleranza agli errori di
+    battitura). I risultati sono ordinati per somiglianza decrescente.
+
+    Le sottostringhe sono cercate tra i documenti che contengono un trigramma interno
+    della query (tre caratteri alfanumerici consecutivi); le query più corte (ad esempio
+    'x' o 'it') sono cercate scorrendo tutti i documenti.
+    """
+
+    def __init__(self, documents=(), threshold=0.5):
+        """
+        Args:
+            documents: coppie (id, testo) da indicizzare (default: nessuna)
+            threshold (float): frazione minima dei trigrammi della query che un
+                documento deve contenere per essere restituito (default: 0.5)
+        """
+
+        self.threshold = threshold
+        self._texts = {}            # id -> testo in minuscolo
+        self._grams = {}            # id -> trigrammi del testo
+        self._index = {}            # trigramma -> set di id
+        self._lock = threading.Lock()
+        for doc_id, text in documents:
+            self.add(doc_id, text)
+
+    def add(self, doc_id, text):
+        """Indicizza (o re-indicizza) il documento"""
+
+        grams = trigrams(text)
+        with self._lock:
+            self._remove(doc_id)
+            self._texts[doc_id] = text.lower()
+            self._grams[doc_id] = grams
+            for gram in grams:
+                self._index.setdefault(gram, set()).add(doc_id)
+
+    def remove(self, doc_id):
+        """Elimina il documento dall'indice, se presente"""
+
+        with self._lock:
+            self._remove(doc_id)
+
+    def _remove(self, doc_id):
+        for gram in self._grams.pop(doc_id, ()):
+            docs = self._index[gram]
+            docs.discard(doc_id)
+            if not docs:
+                del self._index[gram]
+        self._texts.pop(doc_id, None)
+
+    def _substring_candidates(self, needle):
+        """Restituisce gli id dei documenti che possono contenere needle (già in minuscolo)"""
+
+        inner = { word[i:i + 3] for word in re.findall(r'\w+', needle) for i in range(len(word) - 2) }
+        if not inner:                                   # query troppo corta: tutti i documenti
+            return self._texts.keys()
+        return min((self._index.get(gram, ()) for gram in inner), key=len)
+
+    def search(self, query, limit=None):
+        """Cerca i documenti che corrispondono alla query
+
+        Args:
+            query (str): testo da cercare
+            limit (int): numero massimo di risultati (default: None, tutti)
+
+        Returns:
+            list: id dei documenti, dal più simile al meno simile
+        """
+
+        query_grams = trigrams(query)
+        needle = query.lower().strip()
+        if not needle:
+            return []
+
+        with self._lock:
+            counts = {}                                 # id -> numero di trigrammi in comune
+            for gram in query_grams:
+                for doc_id in self._index.get(gram, ()):
+                    counts[doc_id] = counts.get(doc_id, 0) + 1
+            for doc_id in self._substring_candidates(needle):
+                if needle in self._texts[doc_id]:       # sottostringa senza trigrammi in comune
+                    counts.setdefault(doc_id, 0)
+
+            scored = []
+            for doc_id, shared in counts.items():
+                # come word_similarity: quanta parte della query compare
+                score = shared / len(query_grams) if query_grams else 0
+                if needle in self._texts[doc_id]:       # sottostringa esatta: corrisponde sempre
+                    score += 1
+                elif score < self.threshold:
+                    continue
+                scored.append((-score, len(self._texts[doc_id]), doc_id))
+
+        scored.sort()
+        return [ doc_id for _, _, doc_id in scored[:limit] ]
+
+    def __len__(self):
+        return len(self._texts)
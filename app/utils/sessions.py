@@ -0,0 +1,274 @@
+"""
+Sessioni lato server: il cookie di sessione contiene solo un id opaco (casuale), mentre i dati
+della sessione sono memorizzati in uno store (SQLite condiviso tra processi, oppure in memoria)
+e vengono eliminati alla scadenza.
+"""
+
+import os
+import time
+import secrets
+import sqlite3
+import threading
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SecureCookieSession, SecureCookieSessionInterface
+
+
+SESSION_TTL = float(os.getenv("SESSION_TTL", 24 * 3600))                # secondi di validità di una sessione inattiva
+SESSION_SWEEP_INTERVAL = float(os.getenv("SESSION_SWEEP_INTERVAL", 60))  # secondi tra due pulizie delle sessioni scadute
+
+
+class MemorySessionStore:
+    """Store delle sessioni in memoria (per processo), utile in sviluppo e nei test
+
+    Come SQLiteSessionStore, le sessioni scadute sono eliminate al più ogni
+    'sweep_interval' secondi, durante un salvataggio.
+    """
+
+    def __init__(self, sweep_interval=SESSION_SWEEP_INTERVAL, clock=time.time):
+        """
+        Args:
+            sweep_interval (float): secondi minimi tra due pulizie delle sessioni scadute
+            clock: funzione che restituisce il tempo corrente in secondi (default: time.time)
+        """
+
+        self.sweep_interval = sweep_interval
+        self._clock = clock
+        self._sessions = {}         # id -> (dati serializzati, scadenza)
+        self._lock = threading.Lock()
+        self._last_sweep = clock()
+        self.swept = 0              # sessioni scadute eliminate
+
+    def load(self, sid):
+        """Restituisce i dati serializzati della sessione e la sua scadenza, None se assente o scaduta"""
+
+        with self._lock:
+            entry = self._sessions.get(sid)
+            if entry is not None and entry[1] <= self._clock():
+                del self._sessions[sid]
+                entry = None
+            return entry
+
+    def save(self, sid, data, expires_at):
+        """Memorizza (o sostituisce) i dati serializzati della sessione"""
+
+        with self._lock:
+            self._sessions[sid] = (data, expires_at)
+        if self._clock() - self._last_sweep >= self.sweep_interval:
+            self.sweep()
+
+    def delete(self, sid):
+        """Elimina la sessione"""
+
+        with self._lock:
+            self._sessions.pop(sid, None)
+
+    def sweep(self):
+        """Elimina le sessioni scadute e ne restituisce il numero"""
+
+        now = self._clock()
+        with self._lock:
+            self._last_sweep = now
+            expired = [ sid for sid, (_, expires_at) in self._sessions.items() if expires_at <= now ]
+            for sid in expired:
+                del self._sessions[sid]
+            self.swept += len(expired)
+        return len(expired)
+
+    def stats(self):
+        with self._lock:
+            return { 'backend': 'memory', 'sessions': len(self._sessions), 'swept': self.swept }
+
+
+class SQLiteSessionStore:
+    """Store delle sessioni in un database SQLite, condiviso dai processi dello stesso host
+
+    Le sessioni scadute non vengono mai restituite e sono eliminate dal database
+    al più ogni 'sweep_interval' secondi, durante un salvataggio.
+    """
+
+    def __init__(self, path, sweep_interval=SESSION_SWEEP_INTERVAL, clock=time.time):
+        """
+        Args:
+            path (str): path del file SQLite
+            sweep_interval (float): secondi minimi tra due pulizie delle sessioni scadute
+            clock: funzione che restituisce il tempo corrente in secondi (default: time.time)
+        """
+
+        self.path = path
+        self.sweep_interval = sweep_interval
+        self._clock = clock
+        self._local = threading.local()     # una connessione per thread
+        self._last_sweep = clock()
+        self.swept = 0                      # sessioni scadute eliminate
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)     # autocommit
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS session (id TEXT PRIMARY KEY, data TEXT, expires_at REAL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS session_expires_at ON session (expires_at)')
+            self._local.conn = conn
+        return conn
+
+    def load(self, sid):
+        """Restituisce i dati serializzati della sessione e la sua scadenza, None se assente o scaduta"""
+
+        return self._connect().execute(
+            'SELECT data, expires_at FROM session WHERE id = ? AND expires_at > ?', (sid, self._clock())
+        ).fetchone()
+
+    def save(self, sid, data, expires_at):
+        """Memorizza (o sostituisce) i dati serializzati della sessione"""
+
+        conn = self._connect()
+        conn.execute('INSERT OR REPLACE INTO session (id, data, expires_at) VALUES (?, ?, ?)', (sid, data, expires_at))
+        if self._clock() - self._last_sweep >= self.sweep_interval:
+            self.sweep()
+
+    def delete(self, sid):
+        """Elimina la sessione"""
+
+        self._connect().execute('DELETE FROM session WHERE id = ?', (sid,))
+
+    def sweep(self):
+        """Elimina le sessioni scadute e ne restituisce il numero"""
+
+        self._last_sweep = self._clock()
+        count = self._connect().execute('DELETE FROM session WHERE expires_at <= ?', (self._last_sweep,)).rowcount
+        self.swept += count
+        return count
+
+    def stats(self):
+        count = self._connect().execute('SELECT count(*) FROM session').fetchone()[0]
+        return { 'backend': 'sqlite', 'sessions': count, 'swept': self.swept }
+
+
+class ServerSession(SecureCookieSession):
+    """Sessione i cui dati sono memorizzati lato server (tiene traccia di modifiche e accessi)"""
+
+    def __init__(self, initial=None, sid=None, expires_at=None):
+        super().__init__(initial)
+        self.sid = sid                      # id della sessione (None: non ancora salvata)
+        self.expires_at = expires_at        # scadenza lato server della sessione
+        self.replaced_sid = None            # id sostituito da regenerate, da eliminare dallo store
+
+    def regenerate(self):
+        """Sostituisce l'id della sessione con uno nuovo, assegnato al prossimo salvataggio"""
+
+        if self.sid is not None:
+            self.replaced_sid = self.sid
+            self.sid = None
+        self.modified = True
+
+
+class ServerSessionInterface(SessionInterface):
+    """Interfaccia di sessione Flask con i dati memorizzati in uno store lato server
+
+    Il cookie contiene solo un id casuale di 256 bit. I dati (serializzati come le
+    sessioni standard di Flask) sono scritti nello store solo se modificati, oppure
+    quando è trascorsa metà della validità della sessione (per prolungarla).
+    """
+
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, store, ttl=SESSION_TTL):
+        """
+        Args:
+            store: store delle sessioni (SQLiteSessionStore o MemorySessionStore)
+            ttl (float): secondi di validità di una sessione non permanente inattiva
+        """
+
+        self.store = store
+        self.ttl = ttl
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(app.session_cookie_name)
+        if sid:
+            entry = self.store.load(sid)
+            if entry is not None:
+                data, expires_at = entry
+                return ServerSession(self.serializer.loads(data), sid, expires_at)
+        return ServerSession()
+
+    def save_session(self, app, session, response):
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        # id sostituito (login o logout): i dati non sono più raggiungibili con il vecchio id
+        if session.replaced_sid:
+            self.store.delete(session.replaced_sid)
+
+        # sessione svuotata: eliminata dallo store e dal browser
+        if not session:
+            if session.modified and (session.sid or session.replaced_sid):
+                if session.sid:
+                    self.store.delete(session.sid)
+                response.delete_cookie(app.session_cookie_name, domain=domain, path=path)
+            return
+
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        now = time.time()
+        ttl = app.permanent_session_lifetime.total_seconds() if session.permanent else self.ttl
+        refresh = session.expires_at is None or session.expires_at - now < ttl / 2
+        if not session.modified and not refresh:    # niente da scrivere
+            return
+
+        new = session.sid is None
+        if new:
+            session.sid = secrets.token_urlsafe(32)
+        self.store.save(session.sid, self.serializer.dumps(dict(session)), now + ttl)
+
+        if new or self.should_set_cookie(app, session):
+            response.set_cookie(
+                app.session_cookie_name,
+                session.sid,
+                expires=self.get_expiration_time(app, session),
+                httponly=self.get_cookie_httponly(app),
+                domain=domain,
+                path=path,
+                secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app)
+            )
+
+
+def regenerate_session(session):
+    """Assegna un nuovo id alla sessione, da chiamare quando cambia l'autenticazione (login e logout)
+
+    Impedisce la session fixation: un id ottenuto (o imposto) prima del login non dà accesso
+    alla sessione autenticata. Con le sessioni nel cookie (backend 'cookie') non fa nulla.
+
+    Args:
+        session: sessione Flask della richiesta corrente
+    """
+
+    regenerate = getattr(session, 'regenerate', None)      # session può essere il proxy di Flask
+    if regenerate is not None:
+        regenerate()
+
+
+def init_app(app):
+    """Configura l'interfaccia di sessione dell'app secondo SESSION_BACKEND
+
+    Backend disponibili: 'cookie' (sessione firmata nel cookie, default di Flask),
+    'sqlite' (file SESSION_DB, default instance/sessions.sqlite3) e 'memory'.
+
+    Raises:
+        ValueError: se il backend non è valido
+    """
+
+    backend = app.config.get('SESSION_BACKEND', 'cookie')
+    if backend == 'cookie':
+        app.session_interface = SecureCookieSessionInterface()
+    elif backend == 'sqlite':
+        os.makedirs(app.instance_path, exist_ok=True)
+        path = app.config.get('SESSION_DB') or os.path.join(app.instance_path, 'sessions.sqlite3')
+        app.session_interface = ServerSessionInterface(SQLiteSessionStore(path))
+    elif backend == 'memory':
+        app.session_interface = ServerSessionInterface(MemorySessionStore())
+    else:
+        raise ValueError(f'Invalid session backend: {backend}')
@@ -4,21 +4,25 @@ Le route sono registrate nel Blueprint 'auth', con prefisso '/auth'.
 """
 
 from datetime import date, datetime
+import math
 import functools
 
 from flask import (
-    Blueprint, request, current_app, redirect, url_for, flash, render_template, g, abort
+    Blueprint, request, current_app, redirect, url_for, flash, render_template, g, abort, session
 )
 from flask_login import current_user, login_user, logout_user, login_required
 from sqlalchemy.sql import select
 from sqlalchemy.sql.expression import bindparam
-from werkzeug.security import generate_password_hash, check_password_hash
 from is_safe_url import is_safe_url
 
 from app.models.db import connect_as, Role
 from app.models.db import user_table
 from app.models.db import User
+from app.models.query import insert_user
+from app.models.passwords import password_hasher, HashingBusy
+from app.models.limits import login_ip_limiter, login_email_limiter
 from app.utils.utils import valid_email
+from app.utils.sessions import regenerate_session
 
 
 bp = Blueprint('auth', __name__, url_prefix='/auth')    # Blueprint per le route di autenticazione
@@ -67,53 +71,30 @@ def register():
         elif not valid_email(email):            # email non valida
             error = 'Email not valid'
         else:
-            # inserimento del nuovo utente nel database
+            try:
+                hashed_password = password_hasher.hash(password)    # calcolato prima di occupare una connessione
+            except HashingBusy:
+                error = 'Server busy, try again later'
+
+        if not error:
+            # inserimento del nuovo utente nel database: un solo statement, che rileva
+            # anche i conflitti con registrazioni concorrenti (ON CONFLICT DO NOTHING)
             with connect_as(Role.CLIENT) as conn:               # connessione al database come client
-                try:
-                    # verifica che username e email non siano già registrati
-                    sel_stmt = select([
-                        user_table.c.username,
-                        user_table.c.email
-                    ]).where(
-                        (user_table.c.username == bindparam('username'))    # stesso username
-                        | (user_table.c.email == bindparam('email'))        # o stessa email
-                    )
-                    results = conn.execute(sel_stmt, username=username, email=email)
-                    row = results.first()                                   # al più un utente
-                    if row:
-                        if username == row['username']:                     # username già registrato
-                            error = f'Username {username} already registered'
-                        else:                                               # email già registrata
-                            error = f'Email {email} already registered'
-                        raise
-
-                    ins_stmt = user_table.insert().values(
-                        username=bindparam('username'),
-                        email=bindparam('email'),
-                        password=bindparam('password'),
-                        name=bindparam('name'),
-                        surname=bindparam('surname'),
-                        birthdate=bindparam('birthdate'),
-                        registrationDate=bindparam('registrationDate'),
-                        isOperator=bindparam('isOperator')
-                    )
-
-                    conn.execute(
-                        ins_stmt,
-                        username=username,
-                        email=email,
-                        password=generate_password_hash(password),
-                        name=name,
-                        surname=surname,
-                        birthdate=birthdate,
-                        registrationDate=datetime.now().date(),
-                        isOperator=False
-                    )
-
-                except:
-                    if not error:       # IntegrityError
-                        # un nuovo utente si è registrato nel fattempo con gli stessi username o password
-                        error = 'Username {username} or {email} already registered'
+                conflict = insert_user(
+                    conn,
+                    username=username,
+                    email=email,
+                    password=hashed_password,
+                    name=name,
+                    surname=surname,
+                    birthdate=birthdate,
+                    registrationDate=datetime.now().date(),
+                    isOperator=False
+                )
+            if conflict == 'username':                          # username già registrato
+                error = f'Username {username} already registered'
+            elif conflict == 'email':                           # email già registrata
+                error = f'Email {email} already registered'
 
         if not error:                                   # nessun problema: utente registrato
             current_app.logger.info('Registration succeded: %s', username)
@@ -152,9 +133,16 @@ def login():
         password = request.form.get('password', None)
         remember_me = bool(request.form.get('remember-me', default=False))
 
+        # limiti di frequenza per IP e per email, verificati prima di database e hashing
+        allowed, retry_after = login_ip_limiter.allow(request.remote_addr)
+        if allowed and email:
+            allowed, retry_after = login_email_limiter.allow(email.strip().lower())
+
         # validazione input e controllo email e password corretti
         error = None
-        if not email:                                       # email mancante
+        if not allowed:                                     # troppi tentativi
+            error = f'Too many login attempts, try again in {math.ceil(retry_after)} seconds'
+        elif not email:                                     # email mancante
             error = 'Email required'
         elif not password:                                  # password mancante
             error = 'Password required'
@@ -170,13 +158,21 @@ def login():
                 row = results.first()                                   # al più un utente
                 hashed_password = row['password'] if row else None      # preleva password hashata
 
-            if not hashed_password:                                     # utente non trovato
-                error = f'Email {email} not registered'
-            elif not check_password_hash(hashed_password, password):    # hash delle password non matchano
-                error = 'Incorrect password'
+            try:
+                if not hashed_password:                                 # utente non trovato
+                    error = f'Email {email} not registered'
+                elif not password_hasher.check(hashed_password, password):  # hash delle password non matchano
+                    error = 'Incorrect password'
+            except HashingBusy:                                         # troppi login in corso: rifiuta subito
+                error = 'Server busy, try again later'
+
+            if not error and password_hasher.needs_rehash(hashed_password):
+                rehash_password(email, hashed_password, password)       # hash con metodo (o costo) obsoleto
 
         if not error:                                                   # login è andato a buon fine
+            login_email_limiter.reset(email.strip().lower())            # azzera i tentativi falliti
             user = user_by_email(email)                                 # ottieni Flask-Login User tramite email
+            regenerate_session(session)                                 # nuovo id di sessione (session fixation)
             login_user(user, remember=remember_me)                      # effettua il login dell'utente
             current_app.logger.info('Login succeded: %s', user.get_id())
 
@@ -192,11 +188,43 @@ def login():
         # errore di login
         current_app.logger.info('Login failed: %s', error)
         flash(error, 'danger')                                          # flasha l'errore sulla pagina di login
+        if not allowed:                                                 # 429 TOO MANY REQUESTS
+            return render_template('auth/login.html'), 429, { 'Retry-After': str(math.ceil(retry_after)) }
 
     # GET o errore di login
     return render_template('auth/login.html')                           # renderizza pagina con form di registrazione
 
 
+def rehash_password(email, old_hash, password):
+    """Aggiorna l'hash della password dell'utente al metodo (e costo) corrente
+
+    Da chiamare dopo un login andato a buon fine, quando la password in chiaro è
+    disponibile. L'hash viene sostituito solo se nel frattempo non è cambiato (ad
+    esempio per un cambio password concorrente); se il servizio di hashing è saturo
+    l'aggiornamento è rimandato al prossimo login.
+
+    Args:
+        email (str): email dell'utente
+        old_hash (str): hash letto durante il login
+        password (str): password in chiaro
+    """
+
+    try:
+        new_hash = password_hasher.hash(password)
+    except HashingBusy:
+        return
+
+    upd_stmt = user_table.update().where(
+        (user_table.c.email == bindparam('email_'))                     # utente che ha effettuato il login
+        & (user_table.c.password == bindparam('old_hash'))              # hash non modificato nel frattempo
+    ).values(
+        password=bindparam('new_hash')
+    )
+    with connect_as(Role.CLIENT) as conn:                               # connessione al database come client
+        conn.execute(upd_stmt, email_=email, old_hash=old_hash, new_hash=new_hash)
+    current_app.logger.info('Password rehashed: %s', email)
+
+
 @bp.route('/logout')
 def logout():
     """Route che gestisce il logout
@@ -212,6 +240,7 @@ def logout():
 
     user_username = current_user.get_id()                       # salva username dell'utente
     logout_user()                                               # esegue il logout dell'utente
+    regenerate_session(session)                                 # nuovo id di sessione
 
     current_app.logger.info('Logout: %s', user_username)        # logga il logout dell'utente
 
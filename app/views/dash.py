@@ -5,18 +5,26 @@ Le route sono registrate nel Blueprint 'dash', con prefisso '/dashboard'.
 
 from datetime import datetime, date, timedelta
 
-from flask import Blueprint, render_template, abort, request, current_app, flash, redirect, url_for
+from flask import Blueprint, render_template, abort, request, current_app, flash, redirect, url_for, jsonify
 from sqlalchemy.sql import select, desc
 from sqlalchemy.sql.expression import bindparam, func, case
 from sqlalchemy.exc import IntegrityError, ProgrammingError
-from werkzeug.security import generate_password_hash
 
 from app.models.db import connect_as, Role, get_table_names, get_table_dictionary
-from app.models.query import select_all
+from app.models.db import get_pool_stats, get_request_stats
+from app.models.query import select_all, invalidate_user, user_cache
+from app.models.seats import seat_maps, seat_events
+from app.models.catalog import catalog_cache, movie_details
+from app.models.posters import poster_store
+from app.models.holds import seat_holds
+from app.models.booking import contention, booking_executor
+from app.models.passwords import password_hasher, HashingBusy
+from app.models.limits import login_ip_limiter, login_email_limiter
 from app.models.db import (
     user_table, movie_table, projection_table,
     ticket_table, purchase_table, actor_movie_table,
-    genre_table, payment_method_table, cast_member_table
+    genre_table, payment_method_table, cast_member_table,
+    room_table, nation_table
 )
 from app.views.auth import operator_required
 
@@ -59,7 +67,10 @@ def prepare_tuple(table_name, new_tuple):
     # trasforma dati provenienti da form che non sono nel formato corretto per il database
     if table_name == user_table.name:                   # tabella User
         if 'password' in new_tuple:
-            new_tuple['password'] = generate_password_hash(new_tuple['password'])
+            try:
+                new_tuple['password'] = password_hasher.hash(new_tuple['password'])
+            except HashingBusy:                         # servizio di hashing saturo
+                abort(503)
         if 'birthdate' in new_tuple:
             new_tuple['birthdate'] = datetime.strptime(new_tuple['birthdate'], '%Y-%m-%d').date()
         new_tuple['isOperator'] = 'isOperator' in new_tuple
@@ -102,6 +113,30 @@ def try_execute(query):
     return result_set, error                # restituisce tuple risultanti ed eventuale messaggio di errore
 
 
+def invalidate_caches(table_name):
+    """Invalida le cache in memoria che dipendono dalla tabella 'table_name'
+
+    Da chiamare dopo ogni scrittura andata a buon fine sulla tabella.
+
+    Args:
+        table_name (str): nome della tabella modificata
+    """
+
+    # mappe dei posti: dipendono da biglietti, acquisti, proiezioni e sale
+    if table_name in (ticket_table.name, purchase_table.name, projection_table.name, room_table.name):
+        seat_maps.invalidate()
+
+    # catalogo dei film in programmazione: dipende da film, proiezioni e dai valori delle faccette
+    if table_name in (movie_table.name, projection_table.name, genre_table.name, nation_table.name,
+                      cast_member_table.name, actor_movie_table.name, room_table.name):
+        catalog_cache.invalidate()
+
+    # dettagli dei film: dipendono da film, attori e membri del cast (l'UPDATE di un film è
+    # rilevato anche dalla versione della riga, ma non le modifiche al cast)
+    if table_name in (movie_table.name, cast_member_table.name, actor_movie_table.name):
+        movie_details.invalidate()
+
+
 # lista di dizionari rappresentanti le fasce di età
 AGE_GROUPS = [
     { 'name': '0-19', 'start': 0, 'end': 19 },
@@ -309,6 +344,9 @@ def insert_data(table_name):
             # esegue la query gestendo eventuali eccezioni
             _, error = try_execute(lambda: conn.execute(ins_stmt, [new_tuple]))
 
+        if not error:
+            invalidate_caches(table_name)                       # invalida le cache che dipendono dalla tabella
+
         flash(error or 'Success', 'danger' if error else 'success')
         return error or redirect(url_for('dash.insert_data', table_name=table_name))
 
@@ -369,6 +407,11 @@ def update_data(table_name):
         with connect_as(Role.OPERATOR) as conn:                     # connessione al database come operator
             _, error = try_execute(lambda: conn.execute(upd_stmt, **param_dict))
 
+        if not error:
+            invalidate_caches(table_name)                           # invalida le cache che dipendono dalla tabella
+        if table_name == user_table.name:                           # utente modificato
+            invalidate_user(param_dict['username_old'])             # invalida i suoi dati in cache
+
         return error or redirect(url_for('dash.view_table', table_name=table_name))
 
     else:                                                           # GET -> renderizza form
@@ -442,6 +485,11 @@ def delete_row(table_name):
     if error:                                                               # in caso di errore
         return error                                                        # mostralo a schermo
 
+    if request.method == 'POST':                                            # tupla cancellata
+        invalidate_caches(table_name)                                       # invalida le cache che dipendono dalla tabella
+        if table_name == user_table.name:                                   # utente cancellato
+            invalidate_user(param_dict['username'])                         # invalida i suoi dati in cache
+
     if request.method == 'GET':                                             # GET -> pagina di conferma
         return render_template('dash/delete.html',                          # renderizza pagina di conferma
                                table_name=table_name,                       # nome tabella
@@ -645,3 +693,42 @@ def statistics():
                            age_popularity_by_genre=age_popularity_by_genre,
                            popular_actors=popular_actors,
                            popular_directors=popular_directors)
+
+
+@bp.route('/metrics')
+@operator_required
+def metrics():
+    """Route che espone le metriche interne dell'applicazione in formato JSON
+
+    URL: /metrics
+
+    La route accetta 1 metodo, GET.
+    GET: restituisce le statistiche dei pool di connessioni,
+        dei checkout per richiesta, delle cache e della contesa sugli acquisti
+
+    Returns:
+        Response: documento JSON con le metriche
+    """
+
+    session_store = getattr(current_app.session_interface, 'store', None)     # None con sessioni nel cookie
+    return jsonify({
+        'pools': get_pool_stats(),              # statistiche dei pool di connessioni per ruolo
+        'requests': get_request_stats(),        # checkout dai pool per richiesta
+        'caches': {
+            'users': user_cache.stats(),        # hit/miss della cache degli utenti
+            'seat_maps': seat_maps.stats(),     # hit/miss della cache delle mappe dei posti
+            'catalog': catalog_cache.stats(),   # hit/miss e scadenza del catalogo dei film in programmazione
+            'movies': movie_details.stats(),    # hit/miss della cache dei dettagli dei film
+            'posters': poster_store.stats()     # varianti dei poster servite dal disco e generate
+        },
+        'seat_holds': seat_holds.stats(),       # posti riservati in attesa di pagamento
+        'contention': contention.stats(),       # tentativi, abort e attese degli acquisti per proiezione
+        'booking_queue': booking_executor.stats(),  # profondità delle code degli acquisti per proiezione
+        'seat_events': seat_events.stats(),         # sottoscrittori degli eventi sui posti
+        'password_hashing': password_hasher.stats(),    # operazioni di hashing in corso e rifiutate
+        'login_limits': {                               # tentativi di login permessi e rifiutati
+            'ip': login_ip_limiter.stats(),
+            'email': login_email_limiter.stats()
+        },
+        'sessions': session_store.stats() if session_store else None   # sessioni lato server
+    })
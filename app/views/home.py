@@ -4,22 +4,33 @@ Le route sono registrate nel Blueprint 'home' (e sono senza prefisso url).
 """
 
 import time
-import random
 from datetime import datetime
 
 from flask import (
-    Blueprint, render_template, request, abort, session, current_app, redirect, url_for, flash
+    Blueprint, render_template, request, abort, current_app, redirect, url_for, flash, Response, jsonify
 )
 from flask_login import login_required, current_user
 from sqlalchemy.sql import select
 from sqlalchemy.sql.expression import bindparam
+from sqlalchemy.exc import IntegrityError
 
 from app.models.db import connect_as, Role
+from app.utils.http import conditional_page, templates_version
+from app.models.seats import seat_maps, select_conflicting_seats, is_seat_conflict
+from app.models.seats import seat_events, publish_sold, find_best_seats, SEAT_EVENTS_HEARTBEAT
+from app.models.seats import SEAT_EVENTS_MAX_DURATION, SEAT_EVENTS_RETRY_AFTER
+from app.utils.broker import BrokerFull
+from app.models.holds import seat_holds
+from app.models.checkout import make_checkout_token, load_checkout_token, CheckoutExpired, InvalidCheckout
+from app.models.catalog import catalog_cache, FACETS
+from app.models.catalog import movie_details, select_movie_projections
+from app.models.booking import contention, is_retryable, backoff_delay, PURCHASE_RETRY_DEADLINE
+from app.models.booking import connect_for_purchase, lock_projection
+from app.models.booking import booking_executor, BookingRejected
 from app.models.db import (
-    movie_table, projection_table, room_table,
-    ticket_table, purchase_table, cast_member_table,
-    actor_movie_table, payment_circuit_table,
-    payment_method_table, genre_table
+    movie_table, projection_table,
+    ticket_table, purchase_table,
+    payment_circuit_table, payment_method_table
 )
 
 
@@ -39,7 +50,8 @@ def home():
         str: html da renderizzare nel browser (homepage)
     """
 
-    return render_template('home/index.html')
+    version, last_modified = templates_version('home/index.html', 'home/layout.html', 'layout.html')
+    return conditional_page(lambda: render_template('home/index.html'), version, last_modified=last_modified)
 
 
 @bp.route('/movies')
@@ -58,52 +70,31 @@ def movies():
     """
 
     # preleva i valori dei parametri GET (necessari per implementare filtro)
-    input_genres = request.args.getlist('genre', None)      # generi selezionati
     input_search = request.args.get('search', None, str)    # testo nella barra di ricerca
-    search_sql = ''
-
-    # carica film dal database
-    with connect_as(Role.CLIENT) as conn:                   # connessione al database come client
-
-        # seleziona i generi disponibili
-        sel_stmt = select([
-            genre_table.c.name
-        ])
-        results = conn.execute(sel_stmt)                    # effettua query
-        all_genres = results.fetchall()                     # salva lista generi
-
-        # seleziona film con proiezioni future programmate (con eventuale filtro per genere)
-        sel_stmt = select([
-            movie_table.c.id,
-            movie_table.c.title,
-            movie_table.c.plot,
-            movie_table.c.genre,
-            movie_table.c.poster
-        ]).where(
-            (projection_table.c.movie == movie_table.c.id)      # condizione di join
-            & (projection_table.c.datetime >= datetime.now())   # solo film in programmazione nel futuro
-        ).distinct()                                            # rimuove duplicati
-
-        if len(input_genres) > 0:                               # se ci sono generi selezionati
-            sel_stmt = sel_stmt.where(                          # film dei generi selezionati
-                movie_table.c.genre.in_(bindparam('genres', expanding=True))    # sql IN
-            )
-
-        if input_search:                                        # se c'è del testo nella barra di ricerca
-            search_sql = f'%{input_search}%'                    # va bene che la query string sia in mezzo
-            sel_stmt = sel_stmt.where(                          # film con titolo che matcha la query string
-                (movie_table.c.title.ilike(bindparam('search_title')))
-            )
-
-        # esegui query e prendi i risultati
-        results = conn.execute(sel_stmt, genres=input_genres, search_title=search_sql)
-        movies = results.fetchall()
-
-    return render_template('home/movies.html',                  # renderizza lista film
-                           movies=movies,                       # lista film
-                           genres=all_genres,                   # lista generi
-                           selected_genres=input_genres,        # genere selezionato
-                           search_field=input_search)           # stringa di ricerca
+    input_filters = {                                       # valori selezionati per ogni faccetta
+        facet: [ value for value in request.args.getlist(facet) if value ]
+        for facet in FACETS if facet != 'year'
+    }
+    input_years = (                                         # intervallo degli anni di uscita
+        request.args.get('year_from', None, int),
+        request.args.get('year_to', None, int)
+    )
+
+    # film in programmazione dalla cache del catalogo; filtri e conteggi sono applicati in memoria
+    # la pagina dipende solo dal catalogo e dai parametri: con un ETag valido non viene nemmeno filtrato
+    catalog = catalog_cache.get()
+
+    def render():
+        movies, counts = catalog.filter(filters=input_filters, search=input_search, years=input_years)
+        return render_template('home/movies.html',              # renderizza lista film
+                               movies=movies,                   # lista film
+                               counts=counts,                   # numero di film per valore di ogni faccetta
+                               selected=input_filters,          # valori selezionati per ogni faccetta
+                               years=input_years,               # intervallo degli anni selezionato
+                               search_field=input_search)       # stringa di ricerca
+
+    version, _ = templates_version('home/movies.html', 'home/macros.html', 'home/layout.html', 'layout.html')
+    return conditional_page(render, version, catalog.version, request.query_string, last_modified=catalog.loaded_at)
 
 
 @bp.route('/movies/<int:movie_id>')
@@ -122,47 +113,22 @@ def movie(movie_id):
         str: html da renderizzare nel browser
     """
 
-    # carica film, attori, regista e proiezioni dal database
+    # una sola query per richiesta: proiezioni future e versione del film; dati del film,
+    # regista e attori sono letti dalla cache (e dal database solo se cambiati o scaduti)
     with connect_as(Role.CLIENT) as conn:                           # connessione al database come client
-        # seleziona film (+ info sul regista) con id uguale a movie_id
-        sel_stmt = select([
-            movie_table,
-            cast_member_table.c.name.label('directorName'),
-            cast_member_table.c.surname.label('directorSurname')
-        ]).where(
-            (movie_table.c.director == cast_member_table.c.id)      # condizione di join
-            & (movie_table.c.id == bindparam('movie_id'))           # stesso id
-        )
-        result_set = conn.execute(sel_stmt, movie_id=movie_id)      # esegui query
-        movie = result_set.first()                                  # al più uno (un solo regista e movie_id è PK)
-
-        # seleziona attori del film
-        sel_stmt = select([
-            cast_member_table
-        ]).where(
-            (cast_member_table.c.id == actor_movie_table.c.actor)   # condizione di join
-            & (actor_movie_table.c.movie == bindparam('movie_id'))  # stesso id
-        )
-        result_set = conn.execute(sel_stmt, movie_id=movie_id)      # esegui query
-        actors = result_set.fetchall()
+        result_set = conn.execute(select_movie_projections(), movie_id=movie_id, now=datetime.now())
+        rows = result_set.fetchall()                                # nessuna riga se il film non esiste
+        details = movie_details.get(conn, movie_id, rows[0]['version']) if rows else None
 
-        # seleziona proiezioni programmate per il film
-        sel_stmt = select([
-            projection_table.c.id,
-            projection_table.c.room,
-            projection_table.c.datetime,
-            projection_table.c.price
-        ]).where(
-            (projection_table.c.movie == bindparam('movie_id'))     # proiezioni del film richiesto
-            & (projection_table.c.datetime >= datetime.now())       # solo proiezioni future
-        ).order_by(
-            projection_table.c.datetime                             # ordinate per data
-        )
-        result_set = conn.execute(sel_stmt, movie_id=movie_id)      # esegui query
-        projections = result_set.fetchall()
+    movie = details['movie'] if details else None
+    actors = details['actors'] if details else []
+    projections = [ row for row in rows if row['id'] is not None ]  # film senza proiezioni future: riga a NULL
 
-    # renderizza pagina con dettagli film
-    return render_template('home/movie.html', movie=movie, actors=actors, projections=projections)
+    # renderizza pagina con dettagli film (304 se il client ha già la versione corrente)
+    return conditional_page(
+        lambda: render_template('home/movie.html', movie=movie, actors=actors, projections=projections),
+        movie, actors, [ tuple(row) for row in projections ]
+    )
 
 
 @bp.route('/seats/<int:proj_id>')
@@ -182,45 +148,140 @@ def seats(proj_id):
         str: html da renderizzare nel browser (selezionatore posti)
     """
 
-    error = None
+    seat_map = seat_maps.get(proj_id)                               # mappa dei posti (cache o database)
+    if not seat_map or seat_map.starts_at < datetime.now():         # solo proiezioni esistenti e future
+        abort(404)
 
-    with connect_as(Role.CLIENT) as conn:                           # connessione al database come client
-        # leggi quanti posti ha la sala
-        sel_stmt = select([
-            room_table.c.numberOfRows,
-            room_table.c.numberOfColumns
-        ]).where(
-            (room_table.c.name == projection_table.c.room)          # condizione di join
-            & (projection_table.c.id == bindparam('proj_id'))       # projection id uguale a quello selezionato
-            & (projection_table.c.datetime >= datetime.now())       # solo proiezioni future
-        )
-        results = conn.execute(sel_stmt, proj_id=proj_id)
-        row = results.first()
-        if not row:
-            abort(404)
+    # renderizza selezionatore posti (la tabella dei posti è disegnata dal browser, vedi seats_map)
+    return render_template('home/seats.html', proj_id=proj_id)
 
-        row_count = row['numberOfRows']                             # numero di righe sala
-        col_count = row['numberOfColumns']                          # numero di colonne sala
 
-        seats = [[True]*col_count for _ in range(row_count)]        # matrice dei posti (sale rettangolari)
+@bp.route('/seats/<int:proj_id>/map')
+@login_required
+def seats_map(proj_id):
+    """Route che restituisce la mappa dei posti della proiezione in formato JSON compatto
 
-        # trova posti occupati
-        sel_stmt = select([
-            ticket_table.c.row,
-            ticket_table.c.column
-        ]).where(
-            (purchase_table.c.projection == bindparam('proj_id'))
-            & (ticket_table.c.purchase == purchase_table.c.id)
-        )
-        results = conn.execute(sel_stmt, proj_id=proj_id)
-        for result in results:              # per ogni biglietto venduto
-            # riga e colonna occupata (-1 perchè posti sono 1-based, mentre seats list e 0-based)
-            row = result['row'] - 1
-            col = result['column'] - 1
-            seats[row][col] = False         # aggiorna matrice dei posti (segnala posto occupato)
+    URL: /seats/<int:proj_id>/map
+
+    La route accetta 1 metodo, GET.
+    GET: restituisce le dimensioni della sala e l'occupazione dei posti
+        (venduti o riservati da altri utenti) come bitset, vedi SeatMap.pack;
+        esempio: {"rows": 2, "columns": 4, "encoding": "base64", "occupancy": "gQ=="}
+
+    Args:
+        proj_id (int): id della proiezione
+
+    Returns:
+        Response: documento JSON con la mappa dei posti
+    """
+
+    seat_map = seat_maps.get(proj_id)                               # mappa dei posti (cache o database)
+    if not seat_map or seat_map.starts_at < datetime.now():         # solo proiezioni esistenti e future
+        abort(404)
+
+    # i posti riservati da altri utenti (checkout in corso) sono segnati come non disponibili
+    held = seat_holds.held_bits(proj_id, seat_map.columns, exclude_holder=current_user.get_id())
+
+    response = jsonify({
+        'rows': seat_map.rows,                                      # numero di righe della sala
+        'columns': seat_map.columns,                                # numero di colonne della sala
+        'encoding': 'base64',                                       # bitset little-endian in base64
+        'occupancy': seat_map.pack(unavailable=held)                # un bit per posto, 1 se non disponibile
+    })
+    response.headers['Cache-Control'] = 'no-store'                  # cambia ad ogni acquisto/hold
+    return response
+
+
+@bp.route('/seats/<int:proj_id>/best')
+@login_required
+def seats_best(proj_id):
+    """Route che suggerisce il miglior blocco di posti liberi consecutivi
+
+    URL: /seats/<int:proj_id>/best?size=<int>
+
+    La route accetta 1 metodo, GET.
+    GET: restituisce in formato JSON i 'size' posti consecutivi più vicini al centro
+        della sala e alla riga preferita (vedi find_best_seats); esempio:
+        {"seats": [{"row": 7, "column": 9}, {"row": 7, "column": 10}]}.
+        La lista è vuota se non esiste un blocco libero abbastanza grande.
+
+    Args:
+        proj_id (int): id della proiezione
+
+    Returns:
+        Response: documento JSON con i posti suggeriti
+    """
+
+    seat_map = seat_maps.get(proj_id)                               # mappa dei posti (cache o database)
+    if not seat_map or seat_map.starts_at < datetime.now():         # solo proiezioni esistenti e future
+        abort(404)
+
+    size = request.args.get('size', 1, int)                         # numero di posti richiesti
+    if not 1 <= size <= seat_map.columns:
+        abort(400)
+
+    # i posti riservati da altri utenti (checkout in corso) non possono essere suggeriti
+    held = seat_holds.held_bits(proj_id, seat_map.columns, exclude_holder=current_user.get_id())
+    return jsonify({ 'seats': find_best_seats(seat_map, size, unavailable=held) })
+
+
+@bp.route('/seats/<int:proj_id>/events')
+@login_required
+def seats_events(proj_id):
+    """Route che invia in tempo reale i posti venduti della proiezione (Server-Sent Events)
+
+    URL: /seats/<int:proj_id>/events
+
+    La route accetta 1 metodo, GET.
+    GET: restituisce uno stream text/event-stream con un evento 'sold' per ogni
+        acquisto completato (esempio di dati: {"sold": [[1, 5], [1, 6]]}), un
+        heartbeat ogni SEAT_EVENTS_HEARTBEAT secondi e un evento 'reset' se il
+        client è rimasto indietro e deve ricaricare la mappa dei posti.
+        Ogni stream occupa un thread del server: lo stream è chiuso dopo
+        SEAT_EVENTS_MAX_DURATION secondi (il browser si riconnette) e, oltre
+        SEAT_EVENTS_MAX_SUBSCRIBERS stream aperti nel processo, la richiesta è
+        rifiutata con 503 e Retry-After
 
-    # renderizza selezionatore posti
-    return render_template('home/seats.html', seats=seats, proj_id=proj_id)
+    Args:
+        proj_id (int): id della proiezione
+
+    Returns:
+        Response: stream di eventi
+    """
+
+    seat_map = seat_maps.get(proj_id)                               # mappa dei posti (cache o database)
+    if not seat_map or seat_map.starts_at < datetime.now():         # solo proiezioni esistenti e future
+        abort(404)
+
+    try:
+        subscription = seat_events.subscribe(proj_id)
+    except BrokerFull:                                              # troppi stream aperti: 503 SERVICE UNAVAILABLE
+        return Response(status=503, headers={ 'Retry-After': str(SEAT_EVENTS_RETRY_AFTER) })
+
+    # lo stream non usa il database: le connessioni della richiesta sono rilasciate prima dell'invio
+    def stream():
+        deadline = time.monotonic() + SEAT_EVENTS_MAX_DURATION
+        try:
+            yield 'retry: 3000\n\n'                                 # attesa del browser prima di riconnettersi
+            while True:
+                if subscription.overflowed:                         # eventi persi: il client ricarica la mappa
+                    yield 'event: reset\ndata: {}\n\n'
+                    return
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:                                  # durata massima: il browser si riconnette
+                    return
+                data = subscription.get(timeout=min(SEAT_EVENTS_HEARTBEAT, remaining))
+                if data is None:
+                    yield ': heartbeat\n\n'                         # commento SSE: mantiene aperta la connessione
+                else:
+                    yield f'event: sold\ndata: {data}\n\n'
+        finally:                                                    # client disconnesso
+            seat_events.unsubscribe(subscription)
+
+    return Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'                                   # disabilita il buffering dei proxy (nginx)
+    })
 
 
 @bp.route('/checkout', methods=('POST',))
@@ -246,8 +307,11 @@ def checkout():
         if (',' in seat) and (request.form[seat] == 'on'):  # verifica che siano davvero selezionati
             # calcola riga e colonna in base all'id del posto
             row_col = seat.split(',')                       # divide id posto (row,col)
-            row = int(row_col[0])                           # l'indice di riga è il primo
-            column = int(row_col[1])                        # l'indice di colonna è il secondo
+            try:
+                row = int(row_col[0])                       # l'indice di riga è il primo
+                column = int(row_col[1])                    # l'indice di colonna è il secondo
+            except ValueError:                              # id posto non valido
+                abort(400)                                  # 400 BAD REQUEST
             seats.append({                                  # aggiunge posto alla lista dei posti
                 'row': row,
                 'column': column
@@ -276,8 +340,22 @@ def checkout():
             ticket_price = row['price']         # prezzo biglietto
             ticket_datetime = row['datetime']   # data e ora
 
-    # recupera i metodi di pagamento
+    validate_seats(int(request.form['proj_id']), seats)     # solo posti della sala della proiezione
+
+    # riserva temporaneamente i posti selezionati fino al pagamento
+    if not error:
+        held_seats = seat_holds.acquire(int(request.form['proj_id']), seats, current_user.get_id())
+        if held_seats:                          # posti riservati da un altro utente
+            error = 'Some seats are being purchased by another user'
+
+    # recupera i metodi di pagamento e i circuiti di pagamento (letti solo qui, poi portati dal token)
     with connect_as(Role.CLIENT) as conn:                           # connessione al database come client
+        sel_stmt = select([
+            payment_circuit_table.c.name
+        ])
+        result_set = conn.execute(sel_stmt)
+        payment_circuits = [ row['name'] for row in result_set ]    # nomi circuiti di pagamento
+
         sel_stmt = select([
             payment_method_table.c.id,
             payment_method_table.c.ownerName,
@@ -292,14 +370,23 @@ def checkout():
         payment_methods = result_set.fetchall()                     # lista metodi di pagamento
 
     if not error:
-        session['seats'] = seats                                # salva lista posti selezionati nella sessione
+        # fotografia firmata del checkout, verificata dai passi successivi dell'acquisto
+        checkout_token = make_checkout_token({
+            'proj_id': int(request.form['proj_id']),
+            'user': current_user.get_id(),
+            'title': movie_title,
+            'datetime': ticket_datetime,
+            'price': ticket_price,
+            'seats': seats,
+            'payment_circuits': payment_circuits
+        })
         total_price = len(seats) * ticket_price                 # calcola prezzo totale
         return render_template('home/checkout.html',            # renderizza riepilogo
                                total_price=total_price,         # prezzo totale
                                title=movie_title,               # titolo film
                                datetime=ticket_datetime,        # data e ora proiezione
                                payment_methods=payment_methods, # metodo di pagamento
-                               proj_id=request.form['proj_id'], # id proiezione
+                               checkout_token=checkout_token,   # token di checkout
                                seats=seats)                     # elenco posti selezionati
 
     else:                                                                       # in caso di errore
@@ -321,17 +408,14 @@ def confirm_payment_method():
         str: html da renderizzare nel browser
     """
 
-    # recupera i circuiti di pagamento
-    with connect_as(Role.CLIENT) as conn:                           # connessione al database come client
-        sel_stmt = select([
-            payment_circuit_table.c.name
-        ])
-        result_set = conn.execute(sel_stmt)                         # esegui query
-        payment_circuits = [ row['name'] for row in result_set ]    # lista nomi circuiti di pagamento
+    checkout = load_checkout()                                      # dati del checkout (token firmato)
+    payment_method_id = int(request.form['payment-method-id'])      # prendi id metodo di pagamento dal form
+
+    # token aggiornato con il metodo di pagamento scelto
+    checkout['payment_method_id'] = payment_method_id
+    checkout_token = make_checkout_token(checkout)
 
-    proj_id = request.form['proj_id']                               # prendi id proiezione da form
-    payment_method_id = request.form['payment-method-id']           # prendi id metodo di pagamento dal form
-    if int(payment_method_id) > 0:                                  # metodo di pagamento già registrato
+    if payment_method_id > 0:                                       # metodo di pagamento già registrato
         # mostrare dati metodo di pagamento e chiedere solo cvv
 
         with connect_as(Role.CLIENT) as conn:                       # connessione al database come client
@@ -350,15 +434,15 @@ def confirm_payment_method():
 
         return render_template('home/add_payment_method.html',          # renderizza form per inserimento CVV
                                payment_method=dict(payment_method),     # dati metodo di pagamento
-                               payment_circuits=payment_circuits,       # lista circuiti di pagamento
-                               proj_id=proj_id)                         # id proiezione selezionata
+                               payment_circuits=checkout['payment_circuits'],   # lista circuiti di pagamento
+                               checkout_token=checkout_token)           # token di checkout
 
     else:                                                               # nuovo metodo di pagamento
         # mostrare form per inserire nuovo metodo di pagamento
 
         return render_template('home/add_payment_method.html',          # renderizza form per aggiunta metodo di pagamento
-                               payment_circuits=payment_circuits,       # lista circuiti di pagamento
-                               proj_id=proj_id)                         # id proiezione selezionata
+                               payment_circuits=checkout['payment_circuits'],   # lista circuiti di pagamento
+                               checkout_token=checkout_token)           # token di checkout
 
 
 @bp.route('/finalize_payment', methods=('POST',))
@@ -378,10 +462,15 @@ def finalize_payment():
     error = None
     not_available_seats = []
 
+    checkout = load_checkout()                                  # dati del checkout (token firmato)
+    proj_id = checkout['proj_id']                               # id proiezione
+    payment_method_id = checkout['payment_method_id']           # id metodo di pagamento scelto
+    if payment_method_id is None:                               # metodo di pagamento non ancora scelto
+        abort(400)                                              # 400 BAD REQUEST
+
     today = datetime.now().date()                               # data di oggi
-    payment_method_id = request.form['payment-method-id']       # prendi id metodo di pagamento dal form
 
-    if int(payment_method_id) == 0:                             # nuovo metodo di pagamento
+    if payment_method_id == 0:                                  # nuovo metodo di pagamento
         # prendi i dati del nuovo metodo di pagamento dal form, inseriscili nel db e porta a termine l'acquisto
 
         # preleva dati del nuovo metodo di pagamento dal form
@@ -390,18 +479,10 @@ def finalize_payment():
         card_number = request.form['card-number']               # numero carta
         expiration = datetime.strptime(request.form.get('expiration', ''), '%Y-%m-%d').date()   # data di scadenza
 
-        # recupera i circuiti di pagamento
-        with connect_as(Role.CLIENT) as conn:                   # connessione al database come client
-            sel_stmt = select([
-                payment_circuit_table.c.name
-            ])
-            result_set = conn.execute(sel_stmt)
-            payment_circuits = [ row['name'] for row in result_set ]    # nomi circuiti di pagamento
-
-        # validazione
+        # validazione (circuiti di pagamento letti al checkout, dal token)
         if not payment_circuit:                             # circuito di pagamento mancante
             error = 'Payment circuit required'
-        elif payment_circuit not in payment_circuits:       # circuito di pagamento non valido
+        elif payment_circuit not in checkout['payment_circuits']:   # circuito di pagamento non valido
             error = 'Invalid payment circuit'
         elif not holder_name:                               # nome proprietario mancante
             error = 'Holder name required'
@@ -413,17 +494,18 @@ def finalize_payment():
             error = 'Card already expired'
 
         # inserimento nuovo metodo di pagamento (con restituzione dell'id della tupla appena inserita)
-        with connect_as(Role.CLIENT) as conn:               # connessione al database come client
-            ins_stmt = payment_method_table.insert().returning(payment_method_table.c.id)
-            result_set = conn.execute(ins_stmt, [{
-                'ownerName': holder_name,
-                'user': current_user.get_id(),              # username
-                'cardNumber': str(card_number),
-                'expirationDate': expiration,
-                'paymentCircuit': payment_circuit,
-                'isActive': True
-            }])
-            payment_method_id = result_set.first()['id']    # ricava id metodo di pagamento appena inserito
+        if not error:
+            with connect_as(Role.CLIENT) as conn:           # connessione al database come client
+                ins_stmt = payment_method_table.insert().returning(payment_method_table.c.id)
+                result_set = conn.execute(ins_stmt, [{
+                    'ownerName': holder_name,
+                    'user': current_user.get_id(),          # username
+                    'cardNumber': str(card_number),
+                    'expirationDate': expiration,
+                    'paymentCircuit': payment_circuit,
+                    'isActive': True
+                }])
+                payment_method_id = result_set.first()['id']    # ricava id metodo di pagamento appena inserito
 
 
     else:
@@ -448,14 +530,34 @@ def finalize_payment():
     if not cvv:
         error = 'CVV required'
 
+    seats = checkout['seats']                                   # posti selezionati al checkout
+    validate_seats(proj_id, seats)                              # solo posti della sala della proiezione
+    if not error and not seats:
+        error = 'No ticket selected'
+
+    if not error:
+        # verifica che i posti siano ancora riservati all'utente (rinnova l'hold se scaduto ma libero)
+        not_available_seats = seat_holds.acquire(proj_id, seats, current_user.get_id())
+        if not_available_seats:
+            error = 'Seat reservation expired'
+
     if not error:                           # se non ci sono errori
-        # prova ad acquistare i biglietti
-        error, not_available_seats = try_buy_tickets(payment_method_id, 5)
+        # prova ad acquistare i biglietti al prezzo mostrato al checkout
+        error, not_available_seats = buy_tickets(
+            proj_id,                            # id proiezione
+            seats,                              # posti selezionati
+            payment_method_id,                  # id metodo di pagamento
+            current_user.get_id(),              # username
+            checkout['price']                   # prezzo del biglietto al checkout
+        )
+
+        if not error:                                   # acquisto completato: hold consumati
+            seat_holds.release(proj_id, current_user.get_id())
 
     return render_template('home/finalize_payment.html',                # renderizza pagina con risultato
                            error=error,                                 # eventuale errore
                            not_available_seats=not_available_seats,     # posti non più disponibili
-                           proj_id=request.form['proj_id'])             # id proiezione
+                           proj_id=proj_id)                             # id proiezione
 
 
 @bp.route('/about')
@@ -471,27 +573,128 @@ def about():
         str: html da renderizzare nel browser
     """
 
-    return render_template('home/about.html')               # renderizza pagina informazioni
+    version, last_modified = templates_version('home/about.html', 'home/layout.html', 'layout.html')
+    return conditional_page(                                # renderizza pagina informazioni
+        lambda: render_template('home/about.html'),
+        version,
+        last_modified=last_modified
+    )
 
 
-def try_buy_tickets(payment_method_id, times=5):
-    """Tenta di portare a termine l'acquisto dei biglietti
+def validate_seats(proj_id, seats):
+    """Verifica che i posti esistano nella sala della proiezione
+
+    Un form alterato potrebbe contenere posti fuori dalla sala: vengono rifiutati
+    prima di riservarli o acquistarli (la mappa dei posti è letta dalla cache).
+
+    Args:
+        proj_id (int): id della proiezione
+        seats (list): posti selezionati; esempio di seat: {'row': 1, 'column': 5}
+    """
+
+    seat_map = seat_maps.get(proj_id)                               # mappa dei posti (cache o database)
+    if not seat_map:                                                # proiezione non esistente
+        abort(404)                                                  # 404 NOT FOUND
+    if not all(seat_map.is_valid(seat['row'], seat['column']) for seat in seats):
+        abort(400)                                                  # 400 BAD REQUEST
+
+
+def load_checkout():
+    """Verifica il token di checkout inviato con il form e ne restituisce i dati
+
+    Se il token è scaduto l'utente viene rimandato alla scelta dei posti;
+    se è mancante, alterato o di un altro utente la richiesta viene rifiutata.
+
+    Returns:
+        dict: dati del checkout (vedi make_checkout_token)
+    """
 
-    Utilizza una transazione con livello di isolamento SERIALIZABLE,
-    per tentare di acquistare i biglietti. Se la transazione non va a buon fine,
-    perchè i biglietti selezionati sono stati acquistati da qualcun altro, allora
-    la funzione restituice un messaggio di errore e l'elenco dei posti non più
-    disponibili. Se invece la transazione fallisce non perchè i biglietti non per la
-    disponibilità dei biglietti, ma perchè il dbms non è riuscito a portarla a termine
-    per motivi interni, allora la funzione riprova ad eseguire la transazione al più per
-    'times' volte. Se ancora non è andata a buon fine restituisce un errore.
+    try:
+        return load_checkout_token(request.form.get('checkout-token'), current_user.get_id())
+    except CheckoutExpired as e:                                    # checkout scaduto: posti da scegliere di nuovo
+        flash('Checkout expired, select your seats again', 'warning')
+        abort(redirect(url_for('home.seats', proj_id=e.proj_id)))
+    except InvalidCheckout:
+        abort(400)                                                  # 400 BAD REQUEST
 
-    Effettua 'times' tentativi di acquisto dei biglietti
+
+class _PurchaseAborted(Exception):
+    """Acquisto annullato per un motivo applicativo (posti non disponibili, proiezione passata, ...)"""
+
+
+def buy_tickets(proj_id, seats, payment_method_id, username, price=None):
+    """Porta a termine l'acquisto dei biglietti, eventualmente tramite la coda della proiezione
+
+    Se BOOKING_QUEUE è attivo, l'acquisto viene eseguito dal worker della proiezione
+    (un solo acquisto alla volta per proiezione, proiezioni diverse in parallelo) e il
+    chiamante attende l'esito al più BOOKING_QUEUE_TIMEOUT secondi; altrimenti
+    try_buy_tickets viene eseguita direttamente.
 
     Args:
+        proj_id (int): id della proiezione
+        seats (list): posti selezionati; esempio di seat: {'row': 1, 'column': 5}
         payment_method_id (int): id del metodo di pagamento
+        username (str): username dell'acquirente
+        price (float): prezzo del biglietto mostrato al checkout (None: prezzo corrente)
+
+    Returns:
+        error (str): messaggio di errore in caso di errore, None altrimenti
+        not_available_seats (list): lista di posti non più disponibili
+    """
+
+    if not current_app.config.get('BOOKING_QUEUE'):
+        return try_buy_tickets(proj_id, seats, payment_method_id, username, price, 5)
+
+    app = current_app._get_current_object()                 # il worker non ha accesso al contesto della richiesta
+    try:
+        return booking_executor.execute(
+            proj_id, _try_buy_tickets_in_app_context, app, proj_id, seats, payment_method_id, username, price,
+            timeout=current_app.config.get('BOOKING_QUEUE_TIMEOUT')
+        )
+    except BookingRejected as e:                            # coda piena oppure attesa scaduta
+        current_app.logger.info('Purchase rejected by the booking queue (proj: %s): %s [%s]', proj_id, e, username)
+        return 'Too many purchases in progress, try again later', []
+
+
+def _try_buy_tickets_in_app_context(app, *args):
+    """Esegue try_buy_tickets nel worker di una proiezione, in un nuovo application context"""
+
+    with app.app_context():                                 # le connessioni sono rilasciate all'uscita
+        return try_buy_tickets(*args, 5)
+
+
+def try_buy_tickets(proj_id, seats, payment_method_id, username, price=None, times=5):
+    """Tenta di portare a termine l'acquisto dei biglietti
+
+    La modalità di acquisto è data dalla configurazione PURCHASE_MODE:
+    - 'read_committed' (default): transazione READ COMMITTED, la doppia vendita di
+      un posto è impedita dal vincolo di unicità (projection, row, column) su Ticket;
+    - 'serializable': transazione SERIALIZABLE su una connessione dedicata;
+    - 'advisory_lock': transazione READ COMMITTED che acquisisce per prima cosa un
+      advisory lock sulla proiezione, serializzando gli acquisti della stessa proiezione.
+    Se 'price' è dato, la transazione verifica che il prezzo del biglietto sia ancora
+    quello mostrato al checkout (altrimenti l'acquisto viene annullato).
+    Se la transazione non va a buon fine perchè i biglietti selezionati
+    sono stati acquistati da qualcun altro (controllo preventivo oppure violazione
+    del vincolo), allora la funzione restituice un messaggio di errore e l'elenco
+    dei posti non più disponibili. Se invece la transazione fallisce per un conflitto
+    con un'altra transazione (serialization failure o deadlock), allora la funzione
+    riprova ad eseguire la transazione al più per 'times' volte, attendendo tra un
+    tentativo e l'altro con backoff esponenziale e jitter, ed entro la scadenza
+    PURCHASE_RETRY_DEADLINE. Gli altri errori del dbms non vengono ritentati.
+
+    La funzione non dipende dalla richiesta corrente (richiede solo un application
+    context), per cui può essere eseguita anche dal worker di una proiezione.
+
+    Args:
+        proj_id (int): id della proiezione
+        seats (list): posti selezionati; esempio di seat: {'row': 1, 'column': 5}
+        payment_method_id (int): id del metodo di pagamento
+        username (str): username dell'acquirente (usato nei log)
+        price (float): prezzo del biglietto mostrato al checkout (default: None,
+            nessuna verifica)
         times (int): numero di tentativi di portare a termine la transazione,
-            a seguito di un eccezione interna del dbms, dopo il quale fermarsi
+            a seguito di un conflitto tra transazioni, dopo il quale fermarsi
             e restituire errore (default: 5)
 
     Returns:
@@ -502,37 +705,30 @@ def try_buy_tickets(payment_method_id, times=5):
 
     error = None
     not_available_seats = []
+    sold = False
 
-    # connessione al database come client, usando SERIALIZABLE come livello di isolamento
-    with connect_as(Role.CLIENT).execution_options(isolation_level="SERIALIZABLE") as conn:
+    # elenco posti selezionati per l'acquisto, in ordine costante per evitare deadlock tra acquisti concorrenti
+    selected_seats = sorted(seats, key=lambda seat: (seat['row'], seat['column']))
+    mode = current_app.config.get('PURCHASE_MODE', 'read_committed')  # modalità di acquisto
+    started_at = time.monotonic()
+    deadline = started_at + PURCHASE_RETRY_DEADLINE                # scadenza complessiva dei tentativi
+
+    with connect_for_purchase(mode) as conn:                        # connessione al database come client
         # tenta di eseguire la transazione al più times volte
         # finché non ha successo, oppure dei biglietti diventano indisponibili
         for iteration in range(times):
+            error = None
+            contention.record(proj_id, mode, attempts=1)
             trans = conn.begin()                    # avvia la transazione
             try:
-                # seleziona biglietti venduti per la proiezione
-                sel_stmt = select([
-                    ticket_table.c.row,
-                    ticket_table.c.column
-                ]).where(
-                    (ticket_table.c.purchase == purchase_table.c.id)        # condizione di join
-                    & (purchase_table.c.projection == bindparam('proj_id')) # biglietti della proiezione selezionata
-                )
-                result_set = conn.execute(sel_stmt, proj_id=request.form['proj_id'])
+                if mode == 'advisory_lock':                                 # un acquisto alla volta per proiezione
+                    lock_projection(conn, proj_id)
 
-                selected_seats = session['seats']                           # elenco posti selezionati per l'acquisto
-
-                # verifica che posti scelti siano disponibili
-                not_available_seats = []                                    # elenco psoti non disponibili
-                for ticket in result_set:                                   # per ogni biglietto venduto
-                    for seat in selected_seats:                             # per ogni posto selezionato
-                        if seat['row'] == ticket['row'] and seat['column'] == ticket['column']:
-                            not_available_seats.append(seat)                # se il posto è già stato venduto
-                                                                            # aggiungilo alla lista
+                # verifica che posti scelti siano disponibili (solo i posti selezionati)
+                not_available_seats = select_conflicting_seats(conn, proj_id, selected_seats)
 
                 if len(not_available_seats) > 0:                            # se ci sono posti non più disponibili
-                    error = 'Some seats are no longer available :('
-                    raise                                                   # solleva eccezione
+                    raise _PurchaseAborted('Some seats are no longer available :(')
 
                 # calcola prezzo
                 sel_stmt = select([
@@ -541,11 +737,12 @@ def try_buy_tickets(payment_method_id, times=5):
                     (projection_table.c.id == bindparam('proj_id'))         # la proiezione con id uguale a proj_id
                     & (projection_table.c.datetime >= datetime.now())       # solo programmazioni future
                 )
-                result_set = conn.execute(sel_stmt, proj_id=request.form['proj_id'])
+                result_set = conn.execute(sel_stmt, proj_id=proj_id)
                 row = result_set.first()
                 if not row:                                                 # se la query non ha restituito risultati
-                    error = 'Chosen projection does not exist or is already past'
-                    raise                                                   # solleva eccezione
+                    raise _PurchaseAborted('Chosen projection does not exist or is already past')
+                elif price is not None and row['price'] != price:           # prezzo cambiato dopo il checkout
+                    raise _PurchaseAborted('Ticket price has changed, please check out again')
                 else:                                                       # il prezzo della proiezione è stato trovato
                     ticket_price = row['price']
 
@@ -554,44 +751,80 @@ def try_buy_tickets(payment_method_id, times=5):
                 done = True
 
                 if not done:                                                # in caso di errore nella fase di pagamento
-                    error = 'Payment error: try again later'
-                    raise                                                   # solleva eccezione
+                    raise _PurchaseAborted('Payment error: try again later')
 
                 # inserimento acquisto (con restituzione del id della tupla inserita)
                 ins_stmt = purchase_table.insert().returning(purchase_table.c.id)
                 result_set = conn.execute(ins_stmt, [{
-                    'projection': request.form['proj_id'],          # id proiezione
+                    'projection': proj_id,                          # id proiezione
                     'total': len(selected_seats) * ticket_price,    # calcolo prezzo
                     'purchaseDatetime': datetime.now(),             # data corrente
                     'paymentMethod': payment_method_id              # id metodo di pagamento
                 }])
                 purchase_id = result_set.first()['id']              # id acquisto appena inserito
 
-                # inserimento biglietti
+                # inserimento biglietti (il vincolo ticket_seat_unique impedisce la doppia vendita)
                 tickets = [                                         # crea lista tuple da inserire (una per biglietto)
-                    { 'row': seat['row'], 'column': seat['column'], 'purchase': purchase_id }
+                    { 'row': seat['row'], 'column': seat['column'], 'purchase': purchase_id, 'projection': proj_id }
                     for seat in selected_seats
                 ]
                 ins_stmt = ticket_table.insert()
                 conn.execute(ins_stmt, tickets)
 
                 trans.commit()                                      # transazione andata a buon fine: commit
+                sold = True
                 break                                               # esci dal ciclo
 
-            except:
-                trans.rollback()                                    # transazione fallita: rollback
-
-                if not error:                                       # se ad error non è ancora stato assegnato niente
-                    error = 'Transaction error'                     # allora significa che è un errore del dbms
+            except _PurchaseAborted as e:
+                trans.rollback()                                    # acquisto annullato: rollback
+                error = str(e)
 
-                current_app.logger.info('Transaction rolled back (id: %s): %s [%s]',    # logga errore
-                                        iteration,                  # numero iterazione
-                                        error,                      # messaggio di errore
-                                        current_user.get_id())      # username
-
-                if error != 'Transaction error':
-                    break                                           # non è colpa del dbms, non ha senso riprovare
+            except IntegrityError as e:
+                trans.rollback()                                    # transazione fallita: rollback
 
-            time.sleep(random.uniform(0.03, 0.13))                  # random delay
+                if is_seat_conflict(e):                             # posti venduti nel frattempo da un altro acquisto
+                    # la transazione concorrente ha già fatto commit: i posti in conflitto sono visibili
+                    not_available_seats = select_conflicting_seats(conn, proj_id, selected_seats)
+                    error = 'Some seats are no longer available :('
+                else:
+                    error = 'Constraint violation'
 
+            except Exception as e:
+                trans.rollback()                                    # transazione fallita: rollback
+                error = 'Transaction error'
+
+                if is_retryable(e):                                 # conflitto con un'altra transazione
+                    contention.record(proj_id, mode, retryable_aborts=1)
+                    current_app.logger.info('Transaction rolled back (id: %s): %s [%s]',    # logga errore
+                                            iteration,              # numero iterazione
+                                            e.orig.pgcode,          # SQLSTATE
+                                            username)               # username
+
+                    delay = backoff_delay(iteration)
+                    if iteration + 1 < times and time.monotonic() + delay < deadline:
+                        contention.record(proj_id, mode, retry_time=delay)
+                        time.sleep(delay)                           # attende prima di riprovare
+                        continue
+
+                else:                                               # errore del dbms non dovuto alla concorrenza
+                    current_app.logger.exception('Transaction failed (id: %s) [%s]', iteration, username)
+
+            # acquisto non riuscito: non ha senso (o non c'è più tempo per) riprovare
+            contention.record(proj_id, mode, aborts=1)
+            current_app.logger.info('Transaction rolled back (id: %s): %s [%s]',    # logga errore
+                                    iteration,                      # numero iterazione
+                                    error,                          # messaggio di errore
+                                    username)                       # username
+            break
+
+    if sold:                                # aggiornamenti dopo il commit: un loro errore non annulla l'acquisto
+        contention.record(proj_id, mode, purchases=1)
+        try:
+            seat_maps.mark_sold(proj_id, selected_seats)            # aggiorna mappa posti in cache
+            publish_sold(proj_id, selected_seats)                   # notifica le pagine di scelta posti aperte
+        except Exception:
+            seat_maps.invalidate(proj_id)                           # mappa ricostruita dal database
+            current_app.logger.exception('Seat map update failed after purchase (proj: %s) [%s]', proj_id, username)
+
+    contention.record(proj_id, mode, purchase_time=time.monotonic() - started_at)
     return error, not_available_seats           # restituisce eventuale errore e list aposti non più disponibili
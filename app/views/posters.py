@@ -0,0 +1,108 @@
+"""
+Modulo contenente le route dei poster dei film (varianti ridimensionate e ricompresse).
+Le route sono registrate nel Blueprint 'posters' (con prefisso url /posters).
+"""
+
+import os
+
+from flask import Blueprint, current_app, abort, redirect, send_file, url_for
+from sqlalchemy.sql import select
+from sqlalchemy.sql.expression import bindparam
+
+from app.models.db import connect_as, Role, movie_table
+from app.models.posters import (
+    poster_store, poster_key, valid_key, posters_enabled, PosterUnavailable,
+    POSTER_WIDTHS, POSTER_FORMATS, POSTER_MAX_AGE, POSTER_RENDER_TIMEOUT
+)
+
+
+bp = Blueprint('posters', __name__, url_prefix='/posters')     # Blueprint per i poster
+
+
+def poster_dir():
+    """Restituisce la directory della cache dei poster (default: instance/posters)"""
+
+    directory = current_app.config.get('POSTER_DIR') or os.path.join(current_app.instance_path, 'posters')
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def poster_url(movie, width=None, fmt='jpg'):
+    """Restituisce l'url della variante del poster del film (funzione disponibile nei template)
+
+    Args:
+        movie (dict): film, con id e poster (url dell'originale)
+        width (int): larghezza della variante, una di POSTER_WIDTHS (default: None, la minore)
+        fmt (str): formato della variante, una chiave di POSTER_FORMATS (default: 'jpg')
+
+    Returns:
+        str: url della variante, oppure dell'originale se Pillow non è installato
+    """
+
+    if not posters_enabled():
+        return movie['poster']
+    width = width or min(POSTER_WIDTHS)
+    return url_for('posters.poster', movie_id=movie['id'], key=poster_key(movie['poster']), width=width, fmt=fmt)
+
+
+def poster_srcset(movie, fmt='jpg'):
+    """Restituisce l'attributo srcset con tutte le larghezze del poster (funzione disponibile nei template)"""
+
+    if not posters_enabled():
+        return movie['poster']
+    return ', '.join(f'{poster_url(movie, width, fmt)} {width}w' for width in POSTER_WIDTHS)
+
+
+@bp.route('/<int:movie_id>/<key>/<int:width>.<fmt>')
+def poster(movie_id, key, width, fmt):
+    """Route che restituisce una variante del poster di un film
+
+    URL: /posters/<int:movie_id>/<key>/<int:width>.<fmt>
+
+    La route accetta 1 metodo, GET.
+    GET: restituisce l'immagine; l'url contiene l'hash dell'url dell'originale e la risposta
+        è memorizzata dal browser per POSTER_MAX_AGE secondi, poi riconvalidata (ETag),
+        così una variante rigenerata da un'immagine modificata allo stesso url viene aggiornata
+
+    Args:
+        movie_id (int): id del film
+        key (str): hash dell'url del poster originale
+        width (int): larghezza della variante
+        fmt (str): formato della variante (webp o jpg)
+
+    Returns:
+        Response: immagine, oppure redirect all'originale se la variante non può essere generata
+    """
+
+    if not posters_enabled() or not valid_key(key) or width not in POSTER_WIDTHS or fmt not in POSTER_FORMATS:
+        abort(404)
+
+    # variante già su disco (e non da rigenerare): nessun accesso al database
+    directory = poster_dir()
+    path = poster_store.variant_path(directory, key, width, fmt)
+    if not poster_store.is_fresh(path):
+        with connect_as(Role.CLIENT) as conn:                       # connessione al database come client
+            sel_stmt = select([
+                movie_table.c.id,
+                movie_table.c.poster
+            ]).where(
+                movie_table.c.id == bindparam('movie_id')           # film richiesto
+            )
+            movie = conn.execute(sel_stmt, movie_id=movie_id).first()
+
+        if movie is None:
+            abort(404)
+        if poster_key(movie['poster']) != key:                      # poster cambiato: url della versione corrente
+            return redirect(poster_url(movie, width, fmt))
+
+        try:
+            path = poster_store.get(directory, movie['poster'], width, fmt, timeout=POSTER_RENDER_TIMEOUT)
+        except PosterUnavailable:                                   # fallito di recente: non viene ritentato
+            return redirect(movie['poster'])
+        except Exception as e:                                      # download o decodifica non riusciti
+            current_app.logger.warning('Poster rendering failed (movie: %s): %r', movie_id, e)
+            return redirect(movie['poster'])
+
+    response = send_file(path, mimetype=POSTER_FORMATS[fmt][1], conditional=True)
+    response.headers['Cache-Control'] = f'public, max-age={POSTER_MAX_AGE}'
+    return response
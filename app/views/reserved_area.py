@@ -9,9 +9,10 @@ from flask import Blueprint, redirect, url_for, render_template, abort, request
 from flask_login import current_user, login_required
 from sqlalchemy.sql import select, desc
 from sqlalchemy.sql.expression import bindparam, func
-from werkzeug.security import generate_password_hash
 
 from app.models.db import connect_as, Role
+from app.models.query import invalidate_user
+from app.models.passwords import password_hasher, HashingBusy
 from app.models.db import (
     projection_table, purchase_table, ticket_table,
     payment_method_table, movie_table, user_table
@@ -266,7 +267,10 @@ def settings():
 
         # aggiusta la tupla per il database
         if new_tuple['password']:                                   # se user ha inserito anche password
-            new_tuple['password'] = generate_password_hash(new_tuple['password'])   # hash password
+            try:
+                new_tuple['password'] = password_hasher.hash(new_tuple['password'])     # hash password
+            except HashingBusy:                                     # servizio di hashing saturo
+                abort(503)
         else:
             del new_tuple['password']                               # altrimenti elimina il campo dal dizionario
                                                                     # in modo da non aggiornarlo nel database
@@ -280,6 +284,8 @@ def settings():
         with connect_as(Role.CLIENT) as conn:                   # connessione al database come client
             conn.execute(update_user_stmt, username_=username)
 
+        invalidate_user(username)                               # i dati in cache dell'utente non sono più validi
+
         # redireziona alla pagina di logout per applicare i cambiamenti
         return redirect(url_for('auth.logout'))
 
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark della contesa sull'acquisto dei biglietti.
+
+Crea una proiezione dedicata e N acquirenti simulati (utenti con un metodo di
+pagamento), poi li lancia in parallelo sul flusso di acquisto (/checkout -> /finalize_payment)
+scegliendo posti sovrapposti. Per ogni livello di concorrenza riporta throughput,
+latenza p50/p99, tentativi ripetuti, tasso di errori di serializzazione e
+posti venduti più di una volta.
+
+Va eseguito dalla root del repository contro un Postgres locale inizializzato
+con db/init_db.py:
+
+    . ./scripts/prepare-env.sh
+    python3 -m benchmarks.booking_contention --concurrency 10,50,100,200
+"""
+
+import os
+import re
+import time
+import random
+import argparse
+import threading
+from datetime import datetime, date, timedelta
+
+from sqlalchemy.sql import select, desc
+from sqlalchemy.sql.expression import bindparam, func
+from werkzeug.security import generate_password_hash
+
+from app import create_app
+from app.models.booking import contention, PURCHASE_MODES
+from app.models.passwords import password_hasher
+from app.models.db import get_db
+from app.models.db import (
+    user_table, payment_method_table, projection_table,
+    purchase_table, ticket_table, room_table, movie_table
+)
+
+
+BENCH_PREFIX = 'bench_'                     # prefisso degli utenti creati dal benchmark
+BENCH_PASSWORD = 'bench'
+
+
+def percentile(values, p):
+    """Restituisce il percentile p (0-100) di una lista di valori"""
+
+    if not values:
+        return 0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def seed_buyers(conn, count):
+    """Crea (se mancano) 'count' utenti con un metodo di pagamento attivo
+
+    La password è hashata con il metodo configurato (PASSWORD_HASH_METHOD), anche per
+    gli utenti creati da esecuzioni precedenti con un altro metodo: il login non
+    riscrive l'hash, e ogni esecuzione misura lo stesso stato.
+
+    Returns:
+        list: coppie (email, id metodo di pagamento)
+    """
+
+    buyers = []
+    password = generate_password_hash(BENCH_PASSWORD, method=password_hasher.method)
+
+    for i in range(count):
+        username = f'{BENCH_PREFIX}{i}'
+        email = f'{username}@bench.local'
+        row = conn.execute(
+            select([user_table.c.password]).where(user_table.c.username == username)
+        ).first()
+        if row and password_hasher.needs_rehash(row['password']):      # hash di un altro metodo
+            conn.execute(user_table.update().where(user_table.c.username == username).values(password=password))
+        if not row:
+            conn.execute(user_table.insert(), [{
+                'username': username, 'email': email, 'password': password,
+                'name': 'Bench', 'surname': str(i), 'birthdate': date(1990, 1, 1),
+                'registrationDate': date.today(), 'isOperator': False
+            }])
+            conn.execute(payment_method_table.insert(), [{
+                'ownerName': f'Bench {i}', 'user': username, 'cardNumber': '4' * 16,
+                'expirationDate': date.today() + timedelta(days=365),
+                'paymentCircuit': 'Visa', 'isActive': True
+            }])
+
+        payment_method = conn.execute(
+            select([payment_method_table.c.id]).where(
+                (payment_method_table.c.user == username) & payment_method_table.c.isActive
+            )
+        ).first()
+        buyers.append((email, payment_method['id']))
+
+    return buyers
+
+
+def seed_projection(conn):
+    """Crea una proiezione futura nella sala più grande, senza biglietti venduti
+
+    Returns:
+        tuple: (id proiezione, numero di colonne della sala)
+    """
+
+    room = conn.execute(
+        select([room_table]).order_by(desc(room_table.c.numberOfRows * room_table.c.numberOfColumns))
+    ).first()
+    movie_id = conn.execute(select([func.min(movie_table.c.id)])).scalar()
+
+    # orario univoco per rispettare UNIQUE (datetime, room)
+    when = datetime.now() + timedelta(days=30, seconds=random.randint(0, 10 ** 7))
+    result = conn.execute(projection_table.insert().returning(projection_table.c.id), [{
+        'movie': movie_id, 'room': room['name'], 'datetime': when, 'price': 5
+    }])
+    return result.first()['id'], room['numberOfColumns']
+
+
+def count_double_sold(conn, proj_id):
+    """Conta i posti venduti più di una volta (via Purchase, indipendentemente dai vincoli su Ticket)"""
+
+    duplicates = select([
+        ticket_table.c.row, ticket_table.c.column
+    ]).where(
+        (ticket_table.c.purchase == purchase_table.c.id)
+        & (purchase_table.c.projection == bindparam('proj_id'))
+    ).group_by(
+        ticket_table.c.row, ticket_table.c.column
+    ).having(func.count() > 1).alias('duplicates')
+
+    return conn.execute(select([func.count()]).select_from(duplicates), proj_id=proj_id).scalar()
+
+
+def checkout_token(response):
+    """Estrae il token di checkout dal form della pagina"""
+
+    match = re.search(rb'name="checkout-token" type="hidden" value="([^"]+)"', response.data)
+    return match.group(1).decode() if match else None
+
+
+def buy(client, proj_id, payment_method_id, seats):
+    """Esegue il flusso checkout -> confirm_payment_method -> finalize_payment
+
+    Returns:
+        str: esito ('sold', 'held', 'conflict', 'error')
+    """
+
+    form = { f"{seat['row']},{seat['column']}": 'on' for seat in seats }
+    form['proj_id'] = proj_id
+    response = client.post('/checkout', data=form)
+    if response.status_code == 302:                 # posti riservati da un altro acquirente
+        return 'held'
+
+    response = client.post('/confirm_payment_method', data={
+        'payment-method-id': payment_method_id,
+        'checkout-token': checkout_token(response)
+    })
+    response = client.post('/finalize_payment', data={
+        'cvv': '123',
+        'checkout-token': checkout_token(response)
+    })
+    if b'Well done!' in response.data:
+        return 'sold'
+    if b'no longer available' in response.data or b'not available anymore' in response.data:
+        return 'conflict'
+    return 'error'
+
+
+def run_level(app, buyers, concurrency, seats_per_buyer, hot_seats):
+    """Esegue un livello di concorrenza su una nuova proiezione e ne restituisce le metriche"""
+
+    with get_db().connect() as conn:
+        proj_id, columns = seed_projection(conn)
+
+    # posti "caldi": i primi hot_seats posti della sala (riga per riga), contesi da tutti
+    hot = [ { 'row': i // columns + 1, 'column': i % columns + 1 } for i in range(hot_seats) ]
+
+    clients = []
+    for i, (email, payment_method_id) in enumerate(buyers[:concurrency]):
+        client = app.test_client()
+        response = client.post(
+            '/auth/login',
+            data={ 'email': email, 'password': BENCH_PASSWORD },
+            environ_base={ 'REMOTE_ADDR': f'10.0.{i // 256}.{i % 256}' }   # un IP per acquirente (limite login per IP)
+        )
+        assert response.status_code == 302, f'login failed for {email}: {response.status_code}'
+        clients.append((client, payment_method_id, random.sample(hot, seats_per_buyer)))
+
+    latencies = []
+    outcomes = {}
+    lock = threading.Lock()
+    barrier = threading.Barrier(concurrency + 1)
+
+    def worker(client, payment_method_id, seats):
+        barrier.wait()                              # tutti gli acquirenti partono insieme
+        start = time.perf_counter()
+        outcome = buy(client, proj_id, payment_method_id, seats)
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+    threads = [ threading.Thread(target=worker, args=args) for args in clients ]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+
+    with get_db().connect() as conn:
+        double_sold = count_double_sold(conn, proj_id)
+
+    stats = contention.get(proj_id)         # tentativi e abort registrati da try_buy_tickets
+    return {
+        'concurrency': concurrency,
+        'throughput': concurrency / wall if wall else 0,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'sold': outcomes.get('sold', 0),
+        'conflict': outcomes.get('conflict', 0),
+        'held': outcomes.get('held', 0),
+        'error': outcomes.get('error', 0),
+        'retries': stats['retryable_aborts'],
+        'serialization_rate': stats['retryable_aborts'] / stats['attempts'] if stats['attempts'] else 0,
+        'retry_ms': stats['retry_time'] * 1000,
+        'double_sold': double_sold
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent booking contention benchmark')
+    parser.add_argument('--concurrency', default='10,50,100',
+                        help='comma separated list of concurrent buyers (default: 10,50,100)')
+    parser.add_argument('--seats-per-buyer', type=int, default=2, help='seats chosen by each buyer (default: 2)')
+    parser.add_argument('--hot-seats', type=int, default=20,
+                        help='size of the contended seat block buyers choose from (default: 20)')
+    parser.add_argument('--modes', default='read_committed',
+                        help='comma separated list of purchase modes to compare: '
+                             'read_committed, serializable, advisory_lock (default: read_committed)')
+    parser.add_argument('--queue', action='store_true',
+                        help='serialize purchases per projection with the booking queue (BOOKING_QUEUE)')
+    parser.add_argument('--seed', type=int, default=1, help='random seed (default: 1)')
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    levels = [ int(level) for level in args.concurrency.split(',') ]
+    modes = args.modes.split(',')
+    for mode in modes:
+        if mode not in PURCHASE_MODES:
+            parser.error(f'invalid purchase mode: {mode}')
+
+    app = create_app({
+        'TESTING': True,
+        'SECRET_KEY': os.getenv('SECRET_KEY') or 'bench',
+        'BOOKING_QUEUE': args.queue,
+        'BOOKING_QUEUE_TIMEOUT': 30
+    })
+
+    with get_db().connect() as conn:
+        buyers = seed_buyers(conn, max(levels))
+
+    columns = ('mode', 'concurrency', 'throughput', 'p50_ms', 'p99_ms', 'sold', 'conflict', 'held',
+               'error', 'retries', 'serialization_rate', 'retry_ms', 'double_sold')
+    print(' '.join(f'{column:>18}' for column in columns))
+    for mode in modes:
+        app.config['PURCHASE_MODE'] = mode                  # letta da try_buy_tickets ad ogni acquisto
+        for level in levels:
+            result = run_level(app, buyers, level, args.seats_per_buyer, args.hot_seats)
+            result['mode'] = mode
+            print(' '.join(
+                f'{result[column]:>18.2f}' if isinstance(result[column], float) else f'{result[column]:>18}'
+                for column in columns
+            ))
+
+
+if __name__ == '__main__':
+    main()
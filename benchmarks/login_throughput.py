@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark del throughput dei login al variare del costo della KDF.
+
+Simula una raffica di login (verifica della password) eseguiti da N thread, come i
+thread che servono le richieste, con l'hashing nel thread stesso ('inline') oppure
+nel pool di processi del servizio di hashing ('pool'). Per ogni costo (iterazioni
+pbkdf2) riporta login al secondo, latenza p50/p99, login rifiutati e la latenza di
+una richiesta "leggera" eseguita in parallelo (quanto i login rallentano il resto).
+
+Non richiede il database (solo le variabili d'ambiente dell'applicazione):
+
+    . ./scripts/prepare-env.sh
+    python3 -m benchmarks.login_throughput --costs 50000,150000,260000 --threads 16
+"""
+
+import time
+import argparse
+import threading
+
+from werkzeug.security import generate_password_hash
+
+from app.models.passwords import PasswordHasher, HashingBusy
+
+
+PASSWORD = 'bench'
+
+
+def percentile(values, p):
+    """Restituisce il percentile p (0-100) di una lista di valori"""
+
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def light_request():
+    """Richiesta senza hashing (esempio: render di una pagina del catalogo in cache)"""
+
+    return sum(i * i for i in range(2000))
+
+
+def run(hasher, pwhash, threads, logins):
+    """Esegue 'logins' login divisi tra 'threads' thread, misurando anche le richieste leggere
+
+    Returns:
+        dict: durata, latenze dei login, rifiuti e latenze delle richieste leggere
+    """
+
+    latencies, rejected, light = [], [], []
+    lock = threading.Lock()
+    done = threading.Event()
+    per_thread = logins // threads
+
+    def login_worker():
+        for _ in range(per_thread):
+            start = time.perf_counter()
+            try:
+                assert hasher.check(pwhash, PASSWORD)
+            except HashingBusy:
+                with lock:
+                    rejected.append(1)
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    def light_worker():
+        while not done.is_set():
+            start = time.perf_counter()
+            light_request()
+            light.append(time.perf_counter() - start)
+            time.sleep(0.01)
+
+    probe = threading.Thread(target=light_worker)
+    probe.start()
+    workers = [ threading.Thread(target=login_worker) for _ in range(threads) ]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    done.set()
+    probe.join()
+
+    return { 'elapsed': elapsed, 'latencies': latencies, 'rejected': len(rejected), 'light': light }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Login throughput benchmark')
+    parser.add_argument('--costs', default='50000,150000,260000', help='comma separated pbkdf2 iterations')
+    parser.add_argument('--threads', type=int, default=16, help='concurrent login threads (default: 16)')
+    parser.add_argument('--logins', type=int, default=160, help='logins per cost setting (default: 160)')
+    parser.add_argument('--workers', type=int, default=2, help='hashing processes in pool mode (default: 2)')
+    parser.add_argument('--queue', type=int, default=32, help='max pending hashing operations (default: 32)')
+    args = parser.parse_args()
+
+    print(f"{'cost':>8} {'mode':>7} {'logins/s':>9} {'p50_ms':>9} {'p99_ms':>9} "
+          f"{'rejected':>9} {'light_p99_ms':>13}")
+
+    for cost in [ int(cost) for cost in args.costs.split(',') ]:
+        method = f'pbkdf2:sha256:{cost}'
+        pwhash = generate_password_hash(PASSWORD, method)
+
+        for mode, workers in (('inline', 0), ('pool', args.workers)):
+            hasher = PasswordHasher(workers=workers, max_pending=args.queue, method=method)
+            if workers:
+                hasher.check(pwhash, PASSWORD)          # avvia i processi prima della misura
+            try:
+                result = run(hasher, pwhash, args.threads, args.logins)
+            finally:
+                hasher.shutdown()
+
+            latencies = result['latencies']
+            print(f"{cost:>8} {mode:>7} {len(latencies) / result['elapsed']:>9.1f} "
+                  f"{percentile(latencies, 50) * 1000:>9.1f} {percentile(latencies, 99) * 1000:>9.1f} "
+                  f"{result['rejected']:>9} {percentile(result['light'], 99) * 1000:>13.2f}")
+
+
+if __name__ == '__main__':
+    main()
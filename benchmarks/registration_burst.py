@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark del throughput delle registrazioni durante una raffica di iscrizioni.
+
+N thread registrano utenti in parallelo; una frazione delle registrazioni riusa
+username o email già registrati (anche da altri thread nello stesso istante).
+Confronta l'inserimento precedente ('select_insert': SELECT dei conflitti, poi
+INSERT, con l'IntegrityError come fallback) con quello attuale ('upsert': un solo
+INSERT ... ON CONFLICT DO NOTHING RETURNING, seguito da una query solo in caso di
+conflitto). Per ogni modalità riporta registrazioni al secondo, latenza p50/p99,
+conflitti, errori di integrità e statement eseguiti per registrazione.
+
+L'hashing della password è escluso dalla misura (hash precalcolato). Va eseguito
+dalla root del repository contro un Postgres locale inizializzato con db/init_db.py:
+
+    . ./scripts/prepare-env.sh
+    python3 -m benchmarks.registration_burst --threads 8,32 --users 2000 --duplicates 0.2
+"""
+
+import time
+import random
+import argparse
+import threading
+from datetime import date
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.sql import select
+from sqlalchemy.sql.expression import bindparam
+from werkzeug.security import generate_password_hash
+
+from app.models.db import get_db, user_table
+from app.models.query import insert_user
+
+
+BENCH_PREFIX = 'regbench_'                  # prefisso degli utenti creati dal benchmark
+PASSWORD = generate_password_hash('bench', method='pbkdf2:sha256:1000')
+
+
+def percentile(values, p):
+    """Restituisce il percentile p (0-100) di una lista di valori"""
+
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def select_insert(conn, **user):
+    """Registrazione precedente: SELECT dei conflitti e poi INSERT
+
+    Returns:
+        tuple: (esito, statement eseguiti); esito è 'ok', 'conflict' oppure 'integrity'
+    """
+
+    sel_stmt = select([user_table.c.username]).where(
+        (user_table.c.username == bindparam('username')) | (user_table.c.email == bindparam('email'))
+    )
+    if conn.execute(sel_stmt, username=user['username'], email=user['email']).first():
+        return 'conflict', 1
+    try:
+        conn.execute(user_table.insert(), **user)
+    except IntegrityError:                  # registrazione concorrente tra SELECT e INSERT
+        return 'integrity', 2
+    return 'ok', 2
+
+
+def upsert(conn, **user):
+    """Registrazione attuale (insert_user)
+
+    Returns:
+        tuple: (esito, statement eseguiti); esito è 'ok' oppure 'conflict'
+    """
+
+    return ('ok', 1) if insert_user(conn, **user) is None else ('conflict', 2)
+
+
+def users(count, duplicates, seed):
+    """Genera 'count' registrazioni; una frazione 'duplicates' riusa username o email precedenti"""
+
+    rng = random.Random(seed)
+    registrations = []
+    for i in range(count):
+        username, email = f'{BENCH_PREFIX}{i}', f'{BENCH_PREFIX}{i}@bench.local'
+        if registrations and rng.random() < duplicates:
+            j = rng.randrange(max(0, i - 50), i)        # utente recente: spesso ancora in volo
+            if rng.random() < 0.5:
+                username = f'{BENCH_PREFIX}{j}'
+            else:
+                email = f'{BENCH_PREFIX}{j}@bench.local'
+        registrations.append({
+            'username': username, 'email': email, 'password': PASSWORD,
+            'name': 'Bench', 'surname': str(i), 'birthdate': date(1990, 1, 1),
+            'registrationDate': date.today(), 'isOperator': False
+        })
+    return registrations
+
+
+def cleanup():
+    """Elimina gli utenti creati dal benchmark"""
+
+    with get_db().connect() as conn:
+        conn.execute(user_table.delete().where(user_table.c.username.like(f'{BENCH_PREFIX}%')))
+
+
+def run(register, registrations, threads):
+    """Esegue le registrazioni divise tra 'threads' thread, che partono insieme
+
+    Returns:
+        dict: durata, latenze, esiti e statement eseguiti
+    """
+
+    latencies, outcomes = [], {}
+    statements = [0]
+    lock = threading.Lock()
+    barrier = threading.Barrier(threads + 1)
+
+    def worker(chunk):
+        with get_db().connect() as conn:
+            barrier.wait()
+            for user in chunk:
+                start = time.perf_counter()
+                outcome, count = register(conn, **user)
+                elapsed = time.perf_counter() - start
+                with lock:
+                    latencies.append(elapsed)
+                    outcomes[outcome] = outcomes.get(outcome, 0) + 1
+                    statements[0] += count
+
+    workers = [ threading.Thread(target=worker, args=(registrations[i::threads],)) for i in range(threads) ]
+    for thread in workers:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in workers:
+        thread.join()
+
+    return {
+        'elapsed': time.perf_counter() - start,
+        'latencies': latencies,
+        'outcomes': outcomes,
+        'statements': statements[0]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Registration burst benchmark')
+    parser.add_argument('--threads', default='8,32', help='comma separated concurrent signup threads')
+    parser.add_argument('--users', type=int, default=2000, help='registrations per run (default: 2000)')
+    parser.add_argument('--duplicates', type=float, default=0.2,
+                        help='fraction of registrations reusing a taken username or email (default: 0.2)')
+    parser.add_argument('--seed', type=int, default=1, help='random seed (default: 1)')
+    args = parser.parse_args()
+
+    registrations = users(args.users, args.duplicates, args.seed)
+
+    print(f"{'mode':>14} {'threads':>8} {'regs/s':>9} {'p50_ms':>8} {'p99_ms':>8} "
+          f"{'ok':>6} {'conflict':>9} {'integrity':>10} {'stmts/reg':>10}")
+    try:
+        for threads in [ int(threads) for threads in args.threads.split(',') ]:
+            for mode, register in (('select_insert', select_insert), ('upsert', upsert)):
+                cleanup()
+                result = run(register, registrations, threads)
+                outcomes, latencies = result['outcomes'], result['latencies']
+                print(f"{mode:>14} {threads:>8} {len(latencies) / result['elapsed']:>9.1f} "
+                      f"{percentile(latencies, 50) * 1000:>8.2f} {percentile(latencies, 99) * 1000:>8.2f} "
+                      f"{outcomes.get('ok', 0):>6} {outcomes.get('conflict', 0):>9} "
+                      f"{outcomes.get('integrity', 0):>10} {result['statements'] / len(latencies):>10.2f}")
+    finally:
+        cleanup()
+
+
+if __name__ == '__main__':
+    main()
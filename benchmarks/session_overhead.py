@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark del costo delle sessioni per richiesta al variare del backend e dei posti nel checkout.
+
+Per ogni backend (cookie firmato, SQLite, memoria) e per ogni numero di posti memorizza
+una selezione di posti nella sessione. Riporta la dimensione del cookie inviato dal
+browser e il tempo medio di una richiesta che legge la sessione (apertura e salvataggio).
+
+Non richiede il database (solo le variabili d'ambiente dell'applicazione):
+
+    . ./scripts/prepare-env.sh
+    python3 -m benchmarks.session_overhead --seats 2,10,50 --requests 2000
+"""
+
+import os
+import time
+import argparse
+import tempfile
+
+from flask import session
+
+from app import create_app
+
+
+def create_bench_app(backend, path):
+    """Crea l'app con il backend di sessione indicato e le route del benchmark"""
+
+    app = create_app({
+        'TESTING': True,
+        'SECRET_KEY': os.getenv('SECRET_KEY', 'bench'),
+        'SESSION_BACKEND': backend,
+        'SESSION_DB': path
+    })
+
+    @app.route('/_bench/store/<int:count>')
+    def store(count):
+        session['seats'] = [ { 'row': 1 + i // 20, 'column': 1 + i % 20 } for i in range(count) ]
+        return 'ok'
+
+    @app.route('/_bench/read')
+    def read():
+        return str(len(session.get('seats', [])))
+
+    return app
+
+
+def run(app, count, requests):
+    """Memorizza i posti nella sessione ed esegue 'requests' richieste che li leggono
+
+    Returns:
+        cookie (int): byte dell'header Cookie inviato dal browser
+        elapsed (float): secondi medi per richiesta
+    """
+
+    client = app.test_client()
+    client.get(f'/_bench/store/{count}')
+    cookie = sum(
+        len(cookie.name) + len(cookie.value) + 1 for cookie in client.cookie_jar
+    )
+
+    start = time.perf_counter()
+    for _ in range(requests):
+        assert client.get('/_bench/read').data == str(count).encode()
+    return cookie, (time.perf_counter() - start) / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Session overhead benchmark')
+    parser.add_argument('--backends', default='cookie,sqlite,memory', help='comma separated session backends')
+    parser.add_argument('--seats', default='2,10,50', help='comma separated seats in the checkout')
+    parser.add_argument('--requests', type=int, default=2000, help='requests per setting (default: 2000)')
+    args = parser.parse_args()
+
+    print(f"{'backend':>8} {'seats':>6} {'cookie_B':>9} {'req_us':>9}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in args.backends.split(','):
+            app = create_bench_app(backend, os.path.join(tmp, f'{backend}.sqlite3'))
+            for count in [ int(count) for count in args.seats.split(',') ]:
+                cookie, elapsed = run(app, count, args.requests)
+                print(f"{backend:>8} {count:>6} {cookie:>9} {elapsed * 1e6:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
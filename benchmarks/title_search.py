@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark della ricerca dei film per titolo.
+
+Confronta, su tabelle temporanee da 10k e 100k titoli, la latenza di:
+- ILIKE '%query%' senza indice (ricerca attuale, scansione sequenziale);
+- ILIKE oppure somiglianza (%>) con indice GIN pg_trgm, ordinata per word_similarity;
+- TrigramIndex in memoria (usato dalla pagina /movies, tramite il catalogo in cache).
+
+Va eseguito dalla root del repository contro un Postgres locale in cui l'estensione
+pg_trgm sia installabile (il benchmark la crea se manca, con un utente che ne abbia i
+privilegi; lo schema dell'applicazione non la richiede):
+
+    . ./scripts/prepare-env.sh
+    python3 -m benchmarks.title_search --sizes 10000,100000
+"""
+
+import time
+import random
+import argparse
+
+from sqlalchemy.sql import text
+
+from app.models.db import get_db
+from app.utils.search import TrigramIndex
+
+
+SYLLABLES = [ 'ka', 'ri', 'mo', 'ten', 'sa', 'lu', 'vor', 'ex', 'dra', 'ne', 'pi', 'zor', 'al', 'ba', 'quin', 'tu' ]
+
+SEARCHES = {
+    'plain': 'SELECT id, title FROM bench_title_plain WHERE title ILIKE :pattern',
+    'trgm': 'SELECT id, title, word_similarity(:query, title) AS rank FROM bench_title_trgm '
+            'WHERE title ILIKE :pattern OR title %> :query ORDER BY rank DESC'
+}
+
+
+def random_word(rand):
+    return ''.join(rand.choice(SYLLABLES) for _ in range(rand.randint(2, 4)))
+
+
+def random_title(rand):
+    return ' '.join(random_word(rand) for _ in range(rand.randint(1, 5))).title()
+
+
+def percentile(values, p):
+    """Restituisce il percentile p (0-100) di una lista di valori"""
+
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def create_tables(conn, titles):
+    """Crea e popola le tabelle temporanee (senza indice e con indice trigram)"""
+
+    for table in ('bench_title_plain', 'bench_title_trgm'):
+        conn.execute(f'DROP TABLE IF EXISTS {table}')
+        conn.execute(f'CREATE TEMP TABLE {table} (id SERIAL PRIMARY KEY, title VARCHAR NOT NULL)')
+        conn.execute(text(f'INSERT INTO {table} (title) VALUES (:title)'), [ { 'title': t } for t in titles ])
+    conn.execute('CREATE INDEX ON bench_title_trgm USING gin (title gin_trgm_ops)')
+    conn.execute('ANALYZE bench_title_plain')
+    conn.execute('ANALYZE bench_title_trgm')
+
+
+def time_queries(run, queries):
+    """Esegue run(query) per ogni query e restituisce le latenze in millisecondi"""
+
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        run(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Movie title search benchmark')
+    parser.add_argument('--sizes', default='10000,100000', help='comma separated catalog sizes (default: 10000,100000)')
+    parser.add_argument('--queries', type=int, default=200, help='searches per size (default: 200)')
+    parser.add_argument('--seed', type=int, default=1, help='random seed (default: 1)')
+    args = parser.parse_args()
+
+    rand = random.Random(args.seed)
+    print(f"{'size':>8} {'method':>8} {'build_ms':>10} {'mean_ms':>10} {'p50_ms':>10} {'p99_ms':>10}")
+
+    with get_db().connect() as conn:
+        conn.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+        for size in [ int(size) for size in args.sizes.split(',') ]:
+            titles = [ random_title(rand) for _ in range(size) ]
+            # query: parole (o pezzi di parola) dei titoli esistenti, metà con un errore di battitura
+            queries = []
+            for _ in range(args.queries):
+                word = rand.choice(rand.choice(titles).split())
+                if rand.random() < 0.5 and len(word) > 4:
+                    i = rand.randrange(len(word))
+                    word = word[:i] + rand.choice('aeiou') + word[i + 1:]
+                queries.append(word)
+
+            start = time.perf_counter()
+            create_tables(conn, titles)
+            build_ms = (time.perf_counter() - start) * 1000
+
+            for method, sql in SEARCHES.items():
+                stmt = text(sql)
+                latencies = time_queries(
+                    lambda query: conn.execute(stmt, pattern=f'%{query}%', query=query).fetchall(),
+                    queries
+                )
+                print(f'{size:>8} {method:>8} {build_ms:>10.1f} {sum(latencies) / len(latencies):>10.2f} '
+                      f'{percentile(latencies, 50):>10.2f} {percentile(latencies, 99):>10.2f}')
+
+            start = time.perf_counter()
+            index = TrigramIndex(enumerate(titles))
+            build_ms = (time.perf_counter() - start) * 1000
+            latencies = time_queries(index.search, queries)
+            print(f'{size:>8} {"memory":>8} {build_ms:>10.1f} {sum(latencies) / len(latencies):>10.2f} '
+                  f'{percentile(latencies, 50):>10.2f} {percentile(latencies, 99):>10.2f}')
+
+
+if __name__ == '__main__':
+    main()
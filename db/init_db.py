@@ -331,9 +331,10 @@ def get_fake_tickets():
     random.seed(1)
 
     tickets = []
-    purchase_count = len(get_fake_purchases())
+    purchases = get_fake_purchases()
+    sold_seats = set()                  # (projection, row, column) già venduti: ogni posto una sola volta
 
-    for purchase_id in range(1, purchase_count+1):
+    for purchase_id, purchase in enumerate(purchases, 1):
         ticket_count = random.randint(1, 10)
 
         for _ in range(ticket_count):
@@ -341,9 +342,13 @@ def get_fake_tickets():
                 'row': random.randint(1, 10),
                 'column': random.randint(1, 10),
                 'purchase': purchase_id,
+                'projection': purchase['projection']
             }
 
-            tickets.append(ticket)
+            seat = (ticket['projection'], ticket['row'], ticket['column'])
+            if seat not in sold_seats:
+                sold_seats.add(seat)
+                tickets.append(ticket)
 
     return tickets
 
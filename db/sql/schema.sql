@@ -133,7 +133,8 @@ CREATE TABLE "Purchase" (
                                        ON DELETE RESTRICT,
         FOREIGN KEY("paymentMethod") REFERENCES "PaymentMethod" (id)
                                        ON UPDATE CASCADE
-                                       ON DELETE RESTRICT
+                                       ON DELETE RESTRICT,
+        UNIQUE (id, projection)         -- referenziata da Ticket (purchase, projection)
 );
 
 CREATE TABLE "Ticket" (
@@ -144,9 +145,15 @@ CREATE TABLE "Ticket" (
         "column" INTEGER NOT NULL
                          CONSTRAINT positive_column
                          CHECK ("column" > 0),
-        purchase INTEGER NOT NULL,
+        purchase   INTEGER NOT NULL,
+        projection INTEGER NOT NULL,    -- copia di Purchase.projection, garantita dalla FK composta
         PRIMARY KEY (id),
         FOREIGN KEY(purchase) REFERENCES "Purchase" (id)
                                 ON UPDATE CASCADE
-                                ON DELETE RESTRICT
+                                ON DELETE RESTRICT,
+        FOREIGN KEY(purchase, projection) REFERENCES "Purchase" (id, projection)
+                                            ON UPDATE CASCADE
+                                            ON DELETE RESTRICT,
+        -- un posto può essere venduto una sola volta per proiezione
+        CONSTRAINT ticket_seat_unique UNIQUE (projection, row, "column")
 );
@@ -47,20 +47,8 @@ CREATE TRIGGER column_maximum_number
 END;
 
 -- verifica che la tripla (Ticket.row, Ticket.column, Ticket.Purchase.projection) sia unica
-CREATE TRIGGER tripleUnique
-  BEFORE INSERT OR UPDATE OF "row" ON "Ticket"
-  FOR EACH ROW
-  WHEN EXISTS (SELECT *
-              FROM Ticket, Purchase
-              WHERE Ticket.purchase==Purchase.id
-                  AND Ticket.row==:new.row
-                  AND Ticket.column==:new.column
-                  AND Purchase.projection==(SELECT projection
-                                            FROM Purchase
-                                            WHERE Purchase.id==:new.projection))
-  EXECUTE
-    RAISE_APPLICATION_ERROR( -20001, 'Triple (Ticket.row, Ticket.column, Ticket.Purchase.projection) must be unique' );
-END;
+-- non è più necessario un trigger: Ticket contiene la proiezione (coerente con Purchase grazie
+-- alla foreign key composta) e il vincolo ticket_seat_unique in schema.sql garantisce l'unicità
 
 -- verifica che data di registrazione sia al più nel presente
 CREATE TRIGGER purchase_datetime_in_past
@@ -2,3 +2,14 @@ import os
 
 
 SECRET_KEY = os.getenv("SECRET_KEY")
+
+# coda degli acquisti per proiezione (un acquisto alla volta per proiezione)
+BOOKING_QUEUE = os.getenv("BOOKING_QUEUE", "false").lower() in ('1', 'true', 'yes')
+BOOKING_QUEUE_TIMEOUT = float(os.getenv("BOOKING_QUEUE_TIMEOUT", 10))      # attesa massima in secondi
+
+# modalità di acquisto dei biglietti: read_committed, serializable oppure advisory_lock
+PURCHASE_MODE = os.getenv("PURCHASE_MODE", "read_committed")
+
+# sessioni: cookie (firmate nel cookie), sqlite (lato server, file SESSION_DB) oppure memory
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "cookie")
+SESSION_DB = os.getenv("SESSION_DB")                        # default: instance/sessions.sqlite3
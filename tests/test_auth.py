@@ -17,3 +17,50 @@ def test_logout(client):
     """Testa /auth/logout"""
 
     pass
+
+
+def test_insert_user_stmt():
+    """Testa che la registrazione rilevi i conflitti con un solo statement"""
+
+    from sqlalchemy.dialects import postgresql
+    from app.models.query import insert_user_stmt
+
+    sql = str(insert_user_stmt().compile(dialect=postgresql.dialect()))
+    assert 'ON CONFLICT DO NOTHING RETURNING "User".username' in sql
+
+
+class FakeResult(list):
+    def first(self):
+        return self[0] if self else None
+
+
+class FakeConn:
+    """Connessione fittizia: l'inserimento va a buon fine solo se non ci sono utenti in conflitto"""
+
+    def __init__(self, users):
+        self.users = users
+        self.statements = 0
+
+    def execute(self, stmt, **params):
+        self.statements += 1
+        clashing = [ { 'username': username } for username, email in self.users
+                     if username == params['username'] or email == params['email'] ]
+        if self.statements == 1:                # INSERT ... RETURNING
+            return FakeResult([] if clashing else [ { 'username': params['username'] } ])
+        return FakeResult(clashing)             # SELECT dei conflitti
+
+
+@pytest.mark.parametrize(('username', 'email', 'conflict', 'statements'), (
+    ('new', 'new@b.com', None, 1),
+    ('a', 'new@b.com', 'username', 2),
+    ('new', 'a@b.com', 'email', 2),
+    ('a', 'b@b.com', 'username', 2),
+))
+def test_insert_user(username, email, conflict, statements):
+    """Testa il campo in conflitto restituito da insert_user"""
+
+    from app.models.query import insert_user
+
+    conn = FakeConn([ ('a', 'a@b.com'), ('b', 'b@b.com') ])
+    assert insert_user(conn, username=username, email=email) == conflict
+    assert conn.statements == statements
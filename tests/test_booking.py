@@ -0,0 +1,110 @@
+import threading
+
+import pytest
+from sqlalchemy.exc import OperationalError, IntegrityError
+
+from app.models.booking import ContentionStats, is_retryable, backoff_delay
+from app.models.booking import BookingExecutor, BookingRejected, connect_for_purchase
+
+
+class FakePgError(Exception):
+    """Eccezione psycopg2 con il solo SQLSTATE"""
+
+    def __init__(self, pgcode):
+        super().__init__(pgcode)
+        self.pgcode = pgcode
+
+
+def test_is_retryable():
+    """Test classificazione degli errori del database"""
+
+    assert is_retryable(OperationalError('stmt', {}, FakePgError('40001')))
+    assert is_retryable(OperationalError('stmt', {}, FakePgError('40P01')))
+    assert not is_retryable(IntegrityError('stmt', {}, FakePgError('23505')))
+    assert not is_retryable(OperationalError('stmt', {}, Exception('connection lost')))
+    assert not is_retryable(ValueError('not a db error'))
+
+
+def test_backoff_delay():
+    """Test backoff esponenziale limitato"""
+
+    assert backoff_delay(0, base=0.1, cap=1, rand=lambda: 1) == 0.1
+    assert backoff_delay(2, base=0.1, cap=1, rand=lambda: 1) == 0.4
+    assert backoff_delay(10, base=0.1, cap=1, rand=lambda: 1) == 1
+    assert backoff_delay(3, base=0.1, cap=1, rand=lambda: 0) == 0
+
+
+def test_contention_stats():
+    """Test metriche di contesa per proiezione"""
+
+    stats = ContentionStats(maxsize=2)
+    stats.record(1, 'serializable', attempts=3, retryable_aborts=2, retry_time=0.5)
+    stats.record(1, 'serializable', purchases=1, purchase_time=0.75)
+    stats.record(2, 'advisory_lock', attempts=1, aborts=1)
+
+    assert stats.get(1) == {
+        'attempts': 3, 'retryable_aborts': 2, 'aborts': 0, 'purchases': 1, 'retry_time': 0.5, 'purchase_time': 0.75
+    }
+    summary = stats.stats(top=1)
+    assert summary['totals']['attempts'] == 4
+    assert summary['modes']['serializable']['retryable_aborts'] == 2
+    assert summary['modes']['advisory_lock']['aborts'] == 1
+    assert list(summary['projections']) == [1]          # la proiezione più contesa
+
+    stats.record(3, attempts=1)                         # supera maxsize: elimina la meno recente
+    assert stats.get(1)['attempts'] == 0
+    assert stats.get(2)['attempts'] == 1
+
+
+def test_booking_executor_serializes_per_key():
+    """Test coda per proiezione: un task alla volta per chiave, chiavi diverse in parallelo"""
+
+    executor = BookingExecutor(maxsize=2)
+    started = threading.Event()
+    release = threading.Event()
+
+    def blocking():
+        started.set()
+        release.wait(5)
+        return 'first'
+
+    first = executor.submit(1, blocking)
+    assert started.wait(5)
+    second = executor.submit(1, lambda: 'second')
+    assert executor.depth(1) == 1                               # in attesa dietro al primo
+
+    assert executor.execute(2, lambda: 'other', timeout=5) == 'other'     # altra proiezione: non attende
+
+    executor.submit(1, lambda: 'third')
+    with pytest.raises(BookingRejected):                        # coda piena
+        executor.submit(1, lambda: 'fourth')
+
+    release.set()
+    assert first.result(5) == 'first'
+    assert second.result(5) == 'second'
+    stats = executor.stats()
+    assert stats['rejected'] == 1
+
+
+def test_booking_executor_timeout():
+    """Test annullamento dei task in coda quando l'attesa scade"""
+
+    executor = BookingExecutor()
+    release = threading.Event()
+    executor.submit(1, release.wait, 5)
+
+    calls = []
+    with pytest.raises(BookingRejected):
+        executor.execute(1, calls.append, 'late', timeout=0.05)
+    release.set()
+
+    assert executor.execute(1, lambda: 'done', timeout=5) == 'done'
+    assert calls == []                                          # il task annullato non è stato eseguito
+    assert executor.stats()['timeouts'] == 1
+
+
+def test_connect_for_purchase_invalid_mode():
+    """Test validazione della modalità di acquisto"""
+
+    with pytest.raises(ValueError):
+        connect_for_purchase('optimistic')
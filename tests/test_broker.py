@@ -0,0 +1,50 @@
+import pytest
+
+from app.utils.broker import Broker, BrokerFull
+
+
+def test_publish_subscribe():
+    """Test consegna di un evento a tutti i sottoscrittori del topic"""
+
+    broker = Broker()
+    first = broker.subscribe(1)
+    second = broker.subscribe(1)
+    other = broker.subscribe(2)
+
+    assert broker.publish(1, 'sold') == 2
+    assert first.get(timeout=0) == 'sold'
+    assert second.get(timeout=0) == 'sold'
+    assert other.get(timeout=0) is None
+
+    broker.unsubscribe(first)
+    assert broker.publish(1, 'again') == 1
+    assert broker.stats()['subscribers'] == 2
+
+
+def test_slow_subscriber_is_dropped():
+    """Test sottoscrittore lento: coda piena, sottoscrizione chiusa"""
+
+    broker = Broker(maxsize=1)
+    subscription = broker.subscribe(1)
+    broker.publish(1, 'first')
+    assert broker.publish(1, 'second') == 0
+
+    assert subscription.overflowed
+    assert broker.stats()['dropped'] == 1
+    assert broker.stats()['subscribers'] == 0
+
+
+def test_max_subscribers():
+    """Test limite di sottoscrittori: oltre il massimo la sottoscrizione è rifiutata"""
+
+    broker = Broker(max_subscribers=2)
+    first = broker.subscribe(1)
+    broker.subscribe(2)
+    with pytest.raises(BrokerFull):
+        broker.subscribe(1)
+
+    broker.unsubscribe(first)
+    broker.unsubscribe(first)                       # già eliminata: nessun effetto
+    broker.subscribe(1)
+    assert broker.stats()['subscribers'] == 2
+    assert broker.stats()['rejected'] == 1
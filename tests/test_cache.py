@@ -0,0 +1,46 @@
+from app.utils.cache import TTLCache
+
+
+class FakeClock:
+    """Orologio controllabile manualmente per testare le scadenze"""
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def test_ttl():
+    """Test scadenza delle voci della cache"""
+
+    clock = FakeClock()
+    cache = TTLCache(maxsize=10, ttl=5, clock=clock)
+    cache.set('a', 1)
+    assert cache.get('a') == 1
+    clock.now = 6
+    assert cache.get('a') is None
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+
+
+def test_lru():
+    """Test limite di dimensione con rimpiazzamento LRU"""
+
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')                      # 'b' diventa la voce meno recente
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert len(cache) == 2
+
+
+def test_invalidate():
+    """Test invalidazione esplicita"""
+
+    cache = TTLCache()
+    cache.set('a', 1)
+    cache.invalidate('a')
+    assert cache.get('a') is None
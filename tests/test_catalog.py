@@ -0,0 +1,157 @@
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy.dialects import postgresql
+
+from app.models.catalog import Catalog, CatalogCache, MovieDetailsCache, select_movie_projections
+
+
+MOVIES = [
+    {
+        'id': 1, 'title': 'The Godfather', 'plot': '', 'genre': 'Drama', 'poster': '1.jpg',
+        'nation': 'USA', 'director': 'Francis Coppola', 'actors': ['Al Pacino', 'Marlon Brando'],
+        'year': 1972, 'dates': ['2020-06-01'], 'rooms': ['A']
+    },
+    {
+        'id': 2, 'title': 'Star Wars', 'plot': '', 'genre': 'Sci-Fi', 'poster': '2.jpg',
+        'nation': 'USA', 'director': 'George Lucas', 'actors': ['Mark Hamill'],
+        'year': 1977, 'dates': ['2020-06-01', '2020-06-02'], 'rooms': ['A', 'B']
+    },
+    {
+        'id': 3, 'title': 'The Godfather Part II', 'plot': '', 'genre': 'Drama', 'poster': '3.jpg',
+        'nation': 'USA', 'director': 'Francis Coppola', 'actors': ['Al Pacino', 'Robert De Niro'],
+        'year': 1974, 'dates': ['2020-06-02'], 'rooms': ['B']
+    }
+]
+
+
+def ids(movies):
+    return [ movie['id'] for movie in movies ]
+
+
+def test_catalog_filter():
+    """Test filtri per faccetta e titolo in memoria"""
+
+    catalog = Catalog(MOVIES)
+    assert catalog.version == Catalog(list(MOVIES)).version     # stesso contenuto, stesso ETag
+    assert catalog.version != Catalog(MOVIES[:2]).version
+    movies, counts = catalog.filter()
+    assert movies == MOVIES
+    assert counts['genre'] == { 'Drama': 2, 'Sci-Fi': 1 }
+    assert counts['actor']['Al Pacino'] == 2
+
+    assert ids(catalog.filter(filters={ 'genre': ['Sci-Fi'] })[0]) == [2]
+    assert ids(catalog.filter(search='godfahter')[0]) == [1, 3]
+    assert catalog.filter(filters={ 'genre': ['Sci-Fi'] }, search='godfather')[0] == []
+    assert ids(catalog.filter(years=(1973, None))[0]) == [2, 3]
+    assert ids(catalog.filter(filters={ 'date': ['2020-06-02'], 'room': ['A', 'B'] })[0]) == [2, 3]
+
+
+def test_catalog_facet_counts():
+    """Test conteggi disgiuntivi: ogni faccetta è contata con i filtri delle altre"""
+
+    catalog = Catalog(MOVIES)
+    movies, counts = catalog.filter(filters={ 'genre': ['Drama'], 'room': ['B'] })
+    assert ids(movies) == [3]
+    assert counts['genre'] == { 'Drama': 1, 'Sci-Fi': 1 }          # solo filtro sulla sala
+    assert counts['room'] == { 'A': 1, 'B': 1 }                     # solo filtro sul genere
+    assert counts['director'] == { 'Francis Coppola': 1, 'George Lucas': 0 }
+
+
+def test_catalog_cache_expiry():
+    """Test scadenza del catalogo all'inizio della prossima proiezione"""
+
+    now = [ datetime(2020, 6, 1, 20, 0) ]
+    loads = []
+
+    def loader():
+        loads.append(now[0])
+        return Catalog(MOVIES, expires_at=datetime(2020, 6, 1, 21, 0))
+
+    cache = CatalogCache(ttl=3600 * 24, loader=loader, now=lambda: now[0])
+    catalog = cache.get()
+    assert cache.get() is catalog
+    assert len(loads) == 1
+
+    now[0] += timedelta(hours=1)                            # inizia la prossima proiezione
+    cache.get()
+    assert len(loads) == 2
+
+    cache.invalidate()                                      # modifica dalla dashboard
+    cache.get()
+    assert len(loads) == 3
+    assert cache.stats()['hits'] == 1
+
+
+def test_catalog_cache_ttl():
+    """Test scadenza del catalogo per TTL"""
+
+    now = [ datetime(2020, 6, 1, 20, 0) ]
+    cache = CatalogCache(ttl=60, loader=lambda: Catalog(MOVIES), now=lambda: now[0])
+    catalog = cache.get()
+    now[0] += timedelta(seconds=30)
+    assert cache.get() is catalog
+    now[0] += timedelta(seconds=31)
+    assert cache.get() is not catalog
+
+
+def test_catalog_cache_single_flight():
+    """Test richieste concorrenti a catalogo scaduto: una sola lettura dal database"""
+
+    loads = []
+    started, release = threading.Event(), threading.Event()
+
+    def loader():
+        loads.append(1)
+        started.set()
+        release.wait(5)
+        return Catalog(MOVIES)
+
+    cache = CatalogCache(loader=loader)
+    results = []
+    threads = [ threading.Thread(target=lambda: results.append(cache.get())) for _ in range(8) ]
+    threads[0].start()
+    started.wait(5)                                         # la prima richiesta sta leggendo il catalogo
+    for thread in threads[1:]:
+        thread.start()
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(loads) == 1
+    assert all(catalog is results[0] for catalog in results)
+    assert cache.stats()['misses'] == 1 and cache.stats()['hits'] == 7
+
+
+def test_movie_details_cache():
+    """Test cache dei dettagli dei film: versione della riga e invalidazione"""
+
+    loads = []
+
+    def loader(conn, movie_id):
+        loads.append(movie_id)
+        return { 'movie': { 'id': movie_id }, 'actors': [] } if movie_id != 404 else None
+
+    cache = MovieDetailsCache(ttl=60, loader=loader)
+    assert cache.get(None, 1, '100')['movie']['id'] == 1
+    assert cache.get(None, 1, '100')['movie']['id'] == 1
+    assert loads == [1]
+
+    cache.get(None, 1, '101')                   # riga del film modificata: riletto
+    assert loads == [1, 1]
+
+    cache.invalidate()                          # modifica al cast dalla dashboard: riletto
+    cache.get(None, 1, '101')
+    assert loads == [1, 1, 1]
+
+    assert cache.get(None, 404, '1') is None    # film inesistente: non messo in cache
+    assert cache.get(None, 404, '1') is None
+    assert loads == [1, 1, 1, 404, 404]
+
+
+def test_select_movie_projections():
+    """Test query unica di proiezioni e versione del film"""
+
+    sql = str(select_movie_projections().compile(dialect=postgresql.dialect()))
+    assert '"Movie".xmin::text AS version' in sql
+    assert 'LEFT OUTER JOIN "Projection"' in sql
@@ -0,0 +1,54 @@
+from datetime import datetime
+
+import pytest
+
+from app.models.checkout import make_checkout_token, load_checkout_token, CheckoutExpired, InvalidCheckout
+
+
+CHECKOUT = {
+    'proj_id': 7,
+    'user': 'alice',
+    'title': 'Metropolis',
+    'datetime': datetime(2030, 1, 1, 21, 30),
+    'price': 7.5,
+    'seats': [ { 'row': 1, 'column': 5 }, { 'row': 1, 'column': 6 } ],
+    'payment_circuits': ['Visa', 'Mastercard']
+}
+
+
+def test_checkout_token(app):
+    """Test token di checkout: i dati firmati tornano identici, senza accedere al database"""
+
+    with app.test_request_context():
+        checkout = load_checkout_token(make_checkout_token(CHECKOUT), 'alice')
+        assert checkout == dict(CHECKOUT, payment_method_id=None)
+
+        checkout['payment_method_id'] = 3               # metodo di pagamento scelto
+        assert load_checkout_token(make_checkout_token(checkout), 'alice')['payment_method_id'] == 3
+
+
+def test_checkout_token_invalid(app):
+    """Test token di checkout alterato, di un altro utente, mancante o scaduto"""
+
+    with app.test_request_context():
+        token = make_checkout_token(CHECKOUT)
+        payload, signature = token.rsplit('.', 1)
+        for invalid in (payload + '.' + signature[::-1], None, ''):
+            with pytest.raises(InvalidCheckout):
+                load_checkout_token(invalid, 'alice')
+        with pytest.raises(InvalidCheckout):
+            load_checkout_token(token, 'bob')
+
+        with pytest.raises(CheckoutExpired) as e:
+            load_checkout_token(token, 'alice', max_age=-1)
+        assert e.value.proj_id == 7
+
+
+def test_checkout_token_other_key(app):
+    """Test token firmato con un'altra chiave"""
+
+    with app.test_request_context():
+        token = make_checkout_token(CHECKOUT)
+        app.secret_key = 'another key'
+        with pytest.raises(InvalidCheckout):
+            load_checkout_token(token, 'alice')
@@ -0,0 +1,47 @@
+from app.models.db import Role, get_pool_stats, role_engines
+from app.models.db import get_request_stats, request_checkout_count, RequestConnection
+
+
+def test_role_engines():
+    """Test un pool di connessioni per ogni ruolo"""
+
+    assert set(role_engines) == set(Role)
+    assert len({ id(engine.pool) for engine in role_engines.values() }) == len(Role)
+
+
+def test_pool_stats():
+    """Test statistiche dei pool esposte per ogni ruolo"""
+
+    stats = get_pool_stats()
+    assert set(stats) == { role.name for role in Role }
+    for pool_stats in stats.values():
+        assert pool_stats['size'] > 0
+        assert pool_stats['checked_out'] >= 0
+
+
+def test_request_stats(app):
+    """Test contatori dei checkout per richiesta"""
+
+    before = get_request_stats()['requests']
+    with app.app_context():
+        assert request_checkout_count() == 0
+    assert get_request_stats()['requests'] == before + 1
+
+
+def test_request_connection():
+    """Test connessione della richiesta: close() e with non la chiudono, il resto è delegato"""
+
+    class Connection:
+        closed = False
+
+        def execute(self, stmt):
+            return stmt
+
+        def close(self):
+            self.closed = True
+
+    conn = Connection()
+    with RequestConnection(conn) as request_conn:
+        assert request_conn.execute('SELECT 1') == 'SELECT 1'
+        request_conn.close()
+    assert not conn.closed
@@ -17,6 +17,45 @@ def test_index(client, app):
     assert response.status_code == 200
 
 
+@pytest.mark.parametrize('path', (
+    '/',
+    '/about',
+))
+def test_conditional_get(client, path):
+    """Test ETag / Last-Modified sulle pagine pubbliche"""
+
+    response = client.get(path)
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+    last_modified = response.headers['Last-Modified']
+    assert 'public' in response.headers['Cache-Control']
+    assert 'Cookie' in response.headers['Vary']
+
+    # versione corrente: 304 senza corpo
+    response = client.get(path, headers={ 'If-None-Match': etag })
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response.headers['ETag'] == etag
+
+    response = client.get(path, headers={ 'If-Modified-Since': last_modified })
+    assert response.status_code == 304
+
+    # versione diversa: pagina completa
+    response = client.get(path, headers={ 'If-None-Match': '"stale"' })
+    assert response.status_code == 200
+
+
+def test_conditional_get_flashes(client):
+    """Test pagine con messaggi flash in sospeso: mai 304"""
+
+    etag = client.get('/').headers['ETag']
+    with client.session_transaction() as session:
+        session['_flashes'] = [('info', 'hello')]
+    response = client.get('/', headers={ 'If-None-Match': etag })
+    assert response.status_code == 200
+    assert b'hello' in response.data
+
+
 def test_movies(client, app):
     """Test /movies route"""
 
@@ -0,0 +1,66 @@
+import threading
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+from app.models.passwords import PasswordHasher, HashingBusy, method_prefix
+
+
+METHOD = 'pbkdf2:sha256:1000'       # costo basso per i test
+
+
+def test_hash_and_check_inline():
+    """Test hashing e verifica nel thread chiamante"""
+
+    hasher = PasswordHasher(workers=0, method=METHOD)
+    pwhash = hasher.hash('secret')
+    assert pwhash.startswith(METHOD + '$')
+    assert hasher.check(pwhash, 'secret')
+    assert not hasher.check(pwhash, 'wrong')
+    assert hasher.stats()['completed'] == 3
+
+
+def test_hash_and_check_pool():
+    """Test hashing e verifica nel pool di processi"""
+
+    hasher = PasswordHasher(workers=1, method=METHOD)
+    try:
+        pwhash = hasher.hash('secret')
+        assert hasher.check(pwhash, 'secret')
+        assert not hasher.check(pwhash, 'wrong')
+    finally:
+        hasher.shutdown()
+    assert hasher.stats()['pending'] == 0
+
+
+def test_needs_rehash():
+    """Test riconoscimento degli hash con metodo o costo obsoleto"""
+
+    hasher = PasswordHasher(workers=0, method=METHOD)
+    assert not hasher.needs_rehash(generate_password_hash('secret', METHOD))
+    assert hasher.needs_rehash(generate_password_hash('secret', 'pbkdf2:sha256:500'))
+    assert hasher.needs_rehash(generate_password_hash('secret', 'pbkdf2:sha1:1000'))
+    assert method_prefix('pbkdf2:sha256') == generate_password_hash('', 'pbkdf2:sha256').split('$')[0]
+
+
+def test_reject_when_saturated():
+    """Test rifiuto immediato quando troppe operazioni sono in attesa"""
+
+    hasher = PasswordHasher(workers=0, max_pending=1, method=METHOD)
+    started, release = threading.Event(), threading.Event()
+
+    def slow(*args):
+        started.set()
+        release.wait(5)
+        return True
+
+    thread = threading.Thread(target=hasher._run, args=(slow,))
+    thread.start()
+    started.wait(5)
+    with pytest.raises(HashingBusy):
+        hasher.check('hash', 'secret')
+    release.set()
+    thread.join()
+
+    assert hasher.check(generate_password_hash('secret', METHOD), 'secret')
+    assert hasher.stats()['rejected'] == 1
@@ -0,0 +1,160 @@
+import io
+import os
+import threading
+
+import pytest
+
+Image = pytest.importorskip('PIL.Image')
+
+from app.models.posters import PosterStore, PosterUnavailable, poster_key, render_variant
+
+
+SOURCE = 'https://example.com/poster.jpg'
+
+
+@pytest.fixture
+def poster_bytes():
+    """Poster di test (JPEG 300x450) generato localmente"""
+
+    image = Image.new('RGB', (300, 450), (200, 30, 60))
+    output = io.BytesIO()
+    image.save(output, 'JPEG', quality=95)
+    return output.getvalue()
+
+
+def test_render_variant(poster_bytes):
+    """Test ridimensionamento e formato delle varianti"""
+
+    webp = render_variant(poster_bytes, 180, 'webp')
+    image = Image.open(io.BytesIO(webp))
+    assert image.format == 'WEBP'
+    assert image.size == (180, 270)
+    assert len(webp) < len(poster_bytes)
+
+    # mai ingrandita
+    image = Image.open(io.BytesIO(render_variant(poster_bytes, 360, 'jpg')))
+    assert image.format == 'JPEG'
+    assert image.size == (300, 450)
+
+
+def test_poster_store(tmp_path, poster_bytes):
+    """Test cache su disco: originale scaricato una sola volta, varianti generate una volta"""
+
+    fetched = []
+    release = threading.Event()
+
+    def fetch(source):
+        release.wait(5)
+        fetched.append(source)
+        return poster_bytes
+
+    store = PosterStore(workers=2, fetch=fetch)
+    results = []
+    threads = [ threading.Thread(target=lambda: results.append(store.get(str(tmp_path), SOURCE, 180, 'webp', 5)))
+                for _ in range(4) ]
+    for thread in threads:
+        thread.start()
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    path = os.path.join(str(tmp_path), f'{poster_key(SOURCE)}-180.webp')
+    assert results == [path] * 4                        # richieste concorrenti: una sola generazione
+    assert store.stats()['misses'] == 1
+
+    store.get(str(tmp_path), SOURCE, 360, 'jpg', 5)     # altra variante: originale già su disco
+    assert fetched == [SOURCE]
+    assert store.get(str(tmp_path), SOURCE, 180, 'webp') == path
+    assert store.stats()['hits'] == 1
+
+
+def test_poster_store_shared_download(tmp_path, poster_bytes):
+    """Test varianti diverse generate insieme: l'originale viene scaricato una sola volta"""
+
+    fetched = []
+    release = threading.Event()
+
+    def fetch(source):
+        release.wait(5)
+        fetched.append(source)
+        return poster_bytes
+
+    store = PosterStore(workers=4, fetch=fetch)
+    variants = [ (180, 'webp'), (180, 'jpg'), (360, 'webp'), (360, 'jpg') ]
+    threads = [ threading.Thread(target=store.get, args=(str(tmp_path), SOURCE, width, fmt, 5))
+                for width, fmt in variants ]
+    for thread in threads:
+        thread.start()
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert fetched == [SOURCE]
+    assert store.stats()['misses'] == 4 and store.stats()['fetches'] == 1
+
+
+def test_poster_store_failure(tmp_path):
+    """Test poster non valido: non viene riscaricato fino alla scadenza del fallimento"""
+
+    now = [0]
+    fetched = []
+
+    def fetch(source):
+        fetched.append(source)
+        return b'not an image'
+
+    store = PosterStore(workers=1, fetch=fetch, failure_ttl=60, clock=lambda: now[0])
+    with pytest.raises(Exception):
+        store.get(str(tmp_path), SOURCE, 180, 'webp', 5)
+    with pytest.raises(PosterUnavailable):                 # stessa chiave, altra variante: nessun nuovo tentativo
+        store.get(str(tmp_path), SOURCE, 360, 'jpg', 5)
+    assert len(fetched) == 1
+
+    now[0] = 61                                         # fallimento scaduto: nuovo tentativo
+    with pytest.raises(Exception) as e:
+        store.get(str(tmp_path), SOURCE, 180, 'webp', 5)
+    assert not isinstance(e.value, PosterUnavailable)
+    assert len(fetched) == 2                            # l'originale non valido non resta su disco
+    assert store.stats()['failures'] == 2 and store.stats()['skipped'] == 1
+
+
+def test_poster_store_refresh(tmp_path, poster_bytes):
+    """Test poster su disco più vecchio di 'refresh': originale riscaricato e variante rigenerata"""
+
+    fetched = []
+
+    def fetch(source):
+        fetched.append(source)
+        return poster_bytes
+
+    store = PosterStore(workers=1, fetch=fetch, refresh=3600)
+    path = store.get(str(tmp_path), SOURCE, 180, 'webp', 5)
+    assert store.get(str(tmp_path), SOURCE, 180, 'webp', 5) == path
+    assert len(fetched) == 1
+
+    old = os.path.getmtime(path) - 7200                 # immagine modificata allo stesso url
+    for stale in (path, os.path.join(str(tmp_path), 'originals', poster_key(SOURCE))):
+        os.utime(stale, (old, old))
+    assert not store.is_fresh(path)
+    assert store.get(str(tmp_path), SOURCE, 180, 'webp', 5) == path
+    assert len(fetched) == 2 and store.is_fresh(path)
+
+
+def test_poster_route(app, client, tmp_path, poster_bytes):
+    """Test route /posters: variante su disco servita con cache nel browser e riconvalida"""
+
+    app.config['POSTER_DIR'] = str(tmp_path)
+    key = poster_key(SOURCE)
+    with open(os.path.join(str(tmp_path), f'{key}-180.webp'), 'wb') as f:
+        f.write(render_variant(poster_bytes, 180, 'webp'))
+
+    response = client.get(f'/posters/1/{key}/180.webp')
+    assert response.status_code == 200
+    assert response.mimetype == 'image/webp'
+    assert response.headers['Cache-Control'].startswith('public, max-age=')
+    assert 'immutable' not in response.headers['Cache-Control']
+    assert response.headers['ETag']                                         # riconvalida alla scadenza
+
+    assert client.get(f'/posters/1/{key}/181.webp').status_code == 404     # larghezza non servita
+    assert client.get(f'/posters/1/{key}/180.png').status_code == 404      # formato non servito
+    assert client.get('/posters/1/..%2Fx/180.webp').status_code == 404     # chiave non valida
@@ -0,0 +1,75 @@
+from app.utils.ratelimit import TokenBucketLimiter, SQLiteTokenBucketLimiter
+from app.views import auth
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket():
+    """Test consumo e ricarica dei token"""
+
+    clock = FakeClock()
+    limiter = TokenBucketLimiter(rate=1, burst=3, clock=clock)
+    assert [ limiter.allow('a')[0] for _ in range(4) ] == [True, True, True, False]
+    assert limiter.allow('a')[1] == 1           # un token ricaricato ogni secondo
+    assert limiter.allow('b')[0]                # bucket indipendenti per chiave
+
+    clock.now += 2
+    assert [ limiter.allow('a')[0] for _ in range(3) ] == [True, True, False]
+
+    limiter.reset('a')
+    assert limiter.allow('a')[0]
+    assert limiter.stats()['throttled'] == 3
+
+
+def test_token_bucket_lru():
+    """Test memoria limitata: le chiavi meno recenti vengono eliminate"""
+
+    limiter = TokenBucketLimiter(rate=1, burst=1, maxsize=2, clock=FakeClock())
+    limiter.allow('a')
+    limiter.allow('b')
+    limiter.allow('a')
+    limiter.allow('c')                          # elimina 'b'
+    assert limiter.stats()['keys'] == 2
+    assert not limiter.allow('a')[0]
+    assert limiter.allow('b')[0]
+
+
+def test_sqlite_token_bucket(tmp_path):
+    """Test backend condiviso: due istanze (come due processi) vedono gli stessi bucket"""
+
+    clock = FakeClock()
+    path = str(tmp_path / 'ratelimit.sqlite3')
+    first = SQLiteTokenBucketLimiter(path, 'login', rate=1, burst=2, clock=clock)
+    second = SQLiteTokenBucketLimiter(path, 'login', rate=1, burst=2, clock=clock)
+    other = SQLiteTokenBucketLimiter(path, 'other', rate=1, burst=2, clock=clock)
+
+    assert first.allow('a')[0]
+    assert second.allow('a')[0]
+    assert first.allow('a') == (False, 1)
+    assert other.allow('a')[0]                  # limiter diversi nello stesso file
+
+    clock.now += 1
+    assert second.allow('a')[0]
+    second.reset('a')
+    assert first.allow('a')[0]
+
+
+def test_login_throttled(client, monkeypatch):
+    """Test /auth/login: tentativi oltre il limite rifiutati con 429 prima di accedere al database"""
+
+    monkeypatch.setattr(auth, 'login_ip_limiter', TokenBucketLimiter(rate=0.001, burst=2))
+
+    for _ in range(2):                          # password mancante: nessun accesso al database
+        response = client.post('/auth/login', data={ 'email': 'a@b.com', 'password': '' })
+        assert response.status_code == 200
+
+    response = client.post('/auth/login', data={ 'email': 'a@b.com', 'password': 'x' })
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) > 0
+    assert b'Too many login attempts' in response.data
@@ -0,0 +1,49 @@
+from app.utils.search import TrigramIndex, trigrams
+
+
+def test_trigrams():
+    """Test estrazione dei trigrammi (come pg_trgm)"""
+
+    assert trigrams('Cat') == { '  c', ' ca', 'cat', 'at ' }
+    assert trigrams('') == set()
+
+
+def test_trigram_index_search():
+    """Test ricerca per sottostringa, somiglianza e ordinamento"""
+
+    index = TrigramIndex([
+        (1, 'The Godfather'),
+        (2, 'The Godfather Part II'),
+        (3, 'Star Wars'),
+        (4, 'Pulp Fiction')
+    ])
+
+    assert index.search('godfather') == [1, 2]                  # a parità di punteggio, il titolo più corto
+    assert index.search('odfat') == [1, 2]                      # sottostringa (come ILIKE '%...%')
+    assert index.search('godfahter') == [1, 2]                  # errore di battitura
+    assert index.search('star', limit=1) == [3]
+    assert index.search('matrix') == []
+
+    index.remove(1)
+    assert index.search('godfather') == [2]
+    index.add(3, 'Star Trek')
+    assert index.search('wars') == []
+    assert len(index) == 3
+
+
+def test_trigram_index_short_query():
+    """Test query di 1-2 caratteri e sottostringhe a metà parola (come ILIKE '%...%')"""
+
+    index = TrigramIndex([
+        (1, 'The Matrix'),
+        (2, 'It'),
+        (3, 'Up'),
+        (4, 'Spirited Away')
+    ])
+
+    assert index.search('x') == [1]
+    assert index.search('ri') == [1, 4]
+    assert index.search('it') == [2, 4]                         # prima la parola intera
+    assert index.search('atri') == [1]
+    assert index.search('e m') == [1]                           # anche a cavallo di due parole
+    assert index.search('  ') == []
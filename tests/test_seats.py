@@ -0,0 +1,136 @@
+import base64
+from datetime import datetime
+
+import pytest
+
+from app.models.seats import SeatMap, SeatMapCache, find_best_seats
+from app.models.holds import SeatHolds
+
+
+def test_seat_map():
+    """Test bitset dei posti"""
+
+    seat_map = SeatMap(35, 20)
+    seat_map.mark_sold([{ 'row': 1, 'column': 1 }, { 'row': 35, 'column': 20 }])
+    assert not seat_map.is_free(1, 1)
+    assert not seat_map.is_free(35, 20)
+    assert seat_map.is_free(1, 2)
+    assert seat_map.sold_count() == 2
+
+    matrix = seat_map.to_matrix()
+    assert len(matrix) == 35 and len(matrix[0]) == 20
+    assert matrix[0][0] is False and matrix[0][1] is True
+
+    assert seat_map.is_valid(35, 20)
+    assert not seat_map.is_valid(0, 5) and not seat_map.is_valid(99, 1) and not seat_map.is_valid(1, 21)
+    with pytest.raises(ValueError):
+        seat_map.is_free(36, 1)
+
+
+def test_seat_map_cache():
+    """Test cache delle mappe: aggiornamento incrementale e invalidazione"""
+
+    loads = []
+
+    def loader(proj_id):
+        loads.append(proj_id)
+        return SeatMap(10, 10, datetime.now())
+
+    cache = SeatMapCache(maxsize=10, ttl=60, loader=loader)
+    seat_map = cache.get(1)
+    assert cache.get(1) is seat_map
+    assert loads == [1]
+
+    cache.mark_sold(1, [{ 'row': 2, 'column': 3 }])         # aggiornamento in place
+    assert not cache.get(1).is_free(2, 3)
+    assert loads == [1]
+
+    cache.invalidate(1)                                     # versione non più valida
+    assert cache.get(1).is_free(2, 3)
+    assert loads == [1, 1]
+
+
+def test_seat_map_cache_concurrent_sale():
+    """Test ricostruzione che non vede un acquisto concorrente: non viene messa in cache"""
+
+    cache = None
+    loads = []
+
+    def loader(proj_id):
+        loads.append(proj_id)
+        if len(loads) == 1:                                 # acquisto completato durante la ricostruzione
+            cache.mark_sold(proj_id, [{ 'row': 1, 'column': 1 }])
+        return SeatMap(10, 10, datetime.now())
+
+    cache = SeatMapCache(maxsize=10, ttl=60, loader=loader)
+    cache.get(1)
+    cache.get(1)
+    assert loads == [1, 1]
+    assert cache.get(1) is cache.get(1) and loads == [1, 1]
+    assert cache._loading == {}                             # nessuno stato per le proiezioni non in ricostruzione
+
+
+def test_seat_holds():
+    """Test hold temporanei sui posti: conflitti, rinnovo e scadenza"""
+
+    now = [0]
+    holds = SeatHolds(ttl=10, clock=lambda: now[0])
+    seats = [{ 'row': 1, 'column': 1 }, { 'row': 1, 'column': 2 }]
+
+    assert holds.acquire(1, seats, 'alice') == []
+    assert holds.acquire(1, seats[1:], 'bob') == [{ 'row': 1, 'column': 2 }]
+    assert holds.acquire(1, seats, 'alice') == []                       # rinnovo
+    assert holds.held_bits(1, 10) == 0b11
+    assert holds.held_bits(1, 10, exclude_holder='alice') == 0
+
+    now[0] = 11                                                         # hold scaduti
+    assert holds.acquire(1, seats[1:], 'bob') == []
+    assert holds.stats()['seats'] == 1
+
+    holds.release(1, 'bob')
+    assert holds.stats()['seats'] == 0
+
+
+def test_seat_map_pack():
+    """Test codifica compatta della mappa dei posti"""
+
+    seat_map = SeatMap(2, 5)
+    seat_map.mark_sold([{ 'row': 1, 'column': 1 }, { 'row': 2, 'column': 5 }])
+    data = base64.b64decode(seat_map.pack(unavailable=1 << 2))     # posto (1, 3) riservato
+
+    assert len(data) == 2                                           # 10 posti -> 2 byte
+    assert data[0] == 0b00000101                                    # posti (1, 1) e (1, 3)
+    assert data[1] == 0b00000010                                    # posto (2, 5), bit 9
+
+
+def test_free_runs():
+    """Test indice delle sequenze di posti liberi per riga"""
+
+    seat_map = SeatMap(2, 6)
+    seat_map.mark_sold([{ 'row': 1, 'column': 3 }, { 'row': 1, 'column': 4 }, { 'row': 2, 'column': 6 }])
+    assert seat_map.free_runs() == [[(1, 2), (5, 2)], [(1, 5)]]
+    assert seat_map.free_runs(unavailable=1 << 6) == [[(1, 2), (5, 2)], [(2, 4)]]
+
+
+def test_find_best_seats():
+    """Test ricerca del miglior blocco di posti consecutivi"""
+
+    seat_map = SeatMap(11, 20)                                      # riga preferita: 1 + 0.6 * 10 = 7
+    best = find_best_seats(seat_map, 4, row_ratio=0.6)
+    assert best == [ { 'row': 7, 'column': column } for column in range(9, 13) ]     # centro della riga 7
+
+    # centro della riga preferita occupato: meglio una riga adiacente che un blocco laterale
+    seat_map.mark_sold([ { 'row': 7, 'column': column } for column in range(8, 14) ])
+    best = find_best_seats(seat_map, 4, row_ratio=0.6)
+    assert best == [ { 'row': 6, 'column': column } for column in range(9, 13) ]
+
+    # con peso della riga alto si resta sulla riga preferita, accanto al blocco occupato
+    # (a parità di punteggio vince il blocco trovato per primo, a sinistra)
+    best = find_best_seats(seat_map, 4, row_ratio=0.6, row_weight=10)
+    assert best == [ { 'row': 7, 'column': column } for column in range(4, 8) ]
+
+    # nessun blocco abbastanza grande
+    assert find_best_seats(SeatMap(1, 3), 4) == []
+    full = SeatMap(2, 2)
+    full.mark_sold([ { 'row': r, 'column': c } for r in (1, 2) for c in (1, 2) ])
+    assert find_best_seats(full, 1) == []
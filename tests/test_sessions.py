@@ -0,0 +1,142 @@
+import os
+
+import pytest
+from flask import session
+
+from app import create_app
+from app.utils.sessions import SQLiteSessionStore, MemorySessionStore
+
+
+@pytest.fixture(params=['sqlite', 'memory'])
+def session_app(request, tmp_path):
+    """Flask app con sessioni lato server"""
+
+    app = create_app({
+        'TESTING': True,
+        'SECRET_KEY': os.getenv('SECRET_KEY'),
+        'SESSION_BACKEND': request.param,
+        'SESSION_DB': str(tmp_path / 'sessions.sqlite3')
+    })
+
+    @app.route('/_session/set/<value>')
+    def set_value(value):
+        session['value'] = value
+        return 'ok'
+
+    @app.route('/_session/get')
+    def get_value():
+        return session.get('value', '')
+
+    @app.route('/_session/clear')
+    def clear():
+        session.clear()
+        return 'ok'
+
+    return app
+
+
+def test_server_session(session_app):
+    """Test cookie con id opaco e dati memorizzati lato server"""
+
+    client = session_app.test_client()
+    response = client.get('/_session/set/' + 'x' * 500)
+    cookie = response.headers['Set-Cookie']
+    assert 'x' * 500 not in cookie and len(cookie) < 150        # il cookie contiene solo l'id
+    assert client.get('/_session/get').data == b'x' * 500
+
+    # richiesta senza modifiche: nessun nuovo cookie
+    assert 'Set-Cookie' not in client.get('/_session/get').headers
+
+    # id sconosciuto: sessione nuova e vuota
+    client.set_cookie('localhost', session_app.session_cookie_name, 'forged')
+    assert client.get('/_session/get').data == b''
+
+
+def test_server_session_clear(session_app):
+    """Test sessione svuotata: eliminata dallo store e dal browser"""
+
+    client = session_app.test_client()
+    client.get('/_session/set/a')
+    sid = client.cookie_jar._cookies['localhost.local']['/'][session_app.session_cookie_name].value
+    assert session_app.session_interface.store.load(sid) is not None
+
+    client.get('/_session/clear')
+    assert session_app.session_interface.store.load(sid) is None
+    assert client.get('/_session/get').data == b''
+
+
+@pytest.mark.parametrize('store_class', (SQLiteSessionStore, MemorySessionStore))
+def test_session_store_expiry(tmp_path, store_class):
+    """Test scadenza e pulizia delle sessioni"""
+
+    now = [1000.0]
+    if store_class is SQLiteSessionStore:
+        store = SQLiteSessionStore(str(tmp_path / 'sessions.sqlite3'), sweep_interval=3600, clock=lambda: now[0])
+    else:
+        store = MemorySessionStore(clock=lambda: now[0])
+
+    store.save('a', '{}', 1010)
+    store.save('b', '{}', 1100)
+    assert store.load('a') == ('{}', 1010)
+
+    now[0] = 1050
+    assert store.load('a') is None                  # scaduta
+    assert store.load('b') is not None
+    store.sweep()
+    assert store.stats()['sessions'] == 1
+
+
+def test_memory_session_store_sweep():
+    """Test pulizia delle sessioni scadute in memoria durante i salvataggi"""
+
+    now = [1000.0]
+    store = MemorySessionStore(sweep_interval=60, clock=lambda: now[0])
+    store.save('a', '{}', 1010)
+
+    now[0] = 1030
+    store.save('b', '{}', 1100)                     # pulizia non ancora dovuta
+    assert store.stats()['sessions'] == 2
+
+    now[0] = 1060
+    store.save('c', '{}', 1100)
+    assert store.stats() == { 'backend': 'memory', 'sessions': 2, 'swept': 1 }
+
+
+class FakeConnection:
+    """Connessione che restituisce l'hash della password per qualsiasi email"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, stmt, **params):
+        return self
+
+    def first(self):
+        return { 'password': 'hash' }
+
+
+def test_login_regenerates_session(session_app, monkeypatch):
+    """Test nuovo id di sessione al login: l'id precedente non è più valido"""
+
+    from app.views import auth
+    from app.models.db import User
+
+    monkeypatch.setattr(auth, 'connect_as', lambda role: FakeConnection())
+    monkeypatch.setattr(auth, 'user_by_email', lambda email: User('alice', email, 'Alice', 'A', False))
+    monkeypatch.setattr(auth.password_hasher, 'check', lambda pwhash, password: True)
+    monkeypatch.setattr(auth.password_hasher, 'needs_rehash', lambda pwhash: False)
+
+    client = session_app.test_client()
+    client.get('/_session/set/a')
+    cookies = client.cookie_jar._cookies['localhost.local']['/']
+    sid = cookies[session_app.session_cookie_name].value
+
+    response = client.post('/auth/login', data={ 'email': 'alice@example.com', 'password': 'secret' })
+    assert response.status_code == 302
+    new_sid = cookies[session_app.session_cookie_name].value
+    assert new_sid != sid
+    assert session_app.session_interface.store.load(sid) is None
+    assert client.get('/_session/get').data == b'a'             # i dati seguono il nuovo id